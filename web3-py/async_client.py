@@ -0,0 +1,136 @@
+import os
+import asyncio
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from web3.providers.rpc import AsyncHTTPProvider
+from web3.middleware import ExtraDataToPOAMiddleware
+from eth_account import Account
+from dab_client import get_account
+from batch_reader import DiamondRecord, DIAMOND_VIEW_FUNCTIONS
+from gas_strategy import get_gas_strategy
+from nonce_manager import RECEIPT_TIMEOUT, RECEIPT_POLL_INTERVAL
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+SEPOLIA_RPC_URL = os.getenv("SEPOLIA_RPC_URL")
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "32"))
+ASYNC_POOL_SIZE = int(os.getenv("ASYNC_POOL_SIZE", "64"))
+
+
+async def async_connect_to_web3(rpc_url=None, pool_size=ASYNC_POOL_SIZE):
+    """Creates an AsyncWeb3 connection backed by one pooled aiohttp session."""
+    rpc_url = rpc_url or SEPOLIA_RPC_URL
+    if not rpc_url:
+        raise ValueError("SEPOLIA_RPC_URL not found in environment variables.")
+
+    provider = AsyncHTTPProvider(rpc_url)
+    # Every request from this client shares the same keep-alive connection pool
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+    await provider.cache_async_session(session)
+
+    w3 = AsyncWeb3(provider)
+    w3.middleware_onion.inject(ExtraDataToPOAMiddleware(), layer=0)
+
+    if not await w3.is_connected():
+        await provider.disconnect()
+        raise ConnectionError(f"Failed to connect to Sepolia RPC: {rpc_url}")
+    print(f"Successfully connected to Sepolia (async). Chain ID: {await w3.eth.chain_id}")
+
+    return w3
+
+
+def async_load_contract(w3, address, abi):
+    """Loads an async contract instance."""
+    return w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+
+
+async def async_read_diamond(contract, diamond_id):
+    """Reads the three per-diamond view functions concurrently, returns a DiamondRecord or None."""
+    try:
+        basic_info, cert_info, owner = await asyncio.gather(*(
+            contract.functions[fn_name](diamond_id).call() for fn_name in DIAMOND_VIEW_FUNCTIONS
+        ))
+    except Exception:
+        return None
+    return DiamondRecord(diamond_id, *basic_info, *cert_info, owner)
+
+
+async def async_read_diamonds(contract, diamond_ids, concurrency=ASYNC_MAX_CONCURRENCY):
+    """Reads many diamonds with at most `concurrency` diamonds in flight.
+
+    Returns (diamond_id, DiamondRecord or None) pairs in input order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(diamond_id):
+        async with semaphore:
+            return diamond_id, await async_read_diamond(contract, diamond_id)
+
+    return await asyncio.gather(*(read(diamond_id) for diamond_id in diamond_ids))
+
+
+class AsyncTransactionSender:
+    """Signs and sends transactions for one account from many coroutines.
+
+    Nonces are allocated locally and sends happen under an asyncio lock, so
+    concurrent lifecycles sharing an account never collide or reach the node
+    out of nonce order. Receipt waits run outside the lock.
+    """
+
+    def __init__(self, w3, private_key, chain_id):
+        self.w3 = w3
+        self.private_key = private_key
+        self.chain_id = chain_id
+        self.address = get_account(private_key).address
+        self.gas = get_gas_strategy(w3)
+        self._lock = asyncio.Lock()
+        self._next_nonce = None
+        # Optional callable invoked with every collected receipt (used for load-test metrics)
+        self.on_receipt = None
+
+    async def _resync_nonce(self):
+        self._next_nonce = await self.w3.eth.get_transaction_count(self.address, "pending")
+
+    async def build_transaction(self, contract_function, nonce):
+        """Builds the transaction parameters for a contract call."""
+        tx_params = {
+            'from': self.address,
+            'nonce': nonce,
+            'chainId': self.chain_id,
+            **await self.gas.gas_params(contract_function, self.address)
+        }
+        return await contract_function.build_transaction(tx_params)
+
+    async def send(self, contract_function):
+        """Sends a transaction and returns its hash without waiting for the receipt."""
+        async with self._lock:
+            if self._next_nonce is None:
+                await self._resync_nonce()
+            try:
+                transaction = await self.build_transaction(contract_function, self._next_nonce)
+                signed_tx = Account.sign_transaction(transaction, self.private_key)
+                tx_hash = await self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            except Exception:
+                # The nonce may not have been consumed; let the node tell us where we are
+                await self._resync_nonce()
+                raise
+            self._next_nonce += 1
+            return tx_hash
+
+    async def send_and_wait(self, contract_function):
+        """Sends a transaction and waits for its receipt. Returns None if it reverted."""
+        tx_hash = await self.send(contract_function)
+        receipt = await self.w3.eth.wait_for_transaction_receipt(
+            tx_hash, timeout=RECEIPT_TIMEOUT, poll_latency=RECEIPT_POLL_INTERVAL
+        )
+        if self.on_receipt is not None:
+            self.on_receipt(receipt)
+        return receipt if receipt.status == 1 else None
+
+
+async def async_disconnect(w3):
+    """Closes the pooled session of an async connection."""
+    await w3.provider.disconnect()
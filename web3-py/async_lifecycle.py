@@ -0,0 +1,139 @@
+import os
+import time
+import random
+import asyncio
+from dab_client import PROVENANCE_CONTRACT_ADDRESS, ENTITY_CONTRACT_ADDRESS, SEPOLIA_CHAIN_ID, get_contract_abi
+from diamond_lifecycle import (
+    ORIGINS, MINER_PRIVATE_KEY, MANUFACTURER_PRIVATE_KEY, CERTIFIER_PRIVATE_KEY, RETAILER_PRIVATE_KEY,
+    get_random_lot_number, get_random_raw_weight, get_random_processed_weight,
+    get_random_raw_characteristics, get_random_processed_characteristics
+)
+from async_client import async_connect_to_web3, async_load_contract, AsyncTransactionSender, async_disconnect
+from receipt_events import get_registered_diamond_id, get_processed_diamond_id
+from preflight import PREFLIGHT, async_require_roles
+
+# Configuration
+LIFECYCLE_COUNT = int(os.getenv("LIFECYCLE_COUNT", "1"))
+
+
+async def async_register_raw_diamond(contract, miner):
+    """Registers a raw diamond as the miner, returns the new diamond ID."""
+    lot_number = get_random_lot_number()
+    origin = f"{random.choice(ORIGINS)} #{lot_number}"
+    extraction_date = int(time.time()) - random.randint(86400 * 7, 86400 * 90)  # 7-90 days ago
+    weight = get_random_raw_weight()
+    characteristics = get_random_raw_characteristics(lot_number)
+
+    receipt = await miner.send_and_wait(
+        contract.functions.registerRawDiamond(origin, extraction_date, weight, characteristics)
+    )
+    if not receipt:
+        raise Exception("Failed to register raw diamond")
+    return get_registered_diamond_id(contract, receipt)
+
+
+async def async_transfer_diamond(contract, diamond_id, sender, to_address):
+    """Transfers a diamond from the sender's account to another entity."""
+    receipt = await sender.send_and_wait(contract.functions.transferDiamond(diamond_id, to_address))
+    if not receipt:
+        raise Exception(f"Failed to transfer diamond ID {diamond_id}")
+    return receipt
+
+
+async def async_process_diamond(contract, raw_diamond_id, manufacturer):
+    """Processes a raw diamond as the manufacturer, returns the processed diamond ID."""
+    try:
+        basic_info = await contract.functions.getDiamondBasicInfo(raw_diamond_id).call()
+        raw_weight = basic_info[2]  # weight is at index 2
+    except Exception:
+        raw_weight = 150
+
+    receipt = await manufacturer.send_and_wait(contract.functions.processDiamond(
+        raw_diamond_id, get_random_processed_weight(raw_weight), get_random_processed_characteristics(raw_diamond_id)
+    ))
+    if not receipt:
+        raise Exception("Failed to process diamond")
+    return get_processed_diamond_id(contract, receipt, raw_diamond_id)
+
+
+async def async_certify_diamond(contract, diamond_id, certifier):
+    """Certifies a diamond as the certifier, returns the certification ID."""
+    random_suffix = ''.join(random.choices('ABCDEFGHJKLMNPQRSTUVWXYZ23456789', k=6))
+    certification_id = f"GIA-{diamond_id}-{int(time.time())}-{random_suffix}"
+
+    receipt = await certifier.send_and_wait(contract.functions.certifyDiamond(diamond_id, certification_id))
+    if not receipt:
+        raise Exception(f"Failed to certify diamond ID {diamond_id}")
+    return certification_id
+
+
+async def _run_step(step_name, step_coroutine):
+    """Default step runner for async_run_lifecycle(): awaits the step as is."""
+    return await step_coroutine
+
+
+async def async_run_lifecycle(contract, senders, retailer_address, label="", step=_run_step):
+    """Runs one diamond through register -> transfer -> process -> transfer -> certify -> transfer.
+
+    Every step coroutine is awaited through `step(step_name, coroutine)`, which
+    lets callers wrap steps with timing or tracing.
+    """
+    miner, manufacturer, certifier = senders
+    raw_diamond_id = await step("register", async_register_raw_diamond(contract, miner))
+    print(f"{label}Raw diamond registered! ID: {raw_diamond_id}")
+    await step("transfer_to_manufacturer",
+               async_transfer_diamond(contract, raw_diamond_id, miner, manufacturer.address))
+    processed_diamond_id = await step("process", async_process_diamond(contract, raw_diamond_id, manufacturer))
+    print(f"{label}Diamond processed! New processed diamond ID: {processed_diamond_id}")
+    await step("transfer_to_certifier",
+               async_transfer_diamond(contract, processed_diamond_id, manufacturer, certifier.address))
+    certification_id = await step("certify", async_certify_diamond(contract, processed_diamond_id, certifier))
+    print(f"{label}Diamond ID {processed_diamond_id} certified: {certification_id}")
+    await step("transfer_to_retailer",
+               async_transfer_diamond(contract, processed_diamond_id, certifier, retailer_address))
+    return raw_diamond_id, processed_diamond_id
+
+
+async def async_main(count=LIFECYCLE_COUNT):
+    """Runs `count` independent diamond lifecycles concurrently in one event loop."""
+    w3 = await async_connect_to_web3()
+    try:
+        contract = async_load_contract(w3, PROVENANCE_CONTRACT_ADDRESS, get_contract_abi())
+        senders = tuple(
+            AsyncTransactionSender(w3, private_key, SEPOLIA_CHAIN_ID)
+            for private_key in (MINER_PRIVATE_KEY, MANUFACTURER_PRIVATE_KEY, CERTIFIER_PRIVATE_KEY)
+        )
+        retailer_address = AsyncTransactionSender(w3, RETAILER_PRIVATE_KEY, SEPOLIA_CHAIN_ID).address
+        if PREFLIGHT and ENTITY_CONTRACT_ADDRESS:
+            entity_contract = async_load_contract(w3, ENTITY_CONTRACT_ADDRESS, get_contract_abi("ENTITY_CONTRACT_ABI"))
+            await async_require_roles(entity_contract, {
+                senders[0].address: "Miner", senders[1].address: "Manufacturer",
+                senders[2].address: "Certifier", retailer_address: "Retailer",
+            })
+
+        start = time.time()
+        results = await asyncio.gather(*(
+            async_run_lifecycle(contract, senders, retailer_address, f"[{i + 1}/{count}] ")
+            for i in range(count)
+        ), return_exceptions=True)
+        elapsed = time.time() - start
+
+        print(f"\n=== {count} DIAMOND LIFECYCLES FINISHED IN {elapsed:.1f}s ===")
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"[{i + 1}] Failed: {result}")
+            else:
+                print(f"[{i + 1}] Raw Diamond ID: {result[0]}  Processed Diamond ID: {result[1]}")
+    finally:
+        await async_disconnect(w3)
+
+
+def main():
+    """Main function to execute several diamond lifecycles concurrently."""
+    try:
+        asyncio.run(async_main())
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
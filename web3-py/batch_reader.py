@@ -0,0 +1,188 @@
+import os
+from typing import NamedTuple
+from web3 import Web3
+from web3.exceptions import Web3TypeError, ContractLogicError
+from eth_utils.abi import get_abi_output_types
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+# READ_MODE is one of "batch" (JSON-RPC batch requests), "multicall" (Multicall3
+# aggregate3 inside a single eth_call) or "sequential" (one eth_call per view call)
+READ_MODE = os.getenv("READ_MODE", "batch")
+READ_CHUNK_SIZE = int(os.getenv("READ_CHUNK_SIZE", "100"))
+MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+
+# Only the aggregate3 entry point of Multicall3 is needed
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+# A reverted view call; eth-tester raises its own exception instead of ContractLogicError
+try:
+    from eth_tester.exceptions import TransactionFailed
+    CALL_REVERTED_ERRORS = (ContractLogicError, TransactionFailed)
+except ImportError:
+    CALL_REVERTED_ERRORS = (ContractLogicError,)
+
+DIAMOND_VIEW_FUNCTIONS = ("getDiamondBasicInfo", "getDiamondCertInfo", "getDiamondOwnershipInfo")
+
+
+class DiamondRecord(NamedTuple):
+    """Combined result of the three per-diamond view functions."""
+    diamond_id: int
+    origin: str
+    extraction_date: int
+    weight: int
+    characteristics: str
+    is_certified: bool
+    certification_id: str
+    raw_diamond_id: int
+    owner: str
+
+
+class BatchReader:
+    """Groups contract view calls into one round trip per chunk.
+
+    Calls are given as (contract, function_name, args) tuples. Reverted calls
+    (e.g. a getter for a missing diamond) come back as None instead of
+    failing the whole chunk. Transport errors (timeouts, rate limits, dropped
+    connections) are raised, never reported as None. `contract` is the
+    provenance contract used by read_diamonds.
+    """
+
+    def __init__(self, w3, contract=None, chunk_size=READ_CHUNK_SIZE, mode=READ_MODE, block_identifier="latest"):
+        if mode not in ("batch", "multicall", "sequential"):
+            raise ValueError(f"Unknown read mode: {mode}")
+        self.w3 = w3
+        self.contract = contract
+        self.chunk_size = max(1, chunk_size)
+        self.mode = mode
+        self.block_identifier = block_identifier
+        self.round_trips = 0
+        self._multicall = None
+
+    def call_many(self, calls, calls_per_chunk=None):
+        """Executes view calls in chunks and returns their results in order."""
+        calls = list(calls)
+        calls_per_chunk = calls_per_chunk or self.chunk_size
+        results = []
+        for start in range(0, len(calls), calls_per_chunk):
+            results.extend(self._call_chunk(calls[start:start + calls_per_chunk]))
+        return results
+
+    def read_diamonds(self, diamond_ids):
+        """Yields a DiamondRecord (or None if it does not exist) for each diamond ID.
+
+        Each chunk of chunk_size diamonds costs a single round trip.
+        """
+        diamond_ids = list(diamond_ids)
+        for start in range(0, len(diamond_ids), self.chunk_size):
+            chunk_ids = diamond_ids[start:start + self.chunk_size]
+            calls = [
+                (self.contract, fn_name, (diamond_id,))
+                for diamond_id in chunk_ids
+                for fn_name in DIAMOND_VIEW_FUNCTIONS
+            ]
+            results = self._call_chunk(calls)
+            for index, diamond_id in enumerate(chunk_ids):
+                basic_info, cert_info, owner = results[index * 3:index * 3 + 3]
+                if basic_info is None or cert_info is None or owner is None:
+                    yield diamond_id, None
+                else:
+                    yield diamond_id, DiamondRecord(diamond_id, *basic_info, *cert_info, owner)
+
+    def _call_chunk(self, calls):
+        if not calls:
+            return []
+        if self.mode == "batch":
+            try:
+                return self._call_chunk_batch(calls)
+            except Web3TypeError:
+                # Provider cannot batch (e.g. eth-tester); fall back for the rest of the run
+                print("JSON-RPC batching not supported by provider, falling back to sequential reads")
+                self.mode = "sequential"
+            except CALL_REVERTED_ERRORS:
+                # One reverted call fails the whole batch response, so isolate it
+                return self._call_chunk_sequential(calls)
+        if self.mode == "multicall":
+            return self._call_chunk_multicall(calls)
+        return self._call_chunk_sequential(calls)
+
+    def _call_chunk_batch(self, calls):
+        with self.w3.batch_requests() as batch:
+            for contract, fn_name, args in calls:
+                batch.add(contract.functions[fn_name](*args).call(block_identifier=self.block_identifier))
+            results = batch.execute()
+        self.round_trips += 1
+        return list(results)
+
+    def _call_chunk_multicall(self, calls):
+        if self._multicall is None:
+            self._multicall = self.w3.eth.contract(
+                address=Web3.to_checksum_address(MULTICALL3_ADDRESS), abi=MULTICALL3_ABI
+            )
+        encoded_calls = [
+            (contract.address, True, contract.encode_abi(fn_name, args=list(args)))
+            for contract, fn_name, args in calls
+        ]
+        responses = self._multicall.functions.aggregate3(encoded_calls).call(
+            block_identifier=self.block_identifier
+        )
+        self.round_trips += 1
+
+        results = []
+        for (contract, fn_name, args), (success, return_data) in zip(calls, responses):
+            if not success:
+                results.append(None)
+                continue
+            output_types = get_abi_output_types(contract.get_function_by_name(fn_name).abi)
+            decoded = self.w3.codec.decode(output_types, return_data)
+            # The codec returns lowercase addresses; .call() returns checksummed ones
+            decoded = [
+                Web3.to_checksum_address(value) if output_type == "address" else value
+                for output_type, value in zip(output_types, decoded)
+            ]
+            # Match the shape returned by .call(): bare value for single outputs
+            results.append(decoded[0] if len(output_types) == 1 else list(decoded))
+        return results
+
+    def _call_chunk_sequential(self, calls):
+        results = []
+        for contract, fn_name, args in calls:
+            try:
+                results.append(contract.functions[fn_name](*args).call(block_identifier=self.block_identifier))
+            except CALL_REVERTED_ERRORS:
+                results.append(None)
+            self.round_trips += 1
+        return results
+
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import argparse
+from eth_account import Account
+from latency_stats import summarize
+from local_chain import connect_eth_tester, setup_local_chain, send_local_tx
+from dab_client import get_account
+
+# Configuration
+# Resolved next to this module, like contract_abis.json
+CONTRACT_BENCH_BASELINE = os.getenv(
+    "CONTRACT_BENCH_BASELINE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "contract_bench_baseline.json")
+)
+
+# Number of diamonds, history records and active listings built up before measuring
+DEFAULT_SCALES = (1, 10, 50)
+# Gas is deterministic on eth-tester, so any real growth is a regression
+GAS_TOLERANCE = 0.02
+# Wall time is noisy: only flag a function that got more than 2x AND this many ms slower
+TIME_TOLERANCE = 1.0
+TIME_FLOOR_MS = 5.0
+VIEW_REPEATS = 5
+
+
+def timed_send(w3, private_key, contract_function):
+    """Sends a transaction, returns (receipt, seconds from send to mined receipt).
+
+    Gas is estimated beforehand so the timing covers only executing and
+    mining the transaction. The limit gets some headroom because eth-tester's
+    estimate is a binary search that can land just below the gas used.
+    """
+    address = get_account(private_key).address
+    transaction = contract_function.build_transaction({
+        'from': address,
+        'nonce': w3.eth.get_transaction_count(address, "pending"),
+        'gas': int(contract_function.estimate_gas({'from': address}) * 1.2),
+        'gasPrice': w3.eth.gas_price,
+        'chainId': w3.eth.chain_id
+    })
+    signed_tx = Account.sign_transaction(transaction, private_key)
+    start = time.perf_counter()
+    receipt = w3.eth.wait_for_transaction_receipt(w3.eth.send_raw_transaction(signed_tx.raw_transaction))
+    elapsed = time.perf_counter() - start
+    if receipt.status != 1:
+        raise Exception(f"{contract_function.fn_name} reverted")
+    return receipt, elapsed
+
+
+class ContractBench:
+    """Builds one eth-tester chain at a given scale and measures every public contract function on it.
+
+    At scale N the chain holds about N diamonds, one diamond with N history
+    records and N active marketplace listings, which are the inputs that
+    getActiveListings, _wasOwner and the history helpers iterate over.
+    """
+
+    def __init__(self, scale, view_repeats=VIEW_REPEATS):
+        self.scale = scale
+        self.view_repeats = view_repeats
+        self.results = {}
+        self.w3, self.keys = connect_eth_tester()
+        self.entity, self.provenance, self.marketplace = setup_local_chain(self.w3, self.keys)
+        self.deployer_key, self.miner_key, self.manufacturer_key, self.certifier_key, self.retailer_key = self.keys[:5]
+        self.consumer = get_account(self.keys[5]).address
+
+    def address(self, private_key):
+        return get_account(private_key).address
+
+    def write(self, name, private_key, contract_function):
+        """Measures one transaction. Returns its receipt."""
+        receipt, elapsed = timed_send(self.w3, private_key, contract_function)
+        self.results[name] = {"gas": receipt.gasUsed, "ms": round(elapsed * 1000, 3)}
+        return receipt
+
+    def view(self, name, contract_function, private_key=None):
+        """Measures a view call: gas used when sent as a transaction and the median of view_repeats eth_calls."""
+        private_key = private_key or self.deployer_key
+        # The receipt's gasUsed is exact, unlike estimate_gas
+        receipt, _ = timed_send(self.w3, private_key, contract_function)
+        transaction = {'from': self.address(private_key)}
+        samples = []
+        for _ in range(self.view_repeats):
+            start = time.perf_counter()
+            contract_function.call(transaction)
+            samples.append(time.perf_counter() - start)
+        self.results[name] = {"gas": receipt.gasUsed, "ms": round(summarize(samples)["p50"] * 1000, 3)}
+
+    def run(self):
+        """Builds the state for this scale and returns {function: {"gas", "ms"}}."""
+        provenance = self.provenance.functions
+        marketplace = self.marketplace.functions
+        miner, manufacturer, certifier, retailer = (
+            self.address(key) for key in (self.miner_key, self.manufacturer_key, self.certifier_key, self.retailer_key)
+        )
+
+        # Supply: N raw diamonds, then one measured registration
+        for number in range(self.scale):
+            send_local_tx(self.w3, self.miner_key, provenance.registerRawDiamond(
+                f"Bench Mine #{number}", 1700000000, 150, "bench rough diamond"
+            ))
+        raw_diamond_id = self.scale + 1
+        self.write("Provenance.registerRawDiamond", self.miner_key, provenance.registerRawDiamond(
+            "Bench Mine #measured", 1700000000, 150, "bench rough diamond"
+        ))
+
+        # History: diamond 1 goes back and forth between miner and manufacturer N times
+        owner_key, other_key = self.miner_key, self.manufacturer_key
+        for _ in range(self.scale):
+            send_local_tx(self.w3, owner_key, provenance.transferDiamond(1, self.address(other_key)))
+            owner_key, other_key = other_key, owner_key
+        self.write("Provenance.transferDiamond", owner_key, provenance.transferDiamond(1, self.address(other_key)))
+        owner_key = other_key
+        for name in ("getDiamondBasicInfo", "getDiamondCertInfo", "getDiamondOwnershipInfo", "getDiamondHistory"):
+            self.view(f"Provenance.{name}", getattr(provenance, name)(1))
+
+        # Lifecycle of the measured diamond, ending at the retailer
+        send_local_tx(self.w3, self.miner_key, provenance.transferDiamond(raw_diamond_id, manufacturer))
+        self.write("Provenance.processDiamond", self.manufacturer_key, provenance.processDiamond(
+            raw_diamond_id, 80, "bench round brilliant"
+        ))
+        diamond_id = raw_diamond_id + 1
+        send_local_tx(self.w3, self.manufacturer_key, provenance.transferDiamond(diamond_id, certifier))
+        self.write("Provenance.certifyDiamond", self.certifier_key, provenance.certifyDiamond(
+            diamond_id, "GIA-BENCH-000001"
+        ))
+        send_local_tx(self.w3, self.certifier_key, provenance.transferDiamond(diamond_id, retailer))
+
+        # Listings: N - 1 miner listings plus the retailer's one
+        for listed_diamond_id in range(2, self.scale + 1):
+            send_local_tx(self.w3, self.miner_key, marketplace.listDiamond(listed_diamond_id))
+        self.write("Marketplace.listDiamond", self.retailer_key, marketplace.listDiamond(diamond_id))
+        listing_id = self.scale
+        self.view("Marketplace.getActiveListings", marketplace.getActiveListings())
+        self.view("Marketplace.getListingDetails", marketplace.getListingDetails(listing_id))
+        self.view("Marketplace.getDiamondDetails", marketplace.getDiamondDetails(diamond_id))
+        self.write("Marketplace.cancelListing", self.retailer_key, marketplace.cancelListing(listing_id))
+        send_local_tx(self.w3, self.retailer_key, marketplace.listDiamond(diamond_id))
+        self.write("Marketplace.directCompleteSale", self.retailer_key, marketplace.directCompleteSale(
+            listing_id + 1, self.consumer
+        ))
+
+        # Stolen reports: the certifier only appears in the last record of diamond 1's long history
+        send_local_tx(self.w3, owner_key, provenance.transferDiamond(1, certifier))
+        send_local_tx(self.w3, self.certifier_key, provenance.transferDiamond(1, retailer))
+        self.write("Marketplace.reportStolenDiamond", self.certifier_key, marketplace.reportStolenDiamond(
+            1, "bench report"
+        ))
+        self.view("Marketplace.isDiamondStolen", marketplace.isDiamondStolen(1))
+        self.view("Marketplace.getStolenReports", marketplace.getStolenReports(1))
+        self.write("Marketplace.resolveReport", self.deployer_key, marketplace.resolveReport(1))
+
+        # Entities
+        self.write("EntityContract.registerEntity", self.keys[6], self.entity.functions.registerEntity(
+            "Bench Retailer", "Canada", "Retailer", "d-BENCH-RETAILER"
+        ))
+        self.view("EntityContract.getEntityInfo", self.entity.functions.getEntityInfo(miner))
+        self.view("EntityContract.validateTransfer", self.entity.functions.validateTransfer(miner, manufacturer))
+        return self.results
+
+
+def run_benchmarks(scales, view_repeats=VIEW_REPEATS):
+    """Runs ContractBench at every scale, returns {scale (as str): results}."""
+    results = {}
+    for scale in scales:
+        print(f"Measuring at scale {scale}...")
+        start = time.perf_counter()
+        results[str(scale)] = ContractBench(scale, view_repeats).run()
+        print(f"  done in {time.perf_counter() - start:.1f} s")
+    return results
+
+
+def compare_to_baseline(results, baseline, gas_tolerance=GAS_TOLERANCE,
+                        time_tolerance=TIME_TOLERANCE, check_time=True):
+    """Returns a list of regressions of `results` against a baseline document.
+
+    Functions or scales missing from the baseline are not compared.
+    """
+    regressions = []
+    for scale, functions in results.items():
+        baseline_functions = baseline.get("results", {}).get(scale, {})
+        for name, measured in functions.items():
+            expected = baseline_functions.get(name)
+            if expected is None:
+                continue
+            if measured["gas"] > expected["gas"] * (1 + gas_tolerance):
+                regressions.append(f"{name} @ {scale}: gas {expected['gas']} -> {measured['gas']}")
+            if check_time and measured["ms"] > expected["ms"] * (1 + time_tolerance) \
+                    and measured["ms"] - expected["ms"] > TIME_FLOOR_MS:
+                regressions.append(f"{name} @ {scale}: {expected['ms']:.2f} ms -> {measured['ms']:.2f} ms")
+    return regressions
+
+
+def format_results(results):
+    """Formats gas and wall time per function as a table with one column per scale."""
+    scales = list(results)
+    names = sorted({name for functions in results.values() for name in functions})
+    width = max(len(name) for name in names)
+    header = f"{'function':<{width}}" + "".join(f"  {'gas @ ' + scale:>14} {'ms':>8}" for scale in scales)
+    lines = [header, "-" * len(header)]
+    for name in names:
+        line = f"{name:<{width}}"
+        for scale in scales:
+            measured = results[scale].get(name)
+            line += f"  {measured['gas']:>14} {measured['ms']:>8.2f}" if measured else f"  {'-':>14} {'-':>8}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    """Benchmarks gas and wall time of the contracts as state grows, and fails on regressions against the baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark contract gas and wall time on eth-tester.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES),
+                        help="diamonds / history records / listings to build up before measuring")
+    parser.add_argument("--repeats", type=int, default=VIEW_REPEATS, help="eth_calls per view function")
+    parser.add_argument("--baseline", default=CONTRACT_BENCH_BASELINE, help="baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--gas-tolerance", type=float, default=GAS_TOLERANCE, help="allowed relative gas growth")
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE,
+                        help="allowed relative wall time growth")
+    parser.add_argument("--no-time", action="store_true", help="compare gas only (e.g. on a different machine)")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    try:
+        results = run_benchmarks(args.scales, args.repeats)
+        print()
+        print(format_results(results))
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({"scales": args.scales, "results": results}, f, indent=2)
+            print(f"\nResults written to {args.output}")
+
+        if args.update_baseline:
+            with open(args.baseline, 'w') as f:
+                json.dump({"scales": args.scales, "results": results}, f, indent=2)
+                f.write("\n")
+            print(f"\nBaseline written to {args.baseline}")
+            return
+
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+            return
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.gas_tolerance, args.time_tolerance,
+                                          check_time=not args.no_time)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        sys.exit(1)
+
+    if regressions:
+        print(f"\nFAIL: {len(regressions)} regressions against {args.baseline}")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nPASS: no regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
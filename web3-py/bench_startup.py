@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3 import Web3
+from eth_account import Account
+from latency_stats import summarize
+import dab_client
+
+# A throwaway key used only to time key derivation
+BENCH_PRIVATE_KEY = "0x" + "11" * 32
+BENCH_CONTRACT_ADDRESS = "0x" + "22" * 20
+
+
+class _ChainIdHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive JSON-RPC endpoint that answers every call with a chain ID."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        body = json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": hex(dab_client.SEPOLIA_CHAIN_ID)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def time_calls(fn, iterations):
+    """Runs fn `iterations` times, returns the per-call latency summary in seconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_contract_load(iterations):
+    w3 = Web3()
+
+    def per_invocation():
+        # What every script used to do: parse the ABI file and build the contract again
+        with open(dab_client.CONTRACT_ABIS_PATH, 'r') as f:
+            abi = json.load(f)['PROVENANCE_CONTRACT_ABI']
+        w3.eth.contract(address=Web3.to_checksum_address(BENCH_CONTRACT_ADDRESS), abi=abi)
+
+    return (time_calls(per_invocation, iterations),
+            time_calls(lambda: dab_client.get_contract(w3, BENCH_CONTRACT_ADDRESS), iterations))
+
+
+def bench_account(iterations):
+    return (time_calls(lambda: Account.from_key(BENCH_PRIVATE_KEY).address, iterations),
+            time_calls(lambda: dab_client.get_account_address(BENCH_PRIVATE_KEY), iterations))
+
+
+def bench_connection(iterations):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ChainIdHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    rpc_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        def new_connection():
+            # A fresh session has to open a new TCP (and on a real RPC, TLS) connection
+            with requests.Session() as session:
+                Web3(Web3.HTTPProvider(rpc_url, session=session)).eth.chain_id
+
+        shared_w3 = Web3(Web3.HTTPProvider(rpc_url, session=dab_client.get_http_session()))
+        return (time_calls(new_connection, iterations),
+                time_calls(lambda: shared_w3.eth.chain_id, iterations))
+    finally:
+        server.shutdown()
+
+
+def bench_import(module, runs):
+    """Wall time of a fresh interpreter importing `module` (the fixed cost of every cron run)."""
+    samples = []
+    env = dict(os.environ, SEPOLIA_RPC_URL=os.getenv("SEPOLIA_RPC_URL", "http://127.0.0.1:8545"))
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True, env=env,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    """Measures script startup and the per-invocation client overhead the shared client removes."""
+    parser = argparse.ArgumentParser(description="Benchmark startup and per-invocation client overhead.")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per per-invocation benchmark")
+    parser.add_argument("--import-runs", type=int, default=5, help="fresh interpreters per import benchmark")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    results = {"per_invocation": {}, "import_seconds": {}}
+    print(f"{'per-invocation cost':<28} {'before p50':>12} {'after p50':>12} {'speedup':>9}")
+    for name, bench in (("ABI load + contract", bench_contract_load),
+                        ("account derivation", bench_account),
+                        ("connect + first request", bench_connection)):
+        before, after = bench(args.iterations)
+        speedup = before["p50"] / after["p50"] if after["p50"] else float("inf")
+        results["per_invocation"][name] = {"before": before, "after": after, "speedup": speedup}
+        print(f"{name:<28} {before['p50'] * 1e6:>10.1f}us {after['p50'] * 1e6:>10.1f}us {speedup:>8.1f}x")
+
+    print(f"\n{'startup (fresh interpreter)':<28} {'p50':>12}")
+    for module in ("dab_client", "check_diamonds", "diamond_lifecycle"):
+        summary = bench_import(module, args.import_runs)
+        results["import_seconds"][module] = summary
+        print(f"import {module:<21} {summary['p50'] * 1000:>10.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
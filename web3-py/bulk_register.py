@@ -0,0 +1,273 @@
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import Future, wait
+from datetime import datetime, timezone
+from web3.exceptions import TransactionNotFound
+from dab_client import connect_to_web3, get_provenance_contract, SEPOLIA_CHAIN_ID
+from diamond_lifecycle import MINER_PRIVATE_KEY, preflight_check
+from nonce_manager import TransactionPipeline, MAX_IN_FLIGHT
+from latency_stats import summarize, format_summary
+from receipt_events import get_registered_diamond_id
+
+REQUIRED_FIELDS = ("origin", "extraction_date", "weight", "characteristics")
+
+
+def read_manifest(path, manifest_format=None):
+    """Streams (row_number, row) pairs from a CSV or JSONL intake manifest."""
+    manifest_format = manifest_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, 'r', newline='') as f:
+        if manifest_format == "csv":
+            for row_number, row in enumerate(csv.DictReader(f), start=1):
+                yield row_number, row
+        else:
+            for row_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield row_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield row_number, e
+
+
+def validate_row(row):
+    """Validates a manifest row and returns registerRawDiamond arguments.
+
+    extraction_date may be a unix timestamp or a YYYY-MM-DD date; weight is in
+    points (1 carat = 100 points). Raises ValueError on invalid rows.
+    """
+    if isinstance(row, Exception):
+        raise ValueError(f"Unreadable row: {row}")
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    missing = [field for field in REQUIRED_FIELDS if str(row.get(field) or "").strip() == ""]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+
+    origin = str(row["origin"]).strip()
+    characteristics = str(row["characteristics"]).strip()
+
+    extraction_date = str(row["extraction_date"]).strip()
+    if extraction_date.isdigit():
+        extraction_date = int(extraction_date)
+    else:
+        try:
+            parsed = datetime.strptime(extraction_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            raise ValueError(f"Invalid extraction_date: {extraction_date}")
+        extraction_date = int(parsed.timestamp())
+    if extraction_date > time.time():
+        raise ValueError("extraction_date is in the future")
+
+    try:
+        weight = int(str(row["weight"]).strip())
+    except ValueError:
+        raise ValueError(f"Invalid weight: {row['weight']}")
+    if weight <= 0:
+        raise ValueError("weight must be positive")
+
+    return origin, extraction_date, weight, characteristics
+
+
+class Checkpoint:
+    """Append-only JSONL record of which manifest rows were sent and confirmed.
+
+    A "sent" entry is written (and fsynced) before the transaction is
+    broadcast, so a crash can never leave a registration the next run does
+    not know about.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.sent = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash
+                        continue
+                    if entry["status"] == "sent":
+                        self.sent[entry["row"]] = entry["tx"]
+                    elif entry["status"] in ("done", "invalid"):
+                        self.done.add(entry["row"])
+                        self.sent.pop(entry["row"], None)
+                    else:
+                        self.sent.pop(entry["row"], None)
+        self._file = open(path, 'a')
+        if self._file.tell() > 0 and not _ends_with_newline(path):
+            # Start after a torn final line, or the next entry would be glued to it and lost
+            self._file.write("\n")
+            self._file.flush()
+
+    def record(self, row_number, status, sync=False, **fields):
+        """Appends an entry for a manifest row."""
+        with self._lock:
+            self._file.write(json.dumps({"row": row_number, "status": status, **fields}) + "\n")
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+            if status in ("done", "invalid"):
+                self.done.add(row_number)
+
+    def close(self):
+        self._file.close()
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def reconcile_sent(w3, contract, checkpoint):
+    """Resolves rows that were sent by a previous run but never confirmed.
+
+    Mined registrations are marked done; dropped or reverted ones are left to
+    be registered again.
+    """
+    for row_number, tx_hash in list(checkpoint.sent.items()):
+        try:
+            receipt = w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            try:
+                w3.eth.get_transaction(tx_hash)
+            except TransactionNotFound:
+                print(f"Row {row_number}: previous transaction {tx_hash} was never mined, will resend")
+                continue
+            # Still in the mempool; wait for it rather than registering twice
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+        if receipt.status == 1:
+            checkpoint.record(row_number, "done", tx=tx_hash,
+                              diamond_id=get_registered_diamond_id(contract, receipt))
+        else:
+            checkpoint.record(row_number, "failed", tx=tx_hash, error="reverted")
+    checkpoint.sent.clear()
+
+
+def run_ingestion(w3, contract, pipeline, manifest_path, checkpoint, manifest_format=None):
+    """Registers every valid, not yet registered manifest row and returns run statistics."""
+    stats = {"registered": 0, "failed": 0, "unconfirmed": 0, "invalid": 0, "skipped": 0}
+    latencies = []
+    stats_lock = threading.Lock()
+    # Resolved once a transaction's result is in the checkpoint, which is after its future is done
+    recorded_futures = []
+
+    def record_result(row_number, tx_hash, started_at, future):
+        latency = time.time() - started_at
+        try:
+            receipt = future.result()
+        except Exception as e:
+            # Timed out or dropped: the transaction may still be mined, so the row stays
+            # "sent" and reconcile_sent checks its hash on the next run
+            with stats_lock:
+                stats["unconfirmed"] += 1
+            print(f"Row {row_number}: registration unconfirmed ({e}), will be checked on restart")
+            return
+        if receipt.status != 1:
+            with stats_lock:
+                stats["failed"] += 1
+            print(f"Row {row_number}: registration failed: reverted")
+            checkpoint.record(row_number, "failed", tx=tx_hash, error="reverted")
+            return
+        with stats_lock:
+            stats["registered"] += 1
+            latencies.append(latency)
+        try:
+            diamond_id = get_registered_diamond_id(contract, receipt)
+        except Exception as e:
+            # Exceptions raised in a Future callback are otherwise swallowed
+            print(f"Row {row_number}: could not read the registered diamond ID: {e}")
+            diamond_id = None
+        checkpoint.record(row_number, "done", tx=tx_hash, diamond_id=diamond_id)
+
+    def on_receipt(row_number, tx_hash, started_at, recorded):
+        def callback(future):
+            try:
+                record_result(row_number, tx_hash, started_at, future)
+            finally:
+                recorded.set_result(None)
+        return callback
+
+    for row_number, row in read_manifest(manifest_path, manifest_format):
+        if row_number in checkpoint.done:
+            stats["skipped"] += 1
+            continue
+        try:
+            args = validate_row(row)
+        except ValueError as e:
+            print(f"Row {row_number}: invalid: {e}")
+            checkpoint.record(row_number, "invalid", error=str(e))
+            stats["invalid"] += 1
+            continue
+
+        started_at = time.time()
+        register_function = contract.functions.registerRawDiamond(*args)
+        # Only the miner role is checked, so a PreflightError applies to every row and ends the run
+        preflight_check(w3, register_function, pipeline.private_key)
+        signed_tx, nonce = pipeline.sign(register_function)
+        tx_hash = signed_tx.hash.to_0x_hex()
+        checkpoint.record(row_number, "sent", sync=True, tx=tx_hash, nonce=nonce)
+        try:
+            pending_tx = pipeline.submit(register_function, f"row {row_number}", signed=(signed_tx, nonce))
+        except Exception as e:
+            # The node may have accepted it before the error, so leave the row "sent" for reconcile_sent
+            print(f"Row {row_number}: send failed ({e}), will be checked on restart")
+            with stats_lock:
+                stats["unconfirmed"] += 1
+            continue
+        recorded = Future()
+        pending_tx.future.add_done_callback(on_receipt(row_number, tx_hash, started_at, recorded))
+        recorded_futures.append(recorded)
+        # Keep only unrecorded transactions so memory stays bounded by max_in_flight
+        if len(recorded_futures) > 2 * pipeline.max_in_flight:
+            recorded_futures = [future for future in recorded_futures if not future.done()]
+
+    # Not just the receipts: the checkpoint must not be closed before every callback has run
+    wait(recorded_futures)
+    return stats, latencies
+
+
+def main():
+    """Streams an intake manifest and registers its raw diamonds as the miner."""
+    parser = argparse.ArgumentParser(description="Bulk-register raw diamonds from a CSV/JSONL manifest.")
+    parser.add_argument("manifest", help="CSV or JSONL file with origin, extraction_date, weight, characteristics")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="manifest format (default: from extension)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <manifest>.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=MAX_IN_FLIGHT, help="max transactions in flight")
+    args = parser.parse_args()
+
+    try:
+        w3 = connect_to_web3()
+        contract = get_provenance_contract(w3)
+        pipeline = TransactionPipeline(w3, MINER_PRIVATE_KEY, SEPOLIA_CHAIN_ID, max_in_flight=args.concurrency)
+        print(f"Miner Address: {pipeline.address}")
+
+        checkpoint = Checkpoint(args.checkpoint or f"{args.manifest}.checkpoint")
+        print(f"Resuming with {len(checkpoint.done)} rows already processed")
+        reconcile_sent(w3, contract, checkpoint)
+
+        start = time.time()
+        stats, latencies = run_ingestion(w3, contract, pipeline, args.manifest, checkpoint, args.format)
+        elapsed = time.time() - start
+        checkpoint.close()
+
+        processed = stats["registered"] + stats["failed"] + stats["unconfirmed"] + stats["invalid"]
+        print("\n=== BULK REGISTRATION SUMMARY ===")
+        print(f"Registered: {stats['registered']}  Failed: {stats['failed']}  "
+              f"Unconfirmed (rechecked on restart): {stats['unconfirmed']}  "
+              f"Invalid: {stats['invalid']}  Skipped (checkpoint): {stats['skipped']}")
+        print(f"Elapsed: {elapsed:.1f}s  Throughput: {processed / elapsed if elapsed else 0:.2f} rows/sec")
+        print(f"End-to-end latency: {format_summary(summarize(latencies))}")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
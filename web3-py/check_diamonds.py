@@ -1,96 +1,212 @@
 import os
+import sys
 import time
-import json
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from eth_account import Account
+import argparse
+import asyncio
 from dotenv import load_dotenv
+from dab_client import (
+    PROVENANCE_CONTRACT_ADDRESS, MARKETPLACE_CONTRACT_ADDRESS, connect_to_web3, get_account_address,
+    get_contract_abi, get_provenance_contract, get_marketplace_contract
+)
+from batch_reader import BatchReader
+from provenance_index import ProvenanceIndex, PROVENANCE_INDEX_PATH
+from async_client import async_connect_to_web3, async_load_contract, async_read_diamonds, async_disconnect
+from rpc_metrics import RPC_METRICS_REPORT, instrument
+from snapshot import SNAPSHOT_DIR, take_snapshot, write_snapshot, load_snapshot, diff_snapshots, print_diff
+from event_stream import WATCH_CURSOR_PATH, watch_events
 
 # Load environment variables
 load_dotenv()
 
-# Configuration
-SEPOLIA_RPC_URL = os.getenv("SEPOLIA_RPC_URL")
-PROVENANCE_CONTRACT_ADDRESS = os.getenv("PROVENANCE_CONTRACT_ADDRESS")
-SEPOLIA_CHAIN_ID = 11155111
-
 # Entity credentials from .env
 MINER_PRIVATE_KEY = os.getenv("MINER_PRIVATE_KEY")
 MANUFACTURER_PRIVATE_KEY = os.getenv("MANUFACTURER_PRIVATE_KEY")
 CERTIFIER_PRIVATE_KEY = os.getenv("CERTIFIER_PRIVATE_KEY")
 
-# Load contract ABIs from JSON file
-try:
-    with open('contract_abis.json', 'r') as f:
-        contract_abis = json.load(f)
-    PROVENANCE_CONTRACT_ABI = contract_abis['PROVENANCE_CONTRACT_ABI']
-except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-    print(f"Error loading ABI from JSON file: {e}")
-    exit(1)
-
-def connect_to_web3():
-    """Creates a Web3 connection to Sepolia."""
-    if not SEPOLIA_RPC_URL:
-        raise ValueError("SEPOLIA_RPC_URL not found in environment variables.")
-        
-    w3 = Web3(Web3.HTTPProvider(SEPOLIA_RPC_URL))
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware(), layer=0)
-    
-    if not w3.is_connected():
-        raise ConnectionError(f"Failed to connect to Sepolia RPC: {SEPOLIA_RPC_URL}")
-    print(f"Successfully connected to Sepolia. Chain ID: {w3.eth.chain_id}")
-    
-    return w3
-
-def get_account_address(private_key):
-    """Gets the account address from a private key."""
-    account = Account.from_key(private_key)
-    return account.address
-
-def load_contract(w3, address, abi):
-    """Loads a contract instance."""
-    return w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+def print_diamond_record(record):
+    """Prints a DiamondRecord returned by the batch reader."""
+    print(f"\n=== DIAMOND ID {record.diamond_id} INFORMATION ===")
+    print(f"Origin: {record.origin}")
+    print(f"Extraction Date: {time.strftime('%Y-%m-%d', time.localtime(record.extraction_date))}")
+    print(f"Weight: {record.weight/100} carats")
+    print(f"Characteristics: {record.characteristics}")
+    print(f"Current Owner: {record.owner}")
+    print(f"Is Certified: {'Yes' if record.is_certified else 'No'}")
+    if record.is_certified:
+        print(f"Certification ID: {record.certification_id}")
+    if record.raw_diamond_id > 0:
+        print(f"Processed from Raw Diamond ID: {record.raw_diamond_id}")
 
 def display_diamond_info(contract, diamond_id):
     """Displays comprehensive information about a diamond."""
+    reader = BatchReader(contract.w3, contract)
+    for _, record in reader.read_diamonds([diamond_id]):
+        if record is None:
+            print("Error or diamond doesn't exist")
+            return False
+        print_diamond_record(record)
+    return True
+
+def print_indexed_diamond(index, row):
+    """Prints a diamond row from the local provenance index."""
+    print(f"\n=== DIAMOND ID {row['diamond_id']} (indexed) ===")
+    print(f"Origin: {row['origin']}")
+    if row['weight'] is not None:
+        print(f"Weight: {row['weight']/100} carats")
+    print(f"Current Owner: {row['owner']}")
+    print(f"Is Certified: {'Yes' if row['is_certified'] else 'No'}")
+    if row['is_certified']:
+        print(f"Certification ID: {row['certification_id']}")
+    if row['raw_diamond_id'] > 0:
+        print(f"Processed from Raw Diamond ID: {row['raw_diamond_id']}")
+    print(f"History records: {len(index.get_history(row['diamond_id']))}")
+
+def query_index(args):
+    """Answers owner/origin/certification/lineage questions from the local index."""
+    index = ProvenanceIndex(args.index)
+    if args.sync:
+        w3 = connect_to_web3()
+        contract = get_provenance_contract(w3)
+        index = ProvenanceIndex(args.index, w3, contract)
+        print(f"Indexed {index.sync()} new events, cursor at block {index.get_cursor()[0]}")
+
+    start = time.perf_counter()
+    if args.owner:
+        rows = index.diamonds_by_owner(args.owner)
+    elif args.origin:
+        rows = index.diamonds_by_origin(args.origin)
+    elif args.cert:
+        row = index.diamond_by_certification(args.cert)
+        rows = [row] if row else []
+    elif args.from_raw:
+        rows = index.processed_from(args.from_raw)
+    else:
+        rows = []
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    for row in rows:
+        print_indexed_diamond(index, row)
+    if args.owner or args.origin or args.cert or args.from_raw:
+        print(f"\n{len(rows)} diamonds found in {elapsed_ms:.2f} ms")
+    index.close()
+
+def snapshot_registry(args):
+    """Writes a block-pinned snapshot, incrementally from the latest one, and prints what changed."""
     try:
-        # Get basic info
-        basic_info = contract.functions.getDiamondBasicInfo(diamond_id).call()
-        origin, extraction_date, weight, characteristics = basic_info
-        
-        # Get certification info
-        cert_info = contract.functions.getDiamondCertInfo(diamond_id).call()
-        is_certified, certification_id, raw_diamond_id = cert_info
-        
-        # Get ownership info
-        current_owner = contract.functions.getDiamondOwnershipInfo(diamond_id).call()
-        
-        # Display information
-        print(f"\n=== DIAMOND ID {diamond_id} INFORMATION ===")
-        print(f"Origin: {origin}")
-        print(f"Extraction Date: {time.strftime('%Y-%m-%d', time.localtime(extraction_date))}")
-        print(f"Weight: {weight/100} carats")
-        print(f"Characteristics: {characteristics}")
-        print(f"Current Owner: {current_owner}")
-        print(f"Is Certified: {'Yes' if is_certified else 'No'}")
-        if is_certified:
-            print(f"Certification ID: {certification_id}")
-        if raw_diamond_id > 0:
-            print(f"Processed from Raw Diamond ID: {raw_diamond_id}")
-            
-        return True
-    except Exception as e:
-        print(f"Error or diamond doesn't exist: {e}")
-        return False
+        base = load_snapshot("latest", args.snapshot_dir)
+    except FileNotFoundError:
+        base = None
+    w3 = connect_to_web3()
+    contract = get_provenance_contract(w3)
+    start = time.perf_counter()
+    snapshot = take_snapshot(w3, contract, args.block, base)
+    path = write_snapshot(snapshot, args.snapshot_dir)
+    print(f"Snapshot of {len(snapshot['diamonds'])} diamonds at block {snapshot['block_number']} written to {path} "
+          f"({snapshot['diamonds_read']} diamonds read in {time.perf_counter() - start:.2f}s)")
+    if base is not None and base["block_number"] <= snapshot["block_number"]:
+        print_diff(diff_snapshots(base, snapshot))
+
+def diff_registry(args):
+    """Prints ownership/certification changes between two snapshots."""
+    old_reference, new_reference = args.diff
+    print_diff(diff_snapshots(load_snapshot(old_reference, args.snapshot_dir),
+                              load_snapshot(new_reference, args.snapshot_dir)))
+
+def watch_registry(args):
+    """Streams new Provenance and Marketplace events as JSON lines, resuming from the saved cursor."""
+    w3 = connect_to_web3()
+    provenance = get_provenance_contract(w3)
+    marketplace = get_marketplace_contract(w3) if MARKETPLACE_CONTRACT_ADDRESS else None
+    if args.watch_output:
+        with open(args.watch_output, 'a') as output:
+            watch_events(w3, provenance, marketplace, output, args.cursor, args.from_block)
+    else:
+        watch_events(w3, provenance, marketplace, sys.stdout, args.cursor, args.from_block)
+
+async def async_check_all_diamonds():
+    """Reads every diamond concurrently over one pooled AsyncWeb3 connection."""
+    w3 = await async_connect_to_web3()
+    try:
+        contract = async_load_contract(w3, PROVENANCE_CONTRACT_ADDRESS, get_contract_abi())
+        total_supply = await contract.functions.totalSupply().call()
+        print(f"\nTotal diamonds in system: {total_supply}")
+
+        print("\nChecking all diamonds:")
+        for diamond_id, record in await async_read_diamonds(contract, range(1, total_supply + 1)):
+            if record is None:
+                print(f"Diamond ID {diamond_id} does not exist or error occurred")
+            else:
+                print_diamond_record(record)
+    finally:
+        await async_disconnect(w3)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Display information about minted diamonds.")
+    parser.add_argument("--index", nargs="?", const=PROVENANCE_INDEX_PATH,
+                        help="answer from the local provenance index (SQLite file) instead of the chain")
+    parser.add_argument("--sync", action="store_true", help="sync the index from contract events first")
+    parser.add_argument("--owner", help="diamonds currently owned by an address")
+    parser.add_argument("--origin", help="diamonds whose origin starts with this text")
+    parser.add_argument("--cert", help="diamond with this certification ID")
+    parser.add_argument("--from-raw", type=int, help="diamonds processed from this raw diamond ID")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="read diamonds concurrently with AsyncWeb3")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="write a block-pinned snapshot of the registry and print changes since the last one")
+    parser.add_argument("--block", type=int, help="block to pin the snapshot to (default: latest)")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two snapshots (path, content hash prefix or 'latest')")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument("--watch", action="store_true",
+                        help="follow new blocks and print contract events as JSON lines")
+    parser.add_argument("--from-block", type=int, help="first block to watch when there is no cursor yet")
+    parser.add_argument("--cursor", default=WATCH_CURSOR_PATH, help="file holding the last watched block")
+    parser.add_argument("--watch-output", help="append the JSON lines to this file instead of stdout")
+    parser.add_argument("--metrics", action="store_true",
+                        help="print per-method RPC call counts and latencies at the end")
+    return parser.parse_args()
 
 def main():
     """Main function to check diamond ownership."""
+    args = parse_args()
+    if args.index:
+        try:
+            query_index(args)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        return
+    if args.snapshot or args.diff:
+        try:
+            if args.snapshot:
+                snapshot_registry(args)
+            else:
+                diff_registry(args)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        return
+    if args.watch:
+        try:
+            watch_registry(args)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            # stdout carries the event stream
+            print(f"An error occurred: {e}", file=sys.stderr)
+        return
+    if args.use_async:
+        try:
+            asyncio.run(async_check_all_diamonds())
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        return
+
     try:
         # Connect to Web3
         w3 = connect_to_web3()
         
         # Load contract instance
-        contract = load_contract(w3, PROVENANCE_CONTRACT_ADDRESS, PROVENANCE_CONTRACT_ABI)
+        contract = get_provenance_contract(w3)
+        metrics = instrument(w3) if args.metrics else None
         
         # Get account addresses from private keys
         miner_address = get_account_address(MINER_PRIVATE_KEY)
@@ -109,12 +225,20 @@ def main():
             print(f"Error getting total supply: {e}")
             total_supply = 10
         
-        # Check all diamonds
+        # Check all diamonds, one round trip per chunk of diamonds
         print("\nChecking all diamonds:")
-        for i in range(1, total_supply + 1):
-            success = display_diamond_info(contract, i)
-            if not success:
-                print(f"Diamond ID {i} does not exist or error occurred")
+        reader = BatchReader(w3, contract)
+        for diamond_id, record in reader.read_diamonds(range(1, total_supply + 1)):
+            if record is None:
+                print(f"Diamond ID {diamond_id} does not exist or error occurred")
+            else:
+                print_diamond_record(record)
+        print(f"\nRead {total_supply} diamonds in {reader.round_trips} round trips ({reader.mode} mode)")
+        if metrics is not None:
+            print(f"\n{metrics.format_table()}")
+            if RPC_METRICS_REPORT:
+                metrics.write_report(RPC_METRICS_REPORT)
+                print(f"RPC metrics report written to {RPC_METRICS_REPORT}")
             
     except Exception as e:
         print(f"An error occurred: {e}")
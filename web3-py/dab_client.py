@@ -0,0 +1,148 @@
+import os
+import json
+import threading
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.middleware import ExtraDataToPOAMiddleware
+from eth_account import Account
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+SEPOLIA_RPC_URL = os.getenv("SEPOLIA_RPC_URL")
+# Optional comma-separated list of endpoints to spread requests over (see rpc_pool.py)
+SEPOLIA_RPC_URLS = [url.strip() for url in os.getenv("SEPOLIA_RPC_URLS", "").split(",") if url.strip()]
+PROVENANCE_CONTRACT_ADDRESS = os.getenv("PROVENANCE_CONTRACT_ADDRESS")
+MARKETPLACE_CONTRACT_ADDRESS = os.getenv("MARKETPLACE_CONTRACT_ADDRESS")
+ENTITY_CONTRACT_ADDRESS = os.getenv("ENTITY_CONTRACT_ADDRESS")
+SEPOLIA_CHAIN_ID = 11155111
+# Resolved next to this module, so the scripts work from any working directory
+CONTRACT_ABIS_PATH = os.getenv(
+    "CONTRACT_ABIS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "contract_abis.json")
+)
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "16"))
+# Record per-method RPC metrics on every connection (see rpc_metrics.py)
+RPC_METRICS = os.getenv("RPC_METRICS", "").lower() in ("1", "true", "yes")
+
+
+class ContractABIError(Exception):
+    """Raised when contract_abis.json is missing, malformed or lacks the requested ABI."""
+
+
+@lru_cache(maxsize=None)
+def _load_contract_abis(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def get_contract_abi(name="PROVENANCE_CONTRACT_ABI"):
+    """Returns an ABI from contract_abis.json, parsing the file only on first use."""
+    try:
+        return _load_contract_abis(CONTRACT_ABIS_PATH)[name]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+        raise ContractABIError(f"Error loading {name} from {CONTRACT_ABIS_PATH}: {e}") from e
+
+
+@lru_cache(maxsize=None)
+def get_account(private_key):
+    """Returns the LocalAccount for a private key, deriving it only once per key."""
+    return Account.from_key(private_key)
+
+
+def get_account_address(private_key):
+    """Gets the account address from a private key."""
+    return get_account(private_key).address
+
+
+_session = None
+_connections = {}
+_contracts = {}
+_client_lock = threading.Lock()
+
+
+def get_http_session():
+    """Returns the keep-alive requests.Session shared by every HTTP provider in the process."""
+    global _session
+    with _client_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=RPC_POOL_SIZE, pool_maxsize=RPC_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def connect_to_web3(rpc_url=None):
+    """Returns the Web3 connection to Sepolia, creating it on first use.
+
+    With SEPOLIA_RPC_URLS set (and no explicit rpc_url) the connection goes
+    through an RpcPoolProvider over all of those endpoints. Later calls for
+    the same URL(s) reuse the connection and its pooled session.
+    """
+    rpc_urls = [rpc_url] if rpc_url else SEPOLIA_RPC_URLS or ([SEPOLIA_RPC_URL] if SEPOLIA_RPC_URL else [])
+    if not rpc_urls:
+        raise ValueError("SEPOLIA_RPC_URL not found in environment variables.")
+    connection_key = ",".join(rpc_urls)
+
+    with _client_lock:
+        w3 = _connections.get(connection_key)
+    if w3 is not None:
+        return w3
+
+    if len(rpc_urls) > 1:
+        # Imported here: rpc_pool itself depends on this module for the shared session
+        from rpc_pool import RpcPoolProvider
+        w3 = Web3(RpcPoolProvider(rpc_urls))
+    else:
+        w3 = Web3(Web3.HTTPProvider(rpc_urls[0], session=get_http_session()))
+    w3.middleware_onion.inject(ExtraDataToPOAMiddleware(), layer=0)
+    if RPC_METRICS:
+        # Imported here: rpc_metrics itself depends on this module for the ABIs
+        from rpc_metrics import instrument
+        instrument(w3)
+
+    if not w3.is_connected():
+        raise ConnectionError(f"Failed to connect to Sepolia RPC: {connection_key}")
+    print(f"Successfully connected to Sepolia. Chain ID: {w3.eth.chain_id}")
+
+    with _client_lock:
+        return _connections.setdefault(connection_key, w3)
+
+
+def get_contract(w3, address, abi_name="PROVENANCE_CONTRACT_ABI"):
+    """Returns a contract instance, built once per connection, address and ABI."""
+    address = Web3.to_checksum_address(address)
+    key = (id(w3), address, abi_name)
+    with _client_lock:
+        contract = _contracts.get(key)
+        if contract is not None and contract.w3 is w3:
+            return contract
+    contract = w3.eth.contract(address=address, abi=get_contract_abi(abi_name))
+    with _client_lock:
+        _contracts[key] = contract
+    return contract
+
+
+def get_provenance_contract(w3):
+    """Returns the Provenance contract at PROVENANCE_CONTRACT_ADDRESS."""
+    if not PROVENANCE_CONTRACT_ADDRESS:
+        raise ValueError("PROVENANCE_CONTRACT_ADDRESS not found in environment variables.")
+    return get_contract(w3, PROVENANCE_CONTRACT_ADDRESS)
+
+
+def get_marketplace_contract(w3):
+    """Returns the Marketplace contract at MARKETPLACE_CONTRACT_ADDRESS."""
+    if not MARKETPLACE_CONTRACT_ADDRESS:
+        raise ValueError("MARKETPLACE_CONTRACT_ADDRESS not found in environment variables.")
+    return get_contract(w3, MARKETPLACE_CONTRACT_ADDRESS, "MARKETPLACE_CONTRACT_ABI")
+
+
+def get_entity_contract(w3):
+    """Returns the EntityContract at ENTITY_CONTRACT_ADDRESS."""
+    if not ENTITY_CONTRACT_ADDRESS:
+        raise ValueError("ENTITY_CONTRACT_ADDRESS not found in environment variables.")
+    return get_contract(w3, ENTITY_CONTRACT_ADDRESS, "ENTITY_CONTRACT_ABI")
@@ -1,26 +1,29 @@
 import os
 import time
-import json
 import random
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from eth_account import Account
+from contextlib import nullcontext
 from dotenv import load_dotenv
+from dab_client import (
+    SEPOLIA_CHAIN_ID, ENTITY_CONTRACT_ADDRESS, connect_to_web3, get_account,
+    get_provenance_contract, get_entity_contract
+)
+from nonce_manager import get_transaction_pipeline
+from receipt_events import get_registered_diamond_id, get_processed_diamond_id
+from rpc_metrics import RPC_METRICS_REPORT, instrument
+from preflight import PREFLIGHT, get_preflight
 
 # Load environment variables
 load_dotenv()
 
-# Configuration
-SEPOLIA_RPC_URL = os.getenv("SEPOLIA_RPC_URL")
-PROVENANCE_CONTRACT_ADDRESS = os.getenv("PROVENANCE_CONTRACT_ADDRESS")
-SEPOLIA_CHAIN_ID = 11155111
-
 # Entity credentials
 MINER_PRIVATE_KEY = os.getenv("MINER_PRIVATE_KEY")
 MANUFACTURER_PRIVATE_KEY = os.getenv("MANUFACTURER_PRIVATE_KEY")
 CERTIFIER_PRIVATE_KEY = os.getenv("CERTIFIER_PRIVATE_KEY")
 RETAILER_PRIVATE_KEY = os.getenv("RETAILER_PRIVATE_KEY")
 
+# Print the RPC calls made by each lifecycle step
+RPC_TRACE = os.getenv("RPC_TRACE", "").lower() in ("1", "true", "yes")
+
 # Diamond randomization options
 ORIGINS = [
     "Kimberley, Australia", 
@@ -42,59 +45,34 @@ CUT_TYPES = ["round brilliant", "princess", "emerald", "cushion", "asscher", "ra
 POLISH_GRADES = ["excellent", "very good", "good", "fair", "poor"]
 SYMMETRY_GRADES = ["excellent", "very good", "good", "fair", "poor"]
 
-# Load contract ABIs from JSON file
-try:
-    with open('contract_abis.json', 'r') as f:
-        contract_abis = json.load(f)
-    PROVENANCE_CONTRACT_ABI = contract_abis['PROVENANCE_CONTRACT_ABI']
-except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-    print(f"Error loading ABI from JSON file: {e}")
-    exit(1)
-
-def connect_to_web3():
-    """Creates a Web3 connection to Sepolia."""
-    if not SEPOLIA_RPC_URL:
-        raise ValueError("SEPOLIA_RPC_URL not found in environment variables.")
-        
-    w3 = Web3(Web3.HTTPProvider(SEPOLIA_RPC_URL))
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware(), layer=0)
-    
-    if not w3.is_connected():
-        raise ConnectionError(f"Failed to connect to Sepolia RPC: {SEPOLIA_RPC_URL}")
-    print(f"Successfully connected to Sepolia. Chain ID: {w3.eth.chain_id}")
-    
-    return w3
-
 def get_account_address(w3, private_key):
     """Gets the account address from a private key."""
-    account = Account.from_key(private_key)
-    return account.address
+    return get_account(private_key).address
+
+def preflight_check(w3, contract_function, private_key):
+    """Raises PreflightError if a Provenance write would revert, before it is signed."""
+    if not (PREFLIGHT and ENTITY_CONTRACT_ADDRESS):
+        return
+    provenance = get_provenance_contract(w3)
+    if contract_function.address != provenance.address:
+        return
+    preflight = get_preflight(w3, provenance, get_entity_contract(w3))
+    preflight.check(contract_function, get_account(private_key).address)
 
-def load_contract(w3, address, abi):
-    """Loads a contract instance."""
-    return w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+def submit_tx(w3, contract_function, private_key):
+    """Signs and sends a transaction without waiting, returns a PendingTransaction."""
+    preflight_check(w3, contract_function, private_key)
+    pipeline = get_transaction_pipeline(w3, private_key, SEPOLIA_CHAIN_ID)
+    pending_tx = pipeline.submit(contract_function)
+    print(f"Transaction sent. Hash: {pending_tx.tx_hash.hex()} (nonce {pending_tx.nonce})")
+    return pending_tx
 
 def sign_and_send_tx(w3, contract_function, private_key):
     """Signs and sends a transaction, waits for receipt."""
-    account = Account.from_key(private_key)
-    address = account.address
-    
-    # Build transaction
-    tx_params = {
-        'from': address,
-        'nonce': w3.eth.get_transaction_count(address),
-        'gas': 2000000,
-        'gasPrice': w3.eth.gas_price,
-        'chainId': SEPOLIA_CHAIN_ID
-    }
-    
-    transaction = contract_function.build_transaction(tx_params)
-    signed_tx = Account.sign_transaction(transaction, private_key)
-    tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-    print(f"Transaction sent. Hash: {tx_hash.hex()}")
+    pending_tx = submit_tx(w3, contract_function, private_key)
     
     print("Waiting for transaction receipt...")
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=180)
+    tx_receipt = pending_tx.result()
     
     if tx_receipt.status == 1:
         print("Transaction successful!")
@@ -103,15 +81,13 @@ def sign_and_send_tx(w3, contract_function, private_key):
         print(f"Transaction failed. Status: {tx_receipt.status}")
         return None
 
-def get_current_highest_diamond_id(w3, contract):
-    """Retrieves the current highest diamond ID from the contract."""
-    try:
-        total_supply = contract.functions.totalSupply().call()
-        print(f"Retrieved total diamond supply: {total_supply}")
-        return total_supply
-    except Exception as e:
-        print(f"Couldn't get total supply: {e}")
-        return 0  # Start from 1 for the first diamond
+def rpc_step(metrics, name):
+    """Attributes the RPC calls made inside the block to a lifecycle step when tracing."""
+    return metrics.step(name) if metrics is not None else nullcontext()
+
+def get_random_lot_number():
+    """Generate a random intake lot number used to label a raw diamond"""
+    return random.randint(10000, 99999)
 
 def get_random_raw_weight():
     """Generate a random weight for a raw diamond in points (1 carat = 100 points)"""
@@ -122,20 +98,20 @@ def get_random_processed_weight(raw_weight):
     yield_factor = random.uniform(0.4, 0.6)
     return int(raw_weight * yield_factor)
 
-def get_random_raw_characteristics(diamond_id):
+def get_random_raw_characteristics(lot_number):
     """Generate random characteristics for a raw diamond"""
     color = random.choice(COLORS)
     crystal = random.choice(CRYSTAL_FORMS)
-    return f"Rough diamond #{diamond_id}, {color}, {crystal} crystal form"
+    return f"Rough diamond lot #{lot_number}, {color}, {crystal} crystal form"
 
-def get_random_processed_characteristics(diamond_id):
+def get_random_processed_characteristics(raw_diamond_id):
     """Generate random characteristics for a processed diamond"""
     color = random.choice(COLORS)
     clarity = random.choice(CLARITY)
     cut = random.choice(CUT_TYPES)
     polish = random.choice(POLISH_GRADES)
     symmetry = random.choice(SYMMETRY_GRADES)
-    return f"{cut} cut #{diamond_id}, {clarity} clarity, {color}, {polish} polish, {symmetry} symmetry"
+    return f"{cut} cut from raw #{raw_diamond_id}, {clarity} clarity, {color}, {polish} polish, {symmetry} symmetry"
 
 def register_raw_diamond(w3, contract, miner_private_key):
     """Registers a raw diamond as the miner."""
@@ -143,14 +119,12 @@ def register_raw_diamond(w3, contract, miner_private_key):
     miner_address = get_account_address(w3, miner_private_key)
     print(f"Miner address: {miner_address}")
     
-    current_highest_id = get_current_highest_diamond_id(w3, contract)
-    expected_new_id = current_highest_id + 1
-    
     # Random diamond details
-    origin = f"{random.choice(ORIGINS)} #{expected_new_id}"
+    lot_number = get_random_lot_number()
+    origin = f"{random.choice(ORIGINS)} #{lot_number}"
     extraction_date = int(time.time()) - random.randint(86400 * 7, 86400 * 90)  # 7-90 days ago
     weight = get_random_raw_weight()
-    characteristics = get_random_raw_characteristics(expected_new_id)
+    characteristics = get_random_raw_characteristics(lot_number)
     
     print(f"Registering raw diamond from {origin} with weight {weight/100} carats...")
     print(f"Characteristics: {characteristics}")
@@ -163,21 +137,8 @@ def register_raw_diamond(w3, contract, miner_private_key):
     receipt = sign_and_send_tx(w3, register_function, miner_private_key)
     
     if receipt:
-        try:
-            # Check if expected_new_id exists and is owned by miner
-            owner = contract.functions.getDiamondOwnershipInfo(expected_new_id).call()
-            if owner.lower() == miner_address.lower():
-                print(f"Successfully verified new diamond ID: {expected_new_id}")
-                diamond_id = expected_new_id
-            else:
-                # If verification failed, get updated total supply
-                new_total_supply = contract.functions.totalSupply().call()
-                diamond_id = new_total_supply
-                print(f"Diamond registered with ID: {diamond_id}")
-        except Exception:
-            print("Could not determine exact diamond ID. Using expected ID as fallback.")
-            diamond_id = expected_new_id
-        
+        # The new ID comes straight from the DiamondRegistered log in the receipt
+        diamond_id = get_registered_diamond_id(contract, receipt)
         print(f"Raw diamond registered! ID: {diamond_id}")
         return diamond_id
     
@@ -205,9 +166,6 @@ def process_diamond(w3, contract, raw_diamond_id, manufacturer_private_key):
     manufacturer_address = get_account_address(w3, manufacturer_private_key)
     print(f"Manufacturer address: {manufacturer_address}")
     
-    current_highest_id = get_current_highest_diamond_id(w3, contract)
-    expected_new_id = current_highest_id + 1
-    
     # Get original raw diamond weight
     try:
         basic_info = contract.functions.getDiamondBasicInfo(raw_diamond_id).call()
@@ -218,7 +176,7 @@ def process_diamond(w3, contract, raw_diamond_id, manufacturer_private_key):
     
     # Random processing details
     new_weight = get_random_processed_weight(raw_weight)
-    new_characteristics = get_random_processed_characteristics(expected_new_id)
+    new_characteristics = get_random_processed_characteristics(raw_diamond_id)
     
     print(f"Processing raw diamond ID {raw_diamond_id} to new weight {new_weight/100} carats...")
     print(f"Characteristics: {new_characteristics}")
@@ -231,20 +189,8 @@ def process_diamond(w3, contract, raw_diamond_id, manufacturer_private_key):
     receipt = sign_and_send_tx(w3, process_function, manufacturer_private_key)
     
     if receipt:
-        try:
-            # Check if expected_new_id exists and is linked to raw diamond
-            owner = contract.functions.getDiamondOwnershipInfo(expected_new_id).call()
-            cert_info = contract.functions.getDiamondCertInfo(expected_new_id).call()
-            
-            if owner.lower() == manufacturer_address.lower() and cert_info[2] == raw_diamond_id:
-                processed_diamond_id = expected_new_id
-            else:
-                # If verification failed, get updated total supply
-                new_total_supply = contract.functions.totalSupply().call()
-                processed_diamond_id = new_total_supply
-        except Exception:
-            processed_diamond_id = expected_new_id
-        
+        # The new ID comes straight from the DiamondProcessed log in the receipt
+        processed_diamond_id = get_processed_diamond_id(contract, receipt, raw_diamond_id)
         print(f"Diamond processed successfully! New processed diamond ID: {processed_diamond_id}")
         return processed_diamond_id
     
@@ -317,12 +263,14 @@ def display_diamond_info(w3, contract, diamond_id):
 
 def main():
     """Main function to execute the complete diamond lifecycle."""
+    metrics = None
     try:
         # Connect to Web3
         w3 = connect_to_web3()
         
         # Load contract instance
-        contract = load_contract(w3, PROVENANCE_CONTRACT_ADDRESS, PROVENANCE_CONTRACT_ABI)
+        contract = get_provenance_contract(w3)
+        metrics = instrument(w3) if RPC_TRACE else None
         
         # Get account addresses
         miner_address = get_account_address(w3, MINER_PRIVATE_KEY)
@@ -336,31 +284,37 @@ def main():
         print(f"Retailer Address: {retailer_address}")
         
         # Step 1: Register a new raw diamond
-        raw_diamond_id = register_raw_diamond(w3, contract, MINER_PRIVATE_KEY)
-        display_diamond_info(w3, contract, raw_diamond_id)
+        with rpc_step(metrics, "Step 1: register raw diamond"):
+            raw_diamond_id = register_raw_diamond(w3, contract, MINER_PRIVATE_KEY)
+            display_diamond_info(w3, contract, raw_diamond_id)
         
         # Step 2: Miner transfers diamond to manufacturer
-        print("\n=== STEP 2: MINER TRANSFERRING DIAMOND TO MANUFACTURER ===")
-        transfer_diamond(w3, contract, raw_diamond_id, MINER_PRIVATE_KEY, manufacturer_address)
-        display_diamond_info(w3, contract, raw_diamond_id)
+        with rpc_step(metrics, "Step 2: transfer to manufacturer"):
+            print("\n=== STEP 2: MINER TRANSFERRING DIAMOND TO MANUFACTURER ===")
+            transfer_diamond(w3, contract, raw_diamond_id, MINER_PRIVATE_KEY, manufacturer_address)
+            display_diamond_info(w3, contract, raw_diamond_id)
         
         # Step 3: Manufacturer processes the diamond
-        processed_diamond_id = process_diamond(w3, contract, raw_diamond_id, MANUFACTURER_PRIVATE_KEY)
-        display_diamond_info(w3, contract, processed_diamond_id)
+        with rpc_step(metrics, "Step 3: process diamond"):
+            processed_diamond_id = process_diamond(w3, contract, raw_diamond_id, MANUFACTURER_PRIVATE_KEY)
+            display_diamond_info(w3, contract, processed_diamond_id)
         
         # Step 4: Manufacturer transfers processed diamond to certifier
-        print(f"\n=== STEP 4: MANUFACTURER TRANSFERRING PROCESSED DIAMOND TO CERTIFIER ===")
-        transfer_diamond(w3, contract, processed_diamond_id, MANUFACTURER_PRIVATE_KEY, certifier_address)
-        display_diamond_info(w3, contract, processed_diamond_id)
+        with rpc_step(metrics, "Step 4: transfer to certifier"):
+            print(f"\n=== STEP 4: MANUFACTURER TRANSFERRING PROCESSED DIAMOND TO CERTIFIER ===")
+            transfer_diamond(w3, contract, processed_diamond_id, MANUFACTURER_PRIVATE_KEY, certifier_address)
+            display_diamond_info(w3, contract, processed_diamond_id)
         
         # Step 5: Certifier certifies the diamond
-        certify_diamond(w3, contract, processed_diamond_id, CERTIFIER_PRIVATE_KEY)
-        display_diamond_info(w3, contract, processed_diamond_id)
+        with rpc_step(metrics, "Step 5: certify diamond"):
+            certify_diamond(w3, contract, processed_diamond_id, CERTIFIER_PRIVATE_KEY)
+            display_diamond_info(w3, contract, processed_diamond_id)
         
         # Step 6: Certifier transfers diamond to retailer
-        print(f"\n=== STEP 6: CERTIFIER TRANSFERRING DIAMOND TO RETAILER ===")
-        transfer_diamond(w3, contract, processed_diamond_id, CERTIFIER_PRIVATE_KEY, retailer_address)
-        display_diamond_info(w3, contract, processed_diamond_id)
+        with rpc_step(metrics, "Step 6: transfer to retailer"):
+            print(f"\n=== STEP 6: CERTIFIER TRANSFERRING DIAMOND TO RETAILER ===")
+            transfer_diamond(w3, contract, processed_diamond_id, CERTIFIER_PRIVATE_KEY, retailer_address)
+            display_diamond_info(w3, contract, processed_diamond_id)
         
         print("\n=== DIAMOND LIFECYCLE COMPLETED SUCCESSFULLY ===")
         print(f"Raw Diamond ID: {raw_diamond_id}")
@@ -368,6 +322,15 @@ def main():
         
     except Exception as e:
         print(f"\nAn error occurred: {e}")
+    finally:
+        if metrics is not None:
+            print("\n=== RPC TRACE ===")
+            print(metrics.format_trace())
+            print()
+            print(metrics.format_table())
+            if RPC_METRICS_REPORT:
+                metrics.write_report(RPC_METRICS_REPORT)
+                print(f"RPC metrics report written to {RPC_METRICS_REPORT}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import queue
+import asyncio
+import threading
+from web3 import AsyncWeb3, WebSocketProvider
+from eth_utils import event_abi_to_log_topic
+from dotenv import load_dotenv
+from provenance_index import INDEX_BLOCK_CHUNK, INDEX_CONFIRMATIONS, REORG_DEPTH, is_log_range_error
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+# When set, new heads arrive over a websocket subscription instead of polling for them
+SEPOLIA_WS_URL = os.getenv("SEPOLIA_WS_URL")
+WATCH_CURSOR_PATH = os.getenv("WATCH_CURSOR_PATH", "watch_cursor.json")
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", "2"))
+# Decoded events buffered between the poller and the writer; a full queue pauses polling
+WATCH_QUEUE_SIZE = int(os.getenv("WATCH_QUEUE_SIZE", "1000"))
+# Attempts per RPC call before a transient error (timeout, rate limit, dropped connection) ends the stream
+WATCH_MAX_RETRIES = int(os.getenv("WATCH_MAX_RETRIES", "8"))
+
+PROVENANCE_EVENTS = (
+    "DiamondRegistered", "DiamondProcessed", "DiamondCertified", "DiamondTransferred", "HistoryRecordAdded"
+)
+MARKETPLACE_EVENTS = (
+    "DiamondListed", "DiamondSold", "ListingCancelled", "DiamondReportedStolen", "StolenReportResolved"
+)
+
+
+def read_cursor(path=WATCH_CURSOR_PATH):
+    """Returns (block_number, block_hash) of the last fully emitted block, or None."""
+    try:
+        with open(path, 'r') as f:
+            cursor = json.load(f)
+    except FileNotFoundError:
+        return None
+    return cursor["block_number"], cursor["block_hash"]
+
+
+def write_cursor(block_number, block_hash, path=WATCH_CURSOR_PATH):
+    """Saves the cursor atomically, so a crash never leaves a half-written file."""
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'w') as f:
+        json.dump({"block_number": block_number, "block_hash": block_hash}, f)
+    os.replace(temporary_path, path)
+
+
+class EventDecoder:
+    """Turns raw Provenance and Marketplace logs into JSON-serializable event dicts."""
+
+    def __init__(self, provenance, marketplace=None):
+        self.contracts = {provenance.address: ("Provenance", provenance)}
+        self._topics = {}
+        for event_name in PROVENANCE_EVENTS:
+            self._topics[(provenance.address, event_abi_to_log_topic(provenance.events[event_name].abi))] = event_name
+        if marketplace is not None:
+            self.contracts[marketplace.address] = ("Marketplace", marketplace)
+            for event_name in MARKETPLACE_EVENTS:
+                self._topics[(marketplace.address, event_abi_to_log_topic(marketplace.events[event_name].abi))] = \
+                    event_name
+
+    @property
+    def addresses(self):
+        return list(self.contracts)
+
+    @property
+    def topics(self):
+        return sorted({"0x" + topic.hex() for _, topic in self._topics})
+
+    def decode(self, log):
+        """Returns the event dict of a log, or None for events that are not streamed (e.g. LogMessage)."""
+        event_name = self._topics.get((log["address"], bytes(log["topics"][0])))
+        if event_name is None:
+            return None
+        contract_name, contract = self.contracts[log["address"]]
+        event = contract.events[event_name]().process_log(log)
+        return {
+            "contract": contract_name,
+            "event": event_name,
+            "block_number": log["blockNumber"],
+            "block_hash": log["blockHash"].to_0x_hex(),
+            "tx_hash": log["transactionHash"].to_0x_hex(),
+            "log_index": log["logIndex"],
+            "args": dict(event.args),
+        }
+
+
+class HeadSubscription:
+    """Wakes the poller on every new block announced over a websocket eth_subscribe("newHeads").
+
+    Runs its own asyncio loop in a daemon thread and reconnects with
+    backoff; while the socket is down the poller simply falls back to its
+    poll interval, so no blocks are missed either way.
+    """
+
+    def __init__(self, ws_url, new_head):
+        self.ws_url = ws_url
+        self.new_head = new_head
+        self.connected = False
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True,
+                                        name="watch-new-heads")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                async with AsyncWeb3(WebSocketProvider(self.ws_url)) as w3:
+                    await w3.eth.subscribe("newHeads")
+                    self.connected = True
+                    delay = 1.0
+                    async for _ in w3.socket.process_subscriptions():
+                        self.new_head.set()
+            except Exception as e:
+                print(f"Websocket {self.ws_url} disconnected ({e}), polling until it is back", file=sys.stderr)
+            self.connected = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+class LogPoller:
+    """Follows the chain with eth_getLogs over block ranges and feeds decoded events into a bounded queue.
+
+    After each range the poller enqueues a cursor marker; the consumer saves
+    it once every event before it has been written, so a restart resumes
+    after the last fully emitted range (delivery is at-least-once for a
+    range interrupted mid-way; block_number/log_index identify an event).
+    Blocks are only read once they have INDEX_CONFIRMATIONS confirmations.
+    Before each range the hash of the last emitted block is checked against
+    the chain; if a reorg replaced it, polling rewinds REORG_DEPTH blocks and
+    the replaced range is emitted again (events carry their block_hash).
+    """
+
+    def __init__(self, w3, decoder, from_block, events, chunk_size=INDEX_BLOCK_CHUNK,
+                 poll_interval=WATCH_POLL_INTERVAL, confirmations=INDEX_CONFIRMATIONS, ws_url=SEPOLIA_WS_URL,
+                 last_block_hash=None, max_retries=WATCH_MAX_RETRIES):
+        self.w3 = w3
+        self.decoder = decoder
+        self.next_block = from_block
+        # Hash of block next_block - 1 as emitted, when known
+        self.last_block_hash = last_block_hash
+        self.max_retries = max_retries
+        self.reorgs = 0
+        self.events = events
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        self.new_head = threading.Event()
+        self.subscription = HeadSubscription(ws_url, self.new_head) if ws_url else None
+        self.stopped = threading.Event()
+        self.polls = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="watch-poller")
+
+    def start(self):
+        if self.subscription is not None:
+            self.subscription.start()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.new_head.set()
+
+    def _put(self, item):
+        # Blocks while the consumer is behind; checks for stop() so shutdown never hangs
+        while not self.stopped.is_set():
+            try:
+                self.events.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            while not self.stopped.is_set():
+                self.poll()
+                self.new_head.wait(self.poll_interval)
+                self.new_head.clear()
+        except Exception as e:
+            self._put(("error", e))
+
+    def _retry(self, rpc_call, *args):
+        """Runs an RPC call, retrying transient errors with exponential backoff.
+
+        Range/result-limit errors of eth_getLogs are raised at once, since
+        only a smaller range helps.
+        """
+        delay = 1.0
+        for attempt in range(self.max_retries):
+            try:
+                return rpc_call(*args)
+            except Exception as e:
+                if is_log_range_error(e) or attempt == self.max_retries - 1 or self.stopped.is_set():
+                    raise
+                print(f"RPC call failed ({e}), retrying in {delay:.0f}s", file=sys.stderr)
+                self.stopped.wait(delay)
+                delay = min(delay * 2, 60.0)
+
+    def _block_hash(self, block_number):
+        return self._retry(self.w3.eth.get_block, block_number)["hash"].to_0x_hex()
+
+    def _check_reorg(self):
+        """Rewinds REORG_DEPTH blocks if the last emitted block is no longer on the chain."""
+        if self.last_block_hash is None or self.next_block == 0:
+            return
+        if self._block_hash(self.next_block - 1) == self.last_block_hash:
+            return
+        rewound_to = max(0, self.next_block - REORG_DEPTH)
+        print(f"Reorg detected: block {self.next_block - 1} was replaced, re-emitting from block {rewound_to}",
+              file=sys.stderr)
+        self.reorgs += 1
+        self.next_block = rewound_to
+        self.last_block_hash = None
+
+    def poll(self):
+        """Reads every confirmed block after the last one polled. Returns the number of events enqueued."""
+        self.polls += 1
+        to_block = self._retry(lambda: self.w3.eth.block_number) - self.confirmations
+        chunk_size = self.chunk_size
+        enqueued = 0
+        while self.next_block <= to_block and not self.stopped.is_set():
+            self._check_reorg()
+            end_block = min(self.next_block + chunk_size - 1, to_block)
+            try:
+                logs = self._retry(self.w3.eth.get_logs, {
+                    'address': self.decoder.addresses,
+                    'fromBlock': self.next_block,
+                    'toBlock': end_block,
+                    'topics': [self.decoder.topics]
+                })
+            except Exception as e:
+                if chunk_size == 1 or not is_log_range_error(e):
+                    raise
+                # Providers cap the range or result count of eth_getLogs
+                chunk_size = max(1, chunk_size // 2)
+                print(f"eth_getLogs failed for blocks {self.next_block}-{end_block} ({e}), "
+                      f"retrying with chunk size {chunk_size}", file=sys.stderr)
+                continue
+
+            for log in logs:
+                event = self.decoder.decode(log)
+                if event is not None:
+                    if not self._put(("event", event)):
+                        return enqueued
+                    enqueued += 1
+            end_hash = self._block_hash(end_block)
+            if not self._put(("cursor", (end_block, end_hash))):
+                return enqueued
+            self.next_block = end_block + 1
+            self.last_block_hash = end_hash
+        return enqueued
+
+
+def watch_events(w3, provenance, marketplace=None, output=sys.stdout, cursor_path=WATCH_CURSOR_PATH,
+                 from_block=None, max_events=None, queue_size=WATCH_QUEUE_SIZE, **poller_options):
+    """Streams new Provenance/Marketplace events to `output` as JSON lines until interrupted.
+
+    Resumes after the block in the cursor file (rewinding if a reorg has
+    replaced that block since); without one it starts at from_block, or at
+    the next block when that is None. With max_events the
+    stream stops at the end of the block range holding that many events, so
+    the cursor is consistent. Returns the number of events written.
+    """
+    cursor = read_cursor(cursor_path)
+    last_block_hash = None
+    if cursor is not None:
+        start_block, last_block_hash = cursor[0] + 1, cursor[1]
+    elif from_block is not None:
+        start_block = from_block
+    else:
+        start_block = w3.eth.block_number + 1
+
+    events = queue.Queue(maxsize=queue_size)
+    poller = LogPoller(w3, EventDecoder(provenance, marketplace), start_block, events,
+                       last_block_hash=last_block_hash, **poller_options).start()
+    print(f"Watching from block {start_block}" + (f" (websocket {poller.subscription.ws_url})"
+                                                   if poller.subscription else "") + f", cursor {cursor_path}",
+          file=sys.stderr)
+    written = 0
+    try:
+        while True:
+            kind, item = events.get()
+            if kind == "event":
+                output.write(json.dumps(item) + "\n")
+                written += 1
+            elif kind == "cursor":
+                # Everything up to this block is written; make it durable before moving the cursor
+                output.flush()
+                write_cursor(item[0], item[1], cursor_path)
+                if max_events is not None and written >= max_events:
+                    break
+            else:
+                raise item
+    finally:
+        poller.stop()
+        output.flush()
+    return written
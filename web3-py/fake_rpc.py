@@ -0,0 +1,243 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3 import Web3
+from eth_account import Account
+from latency_stats import summarize, format_summary
+
+# eth-tester is not thread-safe; every fake endpoint in front of one chain shares this lock
+_chain_lock = threading.Lock()
+
+
+class FakeRpcEndpoint:
+    """Local JSON-RPC endpoint in front of an eth-tester chain that injects latency and faults.
+
+    Each request sleeps for `latency` seconds, or `slow_latency` seconds with
+    probability `slow_rate`, then fails with probability:
+    - error_rate: HTTP 503 without touching the chain;
+    - rate_limit_rate: JSON-RPC error -32005 "rate limit exceeded";
+    - lost_response_rate: the request IS applied to the chain, then HTTP 503
+      (a timeout after the node accepted a transaction).
+    The settings are plain attributes and can be changed while serving.
+    fail_next() queues exact faults for a method, for deterministic tests;
+    `calls` records the (method, params) of every single request.
+    """
+
+    def __init__(self, w3, name="fake", latency=0.0, slow_rate=0.0, slow_latency=1.0,
+                 error_rate=0.0, rate_limit_rate=0.0, lost_response_rate=0.0, seed=None):
+        self.name = name
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.lost_response_rate = lost_response_rate
+        self.requests = 0
+        self.faults = 0
+        self.calls = []
+        self._scripted_faults = {}
+        self._random = random.Random(seed)
+        self._request_func = w3.provider.request_func(w3, w3.middleware_onion)
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self, port=0):
+        handler = type("BoundFakeRpcHandler", (FakeRpcHandler,), {"endpoint": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, method, *faults):
+        """Makes the next requests of `method` fail, one per fault: "unavailable" (HTTP 503) or (code, message)."""
+        self._scripted_faults.setdefault(method, []).extend(faults)
+
+    def handle(self, body):
+        """Returns (HTTP status, response payload) for one decoded JSON-RPC body."""
+        self.requests += 1
+        if isinstance(body, dict):
+            self.calls.append((body["method"], body.get("params", [])))
+            scripted = self._scripted_faults.get(body["method"])
+            if scripted:
+                self.faults += 1
+                fault = scripted.pop(0)
+                if fault == "unavailable":
+                    return 503, {"error": "service unavailable"}
+                return 200, _error_response(body, *fault)
+        roll = self._random.random()
+        time.sleep(self.slow_latency if self._random.random() < self.slow_rate else self.latency)
+        if roll < self.error_rate:
+            self.faults += 1
+            return 503, {"error": "service unavailable"}
+        roll -= self.error_rate
+        if roll < self.rate_limit_rate:
+            self.faults += 1
+            return 200, _error_response(body, -32005, "rate limit exceeded")
+        roll -= self.rate_limit_rate
+
+        response = [self._call(request) for request in body] if isinstance(body, list) else self._call(body)
+        if roll < self.lost_response_rate:
+            self.faults += 1
+            return 503, {"error": "gateway timeout"}
+        return 200, response
+
+    def _call(self, request):
+        with _chain_lock:
+            try:
+                response = dict(self._request_func(request["method"], request.get("params", [])))
+            except Exception as e:
+                return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": -32000, "message": str(e)}}
+        response.update(jsonrpc="2.0", id=request.get("id"))
+        return response
+
+    def stats(self):
+        return {"name": self.name, "url": self.url, "requests": self.requests, "faults": self.faults}
+
+
+def _error_response(body, code, message):
+    requests = body if isinstance(body, list) else [body]
+    responses = [{"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": code, "message": message}}
+                 for request in requests]
+    return responses if isinstance(body, list) else responses[0]
+
+
+class FakeRpcHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    endpoint = None
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        status, payload = self.endpoint.handle(body)
+        data = Web3.to_json(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timed_reads(contract, diamond_ids, clients, reads_per_client):
+    """Reads getDiamondBasicInfo from `clients` threads, returns (latencies, errors)."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(seed):
+        rng = random.Random(seed)
+        samples = []
+        failures = []
+        for _ in range(reads_per_client):
+            start = time.perf_counter()
+            try:
+                contract.functions.getDiamondBasicInfo(rng.choice(diamond_ids)).call()
+                samples.append(time.perf_counter() - start)
+            except Exception as e:
+                failures.append(e)
+        with lock:
+            latencies.extend(samples)
+            errors.extend(failures)
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def main():
+    """Reports read latency and write outcomes through RpcPoolProvider against fake endpoints.
+
+    The pass/fail checks for hedging, failover and writes live in tests/test_rpc_pool.py.
+    """
+    from local_chain import connect_eth_tester, setup_local_chain, send_local_tx
+    from dab_client import get_account
+    from rpc_pool import RpcPoolProvider, RPC_HEDGE_AFTER
+
+    parser = argparse.ArgumentParser(description="Exercise the RPC pool against faulty local endpoints.")
+    parser.add_argument("--diamonds", type=int, default=10, help="raw diamonds to create on eth-tester")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent reading threads")
+    parser.add_argument("--reads", type=int, default=100, help="reads per client")
+    parser.add_argument("--writes", type=int, default=20, help="transactions to send through the pool")
+    parser.add_argument("--hedge-after", type=float, default=RPC_HEDGE_AFTER, help="hedge threshold in seconds")
+    args = parser.parse_args()
+
+    chain, private_keys = connect_eth_tester()
+    _, provenance, _ = setup_local_chain(chain, private_keys)
+    miner_key = private_keys[1]
+    for number in range(args.diamonds):
+        send_local_tx(chain, miner_key, provenance.functions.registerRawDiamond(
+            f"Pool Mine #{number}", int(time.time()), 150, "pool test diamond"
+        ))
+    diamond_ids = list(range(1, args.diamonds + 1))
+
+    endpoints = [
+        FakeRpcEndpoint(chain, "fast", latency=0.005, seed=1).start(),
+        FakeRpcEndpoint(chain, "slow-tail", latency=0.005, slow_rate=0.1, slow_latency=1.5, seed=2).start(),
+        FakeRpcEndpoint(chain, "flaky", latency=0.005, error_rate=0.2, rate_limit_rate=0.1, seed=3).start(),
+    ]
+    print("Fake endpoints: " + ", ".join(f"{endpoint.name} {endpoint.url}" for endpoint in endpoints))
+
+    setups = (
+        ("single slow-tail endpoint", [endpoints[1].url], None),
+        ("pool, no hedging", [endpoint.url for endpoint in endpoints], None),
+        (f"pool, hedge after {args.hedge_after * 1000:.0f} ms", [endpoint.url for endpoint in endpoints],
+         args.hedge_after),
+    )
+    for label, urls, hedge_after in setups:
+        pool = RpcPoolProvider(urls, hedge_after=hedge_after)
+        w3 = Web3(pool)
+        contract = w3.eth.contract(address=provenance.address, abi=provenance.abi)
+        latencies, errors = timed_reads(contract, diamond_ids, args.clients, args.reads)
+        print(f"\n{label}: {format_summary(summarize(latencies))}, {len(errors)} errors, "
+              f"{pool.hedged_requests} hedged")
+        for stats in pool.stats()["endpoints"]:
+            print(f"  {stats}")
+
+    # Writes: the write endpoint loses half of its responses after applying them
+    endpoints[0].lost_response_rate = 0.5
+    pool = RpcPoolProvider([endpoint.url for endpoint in endpoints], hedge_after=args.hedge_after)
+    w3 = Web3(pool)
+    supply_before = provenance.functions.totalSupply().call()
+    miner_address = get_account(miner_key).address
+    nonce = chain.eth.get_transaction_count(miner_address)
+    send_errors = []
+    for offset in range(args.writes):
+        transaction = provenance.functions.registerRawDiamond(
+            f"Pool Write #{offset}", int(time.time()), 120, "pool write"
+        ).build_transaction({
+            'from': miner_address, 'nonce': nonce + offset,
+            'gasPrice': chain.eth.gas_price, 'chainId': chain.eth.chain_id
+        })
+        signed_tx = Account.sign_transaction(transaction, miner_key)
+        try:
+            tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            if tx_hash != signed_tx.hash:
+                send_errors.append(f"unexpected hash {tx_hash.hex()}")
+        except Exception as e:
+            send_errors.append(e)
+    minted = provenance.functions.totalSupply().call() - supply_before
+    print(f"\nWrites: {args.writes} sent, {minted} mined, {len(send_errors)} send errors "
+          f"(write endpoint lost {endpoints[0].faults} responses)")
+    for stats in pool.stats()["endpoints"]:
+        print(f"  {stats}")
+
+    for endpoint in endpoints:
+        endpoint.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import time
+import asyncio
+import threading
+from web3 import AsyncWeb3
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+FEE_CACHE_TTL = float(os.getenv("FEE_CACHE_TTL", "12"))  # about one block
+FEE_HISTORY_BLOCKS = int(os.getenv("FEE_HISTORY_BLOCKS", "5"))
+FEE_PRIORITY_PERCENTILE = int(os.getenv("FEE_PRIORITY_PERCENTILE", "50"))
+GAS_LIMIT_MARGIN = float(os.getenv("GAS_LIMIT_MARGIN", "1.2"))
+
+
+def _fees_from_history(fee_history, default_priority_fee):
+    """Turns an eth_feeHistory result into EIP-1559 fee fields, or None on a pre-London chain."""
+    base_fees = fee_history.get('baseFeePerGas') or []
+    if not base_fees or not base_fees[-1]:
+        return None
+    # The last base fee is the one for the next block; allow it to double before we are priced out
+    rewards = [block_rewards[0] for block_rewards in fee_history.get('reward') or [] if block_rewards]
+    priority_fee = sorted(rewards)[len(rewards) // 2] if rewards else default_priority_fee
+    return {
+        'maxFeePerGas': 2 * base_fees[-1] + priority_fee,
+        'maxPriorityFeePerGas': priority_fee,
+    }
+
+
+def _call_signature(contract_function, sender):
+    """Memo key for a gas estimate: contract, function, sender and the size of dynamic arguments.
+
+    Gas mostly depends on how many storage words the strings and arrays take,
+    not on their contents, so arguments are bucketed into 32-byte words.
+    Returns None for calls on an existing diamond or listing (an ...Id
+    argument): their gas grows with its history, so they are not memoized.
+    """
+    shape = []
+    for abi_input, arg in zip(contract_function.abi["inputs"], contract_function.args):
+        if abi_input["type"] == "uint256" and abi_input["name"].endswith("Id"):
+            return None
+        if isinstance(arg, (str, bytes)):
+            shape.append((len(arg) + 31) // 32)
+        elif isinstance(arg, (list, tuple)):
+            shape.append(("list", len(arg)))
+        else:
+            shape.append(None)
+    return contract_function.address, contract_function.signature, sender, tuple(shape)
+
+
+class FeeOracle:
+    """Short-TTL cached fee quote shared by every sender on one connection.
+
+    Uses EIP-1559 fees from eth_feeHistory and falls back to the legacy
+    eth_gasPrice on chains (or nodes) without fee history.
+    """
+
+    def __init__(self, w3, ttl=FEE_CACHE_TTL):
+        self.w3 = w3
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fees = None
+        self._fetched_at = 0.0
+
+    def fees(self):
+        """Returns the fee fields for a transaction, re-querying the node at most once per TTL."""
+        with self._lock:
+            if self._fees is None or time.monotonic() - self._fetched_at > self.ttl:
+                self._fees = self._fetch()
+                self._fetched_at = time.monotonic()
+            return dict(self._fees)
+
+    def _fetch(self):
+        try:
+            fee_history = self.w3.eth.fee_history(FEE_HISTORY_BLOCKS, 'latest', [FEE_PRIORITY_PERCENTILE])
+            fees = _fees_from_history(fee_history, None if fee_history.get('reward') else self.w3.eth.max_priority_fee)
+            if fees is not None:
+                return fees
+        except Exception as e:
+            print(f"Fee history unavailable, using legacy gas price: {e}")
+        return {'gasPrice': self.w3.eth.gas_price}
+
+
+class GasEstimator:
+    """estimate_gas results memoized by call signature, with a safety margin on top."""
+
+    def __init__(self, w3, margin=GAS_LIMIT_MARGIN):
+        self.w3 = w3
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._estimates = {}
+
+    def gas_limit(self, contract_function, sender):
+        """Returns the gas limit to send a contract call with.
+
+        A failed estimate (usually a call that would revert) is raised, so
+        nothing is sent with a made-up limit.
+        """
+        key = _call_signature(contract_function, sender)
+        with self._lock:
+            estimate = self._estimates.get(key) if key is not None else None
+        if estimate is None:
+            estimate = contract_function.estimate_gas({'from': sender})
+            if key is not None:
+                with self._lock:
+                    self._estimates[key] = estimate
+        return int(estimate * self.margin)
+
+
+class GasStrategy:
+    """Gas limit and fee fields for outgoing transactions."""
+
+    def __init__(self, w3, fee_ttl=FEE_CACHE_TTL, margin=GAS_LIMIT_MARGIN):
+        self.w3 = w3
+        self.fee_oracle = FeeOracle(w3, fee_ttl)
+        self.estimator = GasEstimator(w3, margin)
+
+    def gas_params(self, contract_function, sender):
+        """Returns the 'gas' and fee fields to merge into the transaction parameters."""
+        return {'gas': self.estimator.gas_limit(contract_function, sender), **self.fee_oracle.fees()}
+
+
+class AsyncFeeOracle:
+    """Async variant of FeeOracle for AsyncWeb3 connections."""
+
+    def __init__(self, w3, ttl=FEE_CACHE_TTL):
+        self.w3 = w3
+        self.ttl = ttl
+        self._lock = asyncio.Lock()
+        self._fees = None
+        self._fetched_at = 0.0
+
+    async def fees(self):
+        """Returns the fee fields for a transaction, re-querying the node at most once per TTL."""
+        async with self._lock:
+            if self._fees is None or time.monotonic() - self._fetched_at > self.ttl:
+                self._fees = await self._fetch()
+                self._fetched_at = time.monotonic()
+            return dict(self._fees)
+
+    async def _fetch(self):
+        try:
+            fee_history = await self.w3.eth.fee_history(FEE_HISTORY_BLOCKS, 'latest', [FEE_PRIORITY_PERCENTILE])
+            default_priority_fee = None if fee_history.get('reward') else await self.w3.eth.max_priority_fee
+            fees = _fees_from_history(fee_history, default_priority_fee)
+            if fees is not None:
+                return fees
+        except Exception as e:
+            print(f"Fee history unavailable, using legacy gas price: {e}")
+        return {'gasPrice': await self.w3.eth.gas_price}
+
+
+class AsyncGasEstimator:
+    """Async variant of GasEstimator for AsyncWeb3 contract functions."""
+
+    def __init__(self, w3, margin=GAS_LIMIT_MARGIN):
+        self.w3 = w3
+        self.margin = margin
+        self._estimates = {}
+
+    async def gas_limit(self, contract_function, sender):
+        """Returns the gas limit to send a contract call with; a failed estimate is raised."""
+        key = _call_signature(contract_function, sender)
+        estimate = self._estimates.get(key) if key is not None else None
+        if estimate is None:
+            estimate = await contract_function.estimate_gas({'from': sender})
+            if key is not None:
+                self._estimates[key] = estimate
+        return int(estimate * self.margin)
+
+
+class AsyncGasStrategy:
+    """Async variant of GasStrategy."""
+
+    def __init__(self, w3, fee_ttl=FEE_CACHE_TTL, margin=GAS_LIMIT_MARGIN):
+        self.w3 = w3
+        self.fee_oracle = AsyncFeeOracle(w3, fee_ttl)
+        self.estimator = AsyncGasEstimator(w3, margin)
+
+    async def gas_params(self, contract_function, sender):
+        """Returns the 'gas' and fee fields to merge into the transaction parameters."""
+        return {'gas': await self.estimator.gas_limit(contract_function, sender), **await self.fee_oracle.fees()}
+
+
+_strategies = {}
+_strategies_lock = threading.Lock()
+
+
+def get_gas_strategy(w3):
+    """Returns the GasStrategy (or AsyncGasStrategy) shared by all senders on a connection."""
+    with _strategies_lock:
+        strategy = _strategies.get(id(w3))
+        if strategy is None or strategy.w3 is not w3:
+            strategy_class = AsyncGasStrategy if isinstance(w3, AsyncWeb3) else GasStrategy
+            strategy = strategy_class(w3)
+            _strategies[id(w3)] = strategy
+        return strategy
@@ -0,0 +1,250 @@
+import os
+import glob
+import time
+import argparse
+from dotenv import load_dotenv
+from dab_client import connect_to_web3, get_provenance_contract
+from batch_reader import BatchReader
+
+# Optional columnar backends: Parquet through pyarrow, or NumPy .npz parts
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+HISTORY_EXPORT_DIR = os.getenv("HISTORY_EXPORT_DIR", "history_export")
+
+# Actions written by Provenance._addHistoryRecord
+HISTORY_ACTIONS = ("REGISTERED", "PROCESSED", "CERTIFIED", "ENTITY_TO_ENTITY", "RETAIL_SALE", "SECONDARY_SALE")
+SECONDS_PER_DAY = 86400
+
+
+def parse_history_record(record):
+    """Splits a "timestamp | action | 0xaddr | details" record into (timestamp, action, actor, details).
+
+    Only the first three separators are used, since marketplace details
+    contain " | " themselves. Returns None for records that do not match.
+    """
+    parts = record.split(" | ", 3)
+    if len(parts) < 3 or not parts[0].isdigit():
+        return None
+    timestamp, action, actor = parts[:3]
+    return int(timestamp), action, actor, parts[3] if len(parts) == 4 else ""
+
+
+def _read_chunks(reader, total_supply, chunk_size):
+    """Yields (diamond rows, event rows) for each chunk of diamond IDs, read in batched round trips."""
+    contract = reader.contract
+    functions = ("getDiamondBasicInfo", "getDiamondCertInfo", "getDiamondHistory")
+    for start in range(1, total_supply + 1, chunk_size):
+        diamond_ids = range(start, min(start + chunk_size, total_supply + 1))
+        values = reader.call_many(
+            [(contract, fn_name, (diamond_id,)) for diamond_id in diamond_ids for fn_name in functions],
+            calls_per_chunk=reader.chunk_size * len(functions)
+        )
+        diamonds = []
+        events = []
+        for index, diamond_id in enumerate(diamond_ids):
+            basic_info, cert_info, history = values[index * 3:index * 3 + 3]
+            if basic_info is None or cert_info is None:
+                continue
+            origin, extraction_date, weight, _ = basic_info
+            diamonds.append((diamond_id, origin, extraction_date, weight, cert_info[0], cert_info[2]))
+            for sequence, record in enumerate(history or []):
+                parsed = parse_history_record(record)
+                if parsed is not None:
+                    events.append((diamond_id, sequence, *parsed))
+        yield diamonds, events
+
+
+DIAMOND_COLUMNS = ("diamond_id", "origin", "extraction_date", "weight", "is_certified", "raw_diamond_id")
+EVENT_COLUMNS = ("diamond_id", "sequence", "timestamp", "action", "actor", "details")
+
+
+def _columns(rows, names):
+    return dict(zip(names, zip(*rows))) if rows else {name: () for name in names}
+
+
+class ParquetHistoryWriter:
+    """Appends each chunk as a row group to diamonds.parquet and events.parquet."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.diamond_schema = pa.schema([
+            ("diamond_id", pa.uint64()), ("origin", pa.string()), ("extraction_date", pa.int64()),
+            ("weight", pa.uint64()), ("is_certified", pa.bool_()), ("raw_diamond_id", pa.uint64()),
+        ])
+        self.event_schema = pa.schema([
+            ("diamond_id", pa.uint64()), ("sequence", pa.uint32()), ("timestamp", pa.int64()),
+            ("action", pa.dictionary(pa.int8(), pa.string())), ("actor", pa.string()), ("details", pa.string()),
+        ])
+        self._diamonds = pq.ParquetWriter(os.path.join(directory, "diamonds.parquet"), self.diamond_schema)
+        self._events = pq.ParquetWriter(os.path.join(directory, "events.parquet"), self.event_schema)
+
+    def write(self, diamonds, events):
+        self._diamonds.write_table(pa.table(_columns(diamonds, DIAMOND_COLUMNS), schema=self.diamond_schema))
+        event_columns = _columns(events, EVENT_COLUMNS)
+        event_columns["action"] = pa.array(event_columns["action"], pa.string()).dictionary_encode()
+        self._events.write_table(pa.table(event_columns, schema=self.event_schema))
+
+    def close(self):
+        self._diamonds.close()
+        self._events.close()
+
+
+class NumpyHistoryWriter:
+    """Writes each chunk as a compressed diamonds-NNNNN.npz / events-NNNNN.npz pair."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._part = 0
+
+    def write(self, diamonds, events):
+        diamond_columns = _columns(diamonds, DIAMOND_COLUMNS)
+        event_columns = _columns(events, EVENT_COLUMNS)
+        np.savez_compressed(
+            os.path.join(self.directory, f"diamonds-{self._part:05d}.npz"),
+            diamond_id=np.array(diamond_columns["diamond_id"], dtype=np.uint64),
+            origin=np.array(diamond_columns["origin"], dtype=str),
+            extraction_date=np.array(diamond_columns["extraction_date"], dtype=np.int64),
+            weight=np.array(diamond_columns["weight"], dtype=np.uint64),
+            is_certified=np.array(diamond_columns["is_certified"], dtype=bool),
+            raw_diamond_id=np.array(diamond_columns["raw_diamond_id"], dtype=np.uint64),
+        )
+        np.savez_compressed(
+            os.path.join(self.directory, f"events-{self._part:05d}.npz"),
+            diamond_id=np.array(event_columns["diamond_id"], dtype=np.uint64),
+            sequence=np.array(event_columns["sequence"], dtype=np.uint32),
+            timestamp=np.array(event_columns["timestamp"], dtype=np.int64),
+            # Small integer codes into HISTORY_ACTIONS (-1 for anything unknown)
+            action=np.array([HISTORY_ACTIONS.index(action) if action in HISTORY_ACTIONS else -1
+                             for action in event_columns["action"]], dtype=np.int8),
+            actor=np.array(event_columns["actor"], dtype="<U42"),
+            details=np.array(event_columns["details"], dtype=str),
+        )
+        self._part += 1
+
+    def close(self):
+        pass
+
+
+def export_history(reader, directory=HISTORY_EXPORT_DIR, output_format=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Streams every diamond's history into columnar files, one chunk of diamonds in memory at a time.
+
+    All reads are pinned to the reader's block. Returns (diamonds, events) written.
+    """
+    output_format = output_format or ("parquet" if pq is not None else "npz")
+    if output_format == "parquet" and pq is None:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+    if output_format == "npz" and np is None:
+        raise ImportError("NumPy export needs numpy (pip install numpy)")
+
+    os.makedirs(directory, exist_ok=True)
+    writer = ParquetHistoryWriter(directory) if output_format == "parquet" else NumpyHistoryWriter(directory)
+    total_supply = reader.contract.functions.totalSupply().call(block_identifier=reader.block_identifier)
+    diamond_count = event_count = 0
+    try:
+        for diamonds, events in _read_chunks(reader, total_supply, chunk_size):
+            writer.write(diamonds, events)
+            diamond_count += len(diamonds)
+            event_count += len(events)
+            print(f"Exported {diamond_count}/{total_supply} diamonds, {event_count} history records")
+    finally:
+        writer.close()
+    return diamond_count, event_count
+
+
+def load_columns(directory, table, columns):
+    """Loads the given columns of an export ("diamonds" or "events") as NumPy arrays.
+
+    Event actions always come back as strings, whichever format was written.
+    """
+    if np is None:
+        raise ImportError("Queries need numpy (pip install numpy)")
+    parquet_path = os.path.join(directory, f"{table}.parquet")
+    if os.path.exists(parquet_path):
+        if pq is None:
+            raise ImportError("Reading a Parquet export needs pyarrow (pip install pyarrow)")
+        data = pq.read_table(parquet_path, columns=list(columns))
+        return {name: data.column(name).cast(pa.string()).to_numpy() if name == "action"
+                else data.column(name).to_numpy() for name in columns}
+
+    parts = sorted(glob.glob(os.path.join(directory, f"{table}-*.npz")))
+    if not parts:
+        raise FileNotFoundError(f"No {table} export found in {directory}")
+    loaded = {name: [] for name in columns}
+    for part in parts:
+        with np.load(part) as arrays:
+            for name in columns:
+                loaded[name].append(arrays[name])
+    result = {name: np.concatenate(arrays) for name, arrays in loaded.items()}
+    if "action" in result:
+        result["action"] = np.array(HISTORY_ACTIONS + ("UNKNOWN",))[result["action"]]
+    return result
+
+
+def median_days_to_retail(directory=HISTORY_EXPORT_DIR):
+    """Median days from extraction at the mine to the first retail sale, per mine.
+
+    Origins are grouped by site, without the "#lot" suffix. Returns
+    {origin: (median days, diamonds)} sorted by origin.
+    """
+    events = load_columns(directory, "events", ("diamond_id", "timestamp", "action"))
+    diamonds = load_columns(directory, "diamonds", ("diamond_id", "origin", "extraction_date"))
+
+    # First RETAIL_SALE per diamond (records are stored in chain order)
+    retail = events["action"] == "RETAIL_SALE"
+    retail_ids, first_index = np.unique(events["diamond_id"][retail], return_index=True)
+    retail_timestamps = events["timestamp"][retail][first_index]
+
+    order = np.argsort(diamonds["diamond_id"])
+    positions = order[np.searchsorted(diamonds["diamond_id"], retail_ids, sorter=order)]
+    days = (retail_timestamps - diamonds["extraction_date"][positions]) / SECONDS_PER_DAY
+    sites = np.char.partition(diamonds["origin"][positions].astype(str), " #")[:, 0]
+
+    site_names, site_index = np.unique(sites, return_inverse=True)
+    grouped = np.split(days[np.argsort(site_index, kind="stable")], np.cumsum(np.bincount(site_index))[:-1])
+    return {str(site): (float(np.median(site_days)), len(site_days)) for site, site_days in zip(site_names, grouped)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export diamond histories to columnar files and query them.")
+    parser.add_argument("directory", nargs="?", default=HISTORY_EXPORT_DIR, help="export directory")
+    parser.add_argument("--format", choices=("parquet", "npz"),
+                        help="output format (default: parquet if pyarrow is installed, else npz)")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="diamonds per chunk")
+    parser.add_argument("--query", action="store_true",
+                        help="skip the export and print median days mine -> retail per origin")
+    return parser.parse_args()
+
+
+def main():
+    """Exports all diamond histories, or queries an existing export."""
+    args = parse_args()
+    try:
+        if not args.query:
+            w3 = connect_to_web3()
+            reader = BatchReader(w3, get_provenance_contract(w3), block_identifier=w3.eth.block_number)
+            start = time.perf_counter()
+            diamonds, events = export_history(reader, args.directory, args.format, args.chunk_size)
+            print(f"Wrote {diamonds} diamonds and {events} history records to {args.directory} "
+                  f"in {time.perf_counter() - start:.1f}s ({reader.round_trips} round trips)")
+
+        print("\nMedian days from mine to retail sale:")
+        for origin, (median_days, count) in median_days_to_retail(args.directory).items():
+            print(f"  {origin:<28} {median_days:>8.1f} days  ({count} diamonds)")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import math
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile (nearest rank) of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    """Returns count, mean and p50/p95/p99 of a list of latencies."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def format_summary(summary, unit="s"):
+    """Formats a summarize() result on one line."""
+    return (f"n={summary['count']} mean={summary['mean']:.3f}{unit} p50={summary['p50']:.3f}{unit} "
+            f"p95={summary['p95']:.3f}{unit} p99={summary['p99']:.3f}{unit}")
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import argparse
+from collections import defaultdict
+from xml.etree import ElementTree
+from eth_utils import event_abi_to_log_topic
+from dotenv import load_dotenv
+from dab_client import connect_to_web3, get_provenance_contract
+from batch_reader import BatchReader
+from provenance_index import PROVENANCE_DEPLOY_BLOCK, INDEX_BLOCK_CHUNK, is_log_range_error
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+# Raw diamond IDs OR-ed into one topic filter per eth_getLogs call
+LINEAGE_TOPIC_CHUNK = int(os.getenv("LINEAGE_TOPIC_CHUNK", "100"))
+
+# DiamondRecord fields kept as node attributes in the exported graph
+NODE_ATTRIBUTES = ("origin", "weight", "owner", "is_certified", "certification_id")
+
+
+class LineageGraph:
+    """Raw -> processed diamond forest with memoized descendant and root lookups.
+
+    A diamond's parent is the raw diamond it was processed from; roots are
+    diamonds that were registered by a miner.
+    """
+
+    def __init__(self):
+        self.parents = {}
+        self.children = defaultdict(list)
+        self.attributes = {}
+        self._descendants = {}
+        self._roots = {}
+
+    def add_diamond(self, record):
+        """Adds a diamond (a DiamondRecord) and the edge to the diamond it was processed from."""
+        self.attributes[record.diamond_id] = {name: getattr(record, name) for name in NODE_ATTRIBUTES}
+        self.add_edge(record.raw_diamond_id or None, record.diamond_id)
+
+    def add_edge(self, parent_id, diamond_id):
+        """Records that diamond_id was processed from parent_id (None for raw diamonds)."""
+        if diamond_id in self.parents and self.parents[diamond_id] == parent_id:
+            return
+        self.parents[diamond_id] = parent_id
+        if parent_id is not None:
+            self.parents.setdefault(parent_id, None)
+            self.children[parent_id].append(diamond_id)
+        self._descendants.clear()
+        self._roots.clear()
+
+    def __contains__(self, diamond_id):
+        return diamond_id in self.parents
+
+    def __len__(self):
+        return len(self.parents)
+
+    def roots(self):
+        """Returns the IDs of all diamonds without a parent, in ID order."""
+        return sorted(diamond_id for diamond_id, parent_id in self.parents.items() if parent_id is None)
+
+    def descendants(self, diamond_id):
+        """Returns every diamond processed (directly or indirectly) from diamond_id, in ID order."""
+        cached = self._descendants.get(diamond_id)
+        if cached is None:
+            found = []
+            for child_id in self.children.get(diamond_id, ()):
+                found.append(child_id)
+                found.extend(self.descendants(child_id))
+            cached = self._descendants[diamond_id] = tuple(sorted(found))
+        return cached
+
+    def root_ancestor(self, diamond_id):
+        """Returns the raw diamond at the top of diamond_id's lineage (itself if it is raw)."""
+        path = []
+        current = diamond_id
+        while current not in self._roots:
+            parent_id = self.parents.get(current)
+            if parent_id is None:
+                self._roots[current] = current
+                break
+            path.append(current)
+            current = parent_id
+        root = self._roots[current]
+        # Every diamond on the walked path shares the same root
+        for walked in path:
+            self._roots[walked] = root
+        return root
+
+    def edges(self):
+        """Returns (raw_diamond_id, processed_diamond_id) pairs in ID order."""
+        return sorted((parent_id, diamond_id) for diamond_id, parent_id in self.parents.items() if parent_id is not None)
+
+    def to_dict(self):
+        """JSON-serializable form of the forest."""
+        return {
+            "nodes": [
+                {"id": diamond_id, "root": self.root_ancestor(diamond_id), **self.attributes.get(diamond_id, {})}
+                for diamond_id in sorted(self.parents)
+            ],
+            "edges": [{"source": parent_id, "target": diamond_id} for parent_id, diamond_id in self.edges()],
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_graphml(self, path):
+        """Writes the forest as GraphML (readable by Gephi, yEd, networkx, ...)."""
+        graphml = ElementTree.Element("graphml", xmlns="http://graphml.graphdrawing.org/xmlns")
+        key_types = {"origin": "string", "weight": "long", "owner": "string",
+                     "is_certified": "boolean", "certification_id": "string"}
+        for name in NODE_ATTRIBUTES:
+            ElementTree.SubElement(graphml, "key", id=name, attrib={
+                "for": "node", "attr.name": name, "attr.type": key_types[name]
+            })
+        graph = ElementTree.SubElement(graphml, "graph", id="lineage", edgedefault="directed")
+        for diamond_id in sorted(self.parents):
+            node = ElementTree.SubElement(graph, "node", id=f"d{diamond_id}")
+            for name, value in self.attributes.get(diamond_id, {}).items():
+                data = ElementTree.SubElement(node, "data", key=name)
+                data.text = str(value).lower() if isinstance(value, bool) else str(value)
+        for parent_id, diamond_id in self.edges():
+            ElementTree.SubElement(graph, "edge", source=f"d{parent_id}", target=f"d{diamond_id}")
+        ElementTree.ElementTree(graphml).write(path, encoding="utf-8", xml_declaration=True)
+
+
+def build_full_lineage(reader):
+    """Builds the forest of the whole supply from batched diamond reads.
+
+    Every diamond's getDiamondCertInfo names the raw diamond it came from, so
+    reading all of them once gives every edge without walking the tree.
+    """
+    total_supply = reader.contract.functions.totalSupply().call(block_identifier=reader.block_identifier)
+    graph = LineageGraph()
+    for _, record in reader.read_diamonds(range(1, total_supply + 1)):
+        if record is not None:
+            graph.add_diamond(record)
+    return graph
+
+
+def _processed_children(contract, raw_diamond_ids, from_block=PROVENANCE_DEPLOY_BLOCK):
+    """Returns {raw diamond ID: [processed diamond IDs]} from DiamondProcessed logs.
+
+    The raw IDs are OR-ed into the first indexed topic, so one eth_getLogs call
+    answers a whole BFS level of up to LINEAGE_TOPIC_CHUNK diamonds. Only
+    when the provider rejects the range is it scanned in INDEX_BLOCK_CHUNK
+    chunks, which needs a deploy block to start from.
+    """
+    w3 = contract.w3
+    event_topic = "0x" + event_abi_to_log_topic(contract.events.DiamondProcessed.abi).hex()
+    raw_diamond_ids = sorted(raw_diamond_ids)
+    children = defaultdict(list)
+    for start in range(0, len(raw_diamond_ids), LINEAGE_TOPIC_CHUNK):
+        id_topics = ["0x" + diamond_id.to_bytes(32, "big").hex()
+                     for diamond_id in raw_diamond_ids[start:start + LINEAGE_TOPIC_CHUNK]]
+        log_filter = {'address': contract.address, 'topics': [event_topic, id_topics]}
+        try:
+            logs = w3.eth.get_logs({**log_filter, 'fromBlock': from_block, 'toBlock': 'latest'})
+        except Exception as e:
+            if not is_log_range_error(e):
+                raise
+            if not from_block:
+                raise ValueError("The provider caps eth_getLogs ranges; set PROVENANCE_DEPLOY_BLOCK so the "
+                                 "chunked scan does not start at genesis") from e
+            # Provider caps the block range; walk it in index-sized chunks instead
+            logs = []
+            latest_block = w3.eth.block_number
+            for chunk_start in range(from_block, latest_block + 1, INDEX_BLOCK_CHUNK):
+                logs.extend(w3.eth.get_logs({
+                    **log_filter, 'fromBlock': chunk_start,
+                    'toBlock': min(chunk_start + INDEX_BLOCK_CHUNK - 1, latest_block)
+                }))
+        for log in logs:
+            event = contract.events.DiamondProcessed().process_log(log)
+            children[event.args.rawDiamondId].append(event.args.newDiamondId)
+    return children
+
+
+def build_lineage(reader, diamond_ids, from_block=PROVENANCE_DEPLOY_BLOCK):
+    """Builds the lineage trees containing the given diamonds with a breadth-first fan-out.
+
+    Each BFS level costs one batched read of the level's diamonds (upwards,
+    through getDiamondCertInfo) and one eth_getLogs call per
+    LINEAGE_TOPIC_CHUNK diamonds (downwards, through DiamondProcessed).
+    """
+    graph = LineageGraph()
+    seen = set()
+    level = set(diamond_ids)
+    while level:
+        seen |= level
+        next_level = set()
+        for diamond_id, record in reader.read_diamonds(sorted(level)):
+            if record is None:
+                print(f"Diamond ID {diamond_id} does not exist or error occurred")
+                continue
+            graph.add_diamond(record)
+            if record.raw_diamond_id and record.raw_diamond_id not in seen:
+                next_level.add(record.raw_diamond_id)
+        for child_ids in _processed_children(reader.contract, level, from_block).values():
+            next_level.update(child_id for child_id in child_ids if child_id not in seen)
+        level = next_level
+    return graph
+
+
+def print_lineage(graph, diamond_id, depth=0):
+    """Prints a diamond and everything processed from it as an indented tree."""
+    attributes = graph.attributes.get(diamond_id, {})
+    certified = f" [certified {attributes['certification_id']}]" if attributes.get("is_certified") else ""
+    print(f"{'  ' * depth}#{diamond_id} {attributes.get('origin', '')}{certified}")
+    for child_id in sorted(graph.children.get(diamond_id, ())):
+        print_lineage(graph, child_id, depth + 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build and export the raw -> processed diamond lineage graph.")
+    parser.add_argument("diamond_ids", nargs="*", type=int,
+                        help="diamonds whose lineage trees to build (default: the whole supply)")
+    parser.add_argument("--json", help="write the graph as JSON to this path")
+    parser.add_argument("--graphml", help="write the graph as GraphML to this path")
+    parser.add_argument("--descendants", type=int, help="list every diamond processed from this diamond")
+    parser.add_argument("--root", type=int, help="show the raw diamond this diamond descends from")
+    return parser.parse_args()
+
+
+def main():
+    """Builds the lineage forest and prints or exports it."""
+    args = parse_args()
+    try:
+        w3 = connect_to_web3()
+        reader = BatchReader(w3, get_provenance_contract(w3))
+
+        start = time.perf_counter()
+        graph = build_lineage(reader, args.diamond_ids) if args.diamond_ids else build_full_lineage(reader)
+        elapsed = time.perf_counter() - start
+        print(f"Built lineage of {len(graph)} diamonds ({len(graph.roots())} raw) "
+              f"in {elapsed:.2f}s, {reader.round_trips} read round trips")
+
+        if args.descendants is not None:
+            print(f"Descendants of #{args.descendants}: {list(graph.descendants(args.descendants))}")
+        if args.root is not None:
+            print(f"Root ancestor of #{args.root}: #{graph.root_ancestor(args.root)}")
+        if args.json:
+            graph.write_json(args.json)
+            print(f"JSON written to {args.json}")
+        if args.graphml:
+            graph.write_graphml(args.graphml)
+            print(f"GraphML written to {args.graphml}")
+        if args.descendants is None and args.root is None and not args.json and not args.graphml:
+            for root_id in graph.roots():
+                print_lineage(graph, root_id)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import json
+import time
+import asyncio
+import argparse
+import contextvars
+from collections import Counter, defaultdict
+from web3 import AsyncWeb3, Web3
+from web3.providers.rpc import AsyncHTTPProvider
+from async_client import async_load_contract, AsyncTransactionSender, async_disconnect
+from async_lifecycle import async_run_lifecycle
+from local_chain import ANVIL_PRIVATE_KEYS, connect_eth_tester, setup_local_chain
+from latency_stats import summarize, format_summary
+
+LIFECYCLE_STEPS = (
+    "register", "transfer_to_manufacturer", "process", "transfer_to_certifier", "certify", "transfer_to_retailer"
+)
+
+# (step name, lifecycle number) of the step the current task is running
+current_step = contextvars.ContextVar("current_step", default=(None, None))
+
+
+class LoadTestRecorder:
+    """Collects per-step latency, gas used and failure causes for a load test."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.gas_used = defaultdict(list)
+        self.failures = Counter()
+        self.gas_per_diamond = defaultdict(int)
+        self.transactions = 0
+        self.completed_lifecycles = set()
+
+    def record_receipt(self, receipt):
+        """Receipt hook for AsyncTransactionSender.on_receipt."""
+        step_name, lifecycle = current_step.get()
+        self.transactions += 1
+        self.gas_used[step_name].append(receipt.gasUsed)
+        self.gas_per_diamond[lifecycle] += receipt.gasUsed
+
+    def step_wrapper(self, lifecycle):
+        """Returns a `step` callable for async_run_lifecycle that times each step."""
+        async def step(step_name, step_coroutine):
+            token = current_step.set((step_name, lifecycle))
+            start = time.perf_counter()
+            try:
+                result = await step_coroutine
+            except Exception as e:
+                self.failures[(step_name, _failure_cause(e))] += 1
+                raise
+            finally:
+                current_step.reset(token)
+            self.latencies[step_name].append(time.perf_counter() - start)
+            return result
+        return step
+
+    def summary(self, elapsed, diamonds):
+        """Builds the JSON-serializable load-test summary."""
+        completed_gas = [self.gas_per_diamond[lifecycle] for lifecycle in sorted(self.completed_lifecycles)]
+        return {
+            "diamonds": diamonds,
+            "completed": len(self.completed_lifecycles),
+            "elapsed_seconds": elapsed,
+            "transactions": self.transactions,
+            "tx_per_second": self.transactions / elapsed if elapsed else 0.0,
+            "gas_per_diamond": summarize(completed_gas),
+            "steps": {
+                step_name: {
+                    "latency_seconds": summarize(self.latencies[step_name]),
+                    "gas_used": summarize(self.gas_used[step_name]),
+                }
+                for step_name in LIFECYCLE_STEPS
+            },
+            "failures": [
+                {"step": step_name, "cause": cause, "count": count}
+                for (step_name, cause), count in self.failures.most_common()
+            ],
+        }
+
+
+def _failure_cause(error):
+    """Short, groupable description of why a step failed."""
+    message = str(error).splitlines()[0] if str(error) else ""
+    return f"{type(error).__name__}: {message[:120]}"
+
+
+async def run_load_test(w3, contract, senders, retailer_address, diamonds, rate):
+    """Starts `diamonds` lifecycles at `rate` per second (0 = all at once) and records metrics."""
+    recorder = LoadTestRecorder()
+    for sender in senders:
+        sender.on_receipt = recorder.record_receipt
+
+    async def run_one(lifecycle):
+        try:
+            await async_run_lifecycle(contract, senders, retailer_address, f"[{lifecycle + 1}/{diamonds}] ",
+                                      step=recorder.step_wrapper(lifecycle))
+            recorder.completed_lifecycles.add(lifecycle)
+        except Exception:
+            pass
+
+    start = time.perf_counter()
+    tasks = []
+    for lifecycle in range(diamonds):
+        tasks.append(asyncio.create_task(run_one(lifecycle)))
+        if rate > 0:
+            await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+    return recorder.summary(time.perf_counter() - start, diamonds)
+
+
+def print_summary(summary):
+    """Prints the load-test summary as a table."""
+    print("\n=== LOAD TEST SUMMARY ===")
+    print(f"Diamonds: {summary['diamonds']}  Completed: {summary['completed']}  "
+          f"Elapsed: {summary['elapsed_seconds']:.1f}s")
+    print(f"Transactions: {summary['transactions']}  Throughput: {summary['tx_per_second']:.2f} tx/s")
+    print(f"Gas per diamond: {format_summary(summary['gas_per_diamond'], unit='')}")
+    print("\nPer-step latency:")
+    for step_name, step in summary["steps"].items():
+        print(f"  {step_name:<26} {format_summary(step['latency_seconds'])}  "
+              f"gas p50={step['gas_used']['p50']:.0f}")
+    if summary["failures"]:
+        print("\nFailures:")
+        for failure in summary["failures"]:
+            print(f"  {failure['step']}: {failure['cause']} (x{failure['count']})")
+
+
+async def async_main(args):
+    if args.eth_tester:
+        from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+        sync_w3, private_keys = connect_eth_tester()
+        entity_contract, provenance_contract, _ = setup_local_chain(sync_w3, private_keys)
+        # Share the in-process chain between the sync deploy and the async run
+        provider = AsyncEthereumTesterProvider()
+        provider.ethereum_tester = sync_w3.provider.ethereum_tester
+        w3 = AsyncWeb3(provider)
+    else:
+        sync_w3 = Web3(Web3.HTTPProvider(args.rpc_url))
+        private_keys = ANVIL_PRIVATE_KEYS
+        entity_contract, provenance_contract, _ = setup_local_chain(sync_w3, private_keys)
+        w3 = AsyncWeb3(AsyncHTTPProvider(args.rpc_url))
+    print(f"Deployed Provenance at {provenance_contract.address}")
+
+    try:
+        contract = async_load_contract(w3, provenance_contract.address, provenance_contract.abi)
+        chain_id = await w3.eth.chain_id
+        senders = tuple(AsyncTransactionSender(w3, private_key, chain_id) for private_key in private_keys[1:4])
+        retailer_address = AsyncTransactionSender(w3, private_keys[4], chain_id).address
+        summary = await run_load_test(w3, contract, senders, retailer_address, args.diamonds, args.rate)
+    finally:
+        if not args.eth_tester:
+            await async_disconnect(w3)
+
+    print_summary(summary)
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nSummary written to {args.output}")
+
+
+def main():
+    """Runs N concurrent diamond lifecycles against a local dev chain and reports metrics."""
+    parser = argparse.ArgumentParser(description="Load-test the diamond lifecycle on a local dev chain.")
+    parser.add_argument("--diamonds", type=int, default=20, help="number of diamond lifecycles to run")
+    parser.add_argument("--rate", type=float, default=5.0, help="lifecycles started per second (0 = all at once)")
+    parser.add_argument("--rpc-url", default="http://127.0.0.1:8545", help="dev chain RPC URL (e.g. anvil)")
+    parser.add_argument("--eth-tester", action="store_true", help="use an in-process eth-tester chain instead")
+    parser.add_argument("--output", default="load_test_summary.json", help="where to write the JSON summary")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(async_main(args))
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import os
+import json
+from web3 import Web3
+from eth_account import Account
+from dab_client import get_account
+
+# Compiled Remix artifacts of the contracts in ../contracts
+ARTIFACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "contracts", "artifacts")
+
+# Default funded dev accounts of anvil / hardhat (public test keys, never use on a real network)
+ANVIL_PRIVATE_KEYS = [
+    "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80",
+    "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d",
+    "0x5de4111afa1a4b94908f83103eb1f1706367c2e68ca870fc3fb9a804cdab365a",
+    "0x7c852118294e51e653712a81e05800f419141751be58f605c371e15141b007a6",
+    "0x47e179ec197488593b187f80a00eb0da91f1b9d0b13f8733639f19c30a34926a",
+]
+
+# Role and required license prefix, in the order of the keys after the deployer
+LOCAL_ENTITIES = (("Miner", "a"), ("Manufacturer", "b"), ("Certifier", "c"), ("Retailer", "d"))
+
+
+def load_artifact(name):
+    """Returns (abi, bytecode) of a compiled contract artifact."""
+    with open(os.path.join(ARTIFACTS_DIR, f"{name}.json"), 'r') as f:
+        artifact = json.load(f)
+    return artifact['abi'], artifact['data']['bytecode']['object']
+
+
+def send_local_tx(w3, private_key, contract_function):
+    """Signs and sends a transaction on a dev chain and waits for its receipt."""
+    address = get_account(private_key).address
+    transaction = contract_function.build_transaction({
+        'from': address,
+        'nonce': w3.eth.get_transaction_count(address, "pending"),
+        'gasPrice': w3.eth.gas_price,
+        'chainId': w3.eth.chain_id
+    })
+    signed_tx = Account.sign_transaction(transaction, private_key)
+    receipt = w3.eth.wait_for_transaction_receipt(w3.eth.send_raw_transaction(signed_tx.raw_transaction))
+    if receipt.status != 1:
+        raise Exception(f"Local transaction {receipt.transactionHash.hex()} reverted")
+    return receipt
+
+
+def deploy_contract(w3, private_key, name, *args):
+    """Deploys a contract artifact and returns the contract instance."""
+    abi, bytecode = load_artifact(name)
+    receipt = send_local_tx(w3, private_key, w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args))
+    return w3.eth.contract(address=receipt.contractAddress, abi=abi)
+
+
+def deploy_local_contracts(w3, deployer_key):
+    """Deploys EntityContract, Provenance and Marketplace and authorizes the marketplace.
+
+    Returns (entity_contract, provenance_contract, marketplace_contract).
+    """
+    entity_contract = deploy_contract(w3, deployer_key, "EntityContract")
+    provenance_contract = deploy_contract(w3, deployer_key, "Provenance", entity_contract.address)
+    marketplace_contract = deploy_contract(w3, deployer_key, "Marketplace", provenance_contract.address)
+    send_local_tx(w3, deployer_key, provenance_contract.functions.setMarketplaceAuthorization(
+        marketplace_contract.address, True
+    ))
+    return entity_contract, provenance_contract, marketplace_contract
+
+
+def register_local_entities(w3, entity_contract, entity_keys):
+    """Registers miner, manufacturer, certifier and retailer accounts (in that order)."""
+    for private_key, (role, license_prefix) in zip(entity_keys, LOCAL_ENTITIES):
+        send_local_tx(w3, private_key, entity_contract.functions.registerEntity(
+            f"Local {role}", "Canada", role, f"{license_prefix}-LOCAL-{role.upper()}"
+        ))
+
+
+def connect_eth_tester():
+    """Creates an in-process eth-tester chain, returns (w3, funded private keys).
+
+    Needs the optional eth-tester[py-evm] package.
+    """
+    from web3 import EthereumTesterProvider
+
+    provider = EthereumTesterProvider()
+    keys = [key.to_hex() for key in provider.ethereum_tester.backend.account_keys]
+    return Web3(provider), keys
+
+
+def setup_local_chain(w3, private_keys):
+    """Deploys the contracts and registers the entity accounts on a dev chain.
+
+    private_keys[0] deploys, private_keys[1:5] become miner, manufacturer,
+    certifier and retailer. Returns (entity_contract, provenance_contract, marketplace_contract).
+    """
+    entity_contract, provenance_contract, marketplace_contract = deploy_local_contracts(w3, private_keys[0])
+    register_local_entities(w3, entity_contract, private_keys[1:5])
+    return entity_contract, provenance_contract, marketplace_contract
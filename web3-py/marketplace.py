@@ -0,0 +1,218 @@
+import os
+import time
+import argparse
+import threading
+from typing import NamedTuple, Optional
+from eth_utils import event_abi_to_log_topic
+from dotenv import load_dotenv
+from dab_client import connect_to_web3, get_marketplace_contract, get_provenance_contract
+from batch_reader import BatchReader
+from provenance_index import INDEX_BLOCK_CHUNK, INDEX_CONFIRMATIONS
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+MARKETPLACE_PAGE_SIZE = int(os.getenv("MARKETPLACE_PAGE_SIZE", "20"))
+MARKETPLACE_POLL_INTERVAL = float(os.getenv("MARKETPLACE_POLL_INTERVAL", "12"))
+
+MARKETPLACE_EVENTS = (
+    "DiamondListed", "DiamondSold", "ListingCancelled", "DiamondReportedStolen", "StolenReportResolved"
+)
+# Provenance events that change what getDiamondDetails returns for a listed diamond
+DETAIL_EVENTS = ("DiamondTransferred", "DiamondCertified")
+
+
+class Listing(NamedTuple):
+    listing_id: int
+    diamond_id: int
+    seller: str
+    listed_at: Optional[int]  # None until hydrated for listings learned from events
+
+
+class DiamondDetails(NamedTuple):
+    """Result of Marketplace.getDiamondDetails."""
+    owner: str
+    is_listed: bool
+    is_reported_stolen: bool
+    origin: str
+    weight: int
+    is_certified: bool
+    certification_id: str
+
+
+class ActiveListingCache:
+    """In-memory view of the marketplace's active listings.
+
+    seed() reads getActiveListings once; sync() then applies DiamondListed,
+    DiamondSold, ListingCancelled, DiamondReportedStolen and
+    StolenReportResolved logs, so the cost of staying current depends on new
+    activity instead of the all-time listing count. Diamond details are
+    hydrated in batches when a page is served and kept until a sale or a
+    provenance transfer/certification of that diamond invalidates them.
+    """
+
+    def __init__(self, w3, marketplace, provenance=None, reader=None):
+        self.w3 = w3
+        self.marketplace = marketplace
+        self.provenance = provenance
+        self.reader = reader or BatchReader(w3)
+        self.listings = {}
+        self.block_number = None
+        self._details = {}
+        self._lock = threading.Lock()
+        self._topics = {
+            event_abi_to_log_topic(marketplace.events[event_name].abi): event_name
+            for event_name in MARKETPLACE_EVENTS
+        }
+        self._detail_topics = [
+            "0x" + event_abi_to_log_topic(provenance.events[event_name].abi).hex() for event_name in DETAIL_EVENTS
+        ] if provenance is not None else []
+
+    def seed(self, block_identifier=None):
+        """Loads the active listings as of one block. Costs one getActiveListings call plus batched details."""
+        block_number = self.w3.eth.block_number if block_identifier is None else block_identifier
+        listing_ids = self.marketplace.functions.getActiveListings().call(block_identifier=block_number)
+        reader = BatchReader(self.w3, chunk_size=self.reader.chunk_size, mode=self.reader.mode,
+                             block_identifier=block_number)
+        rows = reader.call_many([(self.marketplace, "getListingDetails", (listing_id,)) for listing_id in listing_ids])
+        with self._lock:
+            self.listings = {
+                listing_id: Listing(listing_id, row[0], row[1], row[3])
+                for listing_id, row in zip(listing_ids, rows) if row is not None and row[2]
+            }
+            self._details = {}
+            self.block_number = block_number
+        return len(self.listings)
+
+    def sync(self, to_block=None, chunk_size=INDEX_BLOCK_CHUNK):
+        """Applies marketplace events since the last seed/sync. Returns the number of events applied."""
+        if self.block_number is None:
+            self.seed()
+            return 0
+        if to_block is None:
+            to_block = self.w3.eth.block_number - INDEX_CONFIRMATIONS
+
+        applied = 0
+        from_block = self.block_number + 1
+        while from_block <= to_block:
+            end_block = min(from_block + chunk_size - 1, to_block)
+            logs = self.w3.eth.get_logs({
+                'address': self.marketplace.address,
+                'fromBlock': from_block,
+                'toBlock': end_block,
+                'topics': [["0x" + topic.hex() for topic in self._topics]]
+            })
+            detail_logs = self.w3.eth.get_logs({
+                'address': self.provenance.address,
+                'fromBlock': from_block,
+                'toBlock': end_block,
+                'topics': [self._detail_topics]
+            }) if self.provenance is not None else []
+            with self._lock:
+                for log in logs:
+                    self._apply_log(log)
+                for log in detail_logs:
+                    # topics[1] is the indexed diamondId of both detail events
+                    self._details.pop(int.from_bytes(log["topics"][1], "big"), None)
+                self.block_number = end_block
+            applied += len(logs)
+            from_block = end_block + 1
+        return applied
+
+    def _apply_log(self, log):
+        event_name = self._topics.get(bytes(log["topics"][0]))
+        if event_name is None:
+            return
+        args = self.marketplace.events[event_name]().process_log(log).args
+        if event_name == "DiamondListed":
+            self.listings[args.listingId] = Listing(args.listingId, args.diamondId, args.seller, None)
+        elif event_name in ("DiamondSold", "ListingCancelled"):
+            self.listings.pop(args.listingId, None)
+        elif event_name == "DiamondReportedStolen":
+            # Reporting a diamond stolen also deactivates its listing
+            for listing in [listing for listing in self.listings.values() if listing.diamond_id == args.diamondId]:
+                del self.listings[listing.listing_id]
+        # Listing state and the stolen flag are part of the diamond's details
+        self._details.pop(args.diamondId, None)
+
+    def active_listing_ids(self):
+        with self._lock:
+            return sorted(self.listings)
+
+    def page(self, page=0, page_size=MARKETPLACE_PAGE_SIZE):
+        """Returns (Listing, DiamondDetails or None) pairs for one page of active listings, oldest first.
+
+        Only details missing from memory are read, in one batched round trip.
+        """
+        with self._lock:
+            listings = [self.listings[listing_id] for listing_id in sorted(self.listings)]
+        listings = listings[page * page_size:(page + 1) * page_size]
+        self._hydrate(listings)
+        with self._lock:
+            return [
+                (self.listings.get(listing.listing_id, listing), self._details.get(listing.diamond_id))
+                for listing in listings
+            ]
+
+    def _hydrate(self, listings):
+        with self._lock:
+            missing_details = [listing.diamond_id for listing in listings if listing.diamond_id not in self._details]
+            missing_dates = [listing.listing_id for listing in listings if listing.listed_at is None]
+        calls = [(self.marketplace, "getDiamondDetails", (diamond_id,)) for diamond_id in missing_details]
+        calls += [(self.marketplace, "getListingDetails", (listing_id,)) for listing_id in missing_dates]
+        if not calls:
+            return
+        results = self.reader.call_many(calls)
+        with self._lock:
+            for diamond_id, row in zip(missing_details, results):
+                if row is not None:
+                    self._details[diamond_id] = DiamondDetails(*row)
+            for listing_id, row in zip(missing_dates, results[len(missing_details):]):
+                if row is not None and listing_id in self.listings:
+                    self.listings[listing_id] = self.listings[listing_id]._replace(listed_at=row[3])
+
+
+def print_page(cache, page, page_size):
+    """Prints one page of active listings."""
+    total = len(cache.active_listing_ids())
+    print(f"\n=== ACTIVE LISTINGS (page {page + 1}, {total} total, block {cache.block_number}) ===")
+    for listing, details in cache.page(page, page_size):
+        listed_at = time.strftime('%Y-%m-%d', time.localtime(listing.listed_at)) if listing.listed_at else "?"
+        line = f"Listing {listing.listing_id}: diamond {listing.diamond_id} by {listing.seller}, listed {listed_at}"
+        if details is not None:
+            certified = f", certified {details.certification_id}" if details.is_certified else ""
+            line += f" - {details.origin}, {details.weight / 100} carats{certified}"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Browse the marketplace's active listings.")
+    parser.add_argument("--page", type=int, default=1, help="page to show (1-based)")
+    parser.add_argument("--page-size", type=int, default=MARKETPLACE_PAGE_SIZE, help="listings per page")
+    parser.add_argument("--watch", action="store_true", help="keep following marketplace events")
+    return parser.parse_args()
+
+
+def main():
+    """Seeds the active-listing cache and prints a page, optionally following new events."""
+    args = parse_args()
+    try:
+        w3 = connect_to_web3()
+        cache = ActiveListingCache(w3, get_marketplace_contract(w3), get_provenance_contract(w3))
+        start = time.perf_counter()
+        cache.seed()
+        print(f"Seeded {len(cache.active_listing_ids())} active listings in {time.perf_counter() - start:.2f}s")
+        print_page(cache, args.page - 1, args.page_size)
+
+        while args.watch:
+            time.sleep(MARKETPLACE_POLL_INTERVAL)
+            if cache.sync():
+                print_page(cache, args.page - 1, args.page_size)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
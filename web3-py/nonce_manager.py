@@ -0,0 +1,313 @@
+import os
+import time
+import heapq
+import threading
+from concurrent.futures import Future
+from web3.exceptions import TransactionNotFound, TimeExhausted
+from eth_account import Account
+from dab_client import get_account
+from gas_strategy import get_gas_strategy
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "16"))
+RECEIPT_TIMEOUT = int(os.getenv("RECEIPT_TIMEOUT", "180"))
+RECEIPT_POLL_INTERVAL = float(os.getenv("RECEIPT_POLL_INTERVAL", "2"))
+
+# Send errors that mean the nonce is already used (geth, erigon/besu, nethermind)
+NONCE_TOO_LOW_MESSAGES = ("nonce too low", "nonce has already been used", "oldnonce")
+
+
+class TransactionDropped(Exception):
+    """Raised when a sent transaction was dropped from the mempool or replaced."""
+
+
+class NonceTooLow(Exception):
+    """Raised when the node rejects a send because another transaction already used its nonce."""
+
+
+class NonceManager:
+    """Hands out consecutive nonces for one account without asking the node each time.
+
+    A nonce is reserved from allocate() until it is either sent (sent()) or
+    given back unused (release()). Released nonces are handed out again
+    before new ones, so a failed build or send leaves no gap. Resyncing with
+    the node only moves forward and waits until no nonce is reserved, so a
+    nonce is never handed out twice.
+    """
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next_nonce = None
+        self._reserved = set()
+        self._released = []
+        self._resync_requested = False
+
+    def allocate(self):
+        """Reserves the next nonce for this account."""
+        with self._lock:
+            if self._released:
+                nonce = heapq.heappop(self._released)
+            else:
+                if self._next_nonce is None:
+                    self._next_nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+                nonce = self._next_nonce
+                self._next_nonce += 1
+            self._reserved.add(nonce)
+            return nonce
+
+    def sent(self, nonce):
+        """Marks a reserved nonce as used by a transaction the node accepted."""
+        with self._lock:
+            self._reserved.discard(nonce)
+            self._resync_if_requested()
+
+    def release(self, nonce):
+        """Gives back a nonce that no sent transaction uses (failed build or rejected send)."""
+        with self._lock:
+            if nonce in self._reserved:
+                self._reserved.discard(nonce)
+                heapq.heappush(self._released, nonce)
+            self._resync_if_requested()
+
+    def refill(self, nonce):
+        """Hands out the nonce of a transaction dropped from the mempool again, so later nonces are not stuck."""
+        with self._lock:
+            if nonce not in self._released:
+                heapq.heappush(self._released, nonce)
+
+    def resync(self):
+        """Catches up with the node's pending nonce after another sender used ours ("nonce too low").
+
+        Deferred while any nonce is reserved, and never moves backwards.
+        """
+        with self._lock:
+            self._resync_requested = True
+            self._resync_if_requested()
+
+    def _resync_if_requested(self):
+        if not self._resync_requested or self._reserved:
+            return
+        self._resync_requested = False
+        node_nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+        self._next_nonce = max(self._next_nonce or 0, node_nonce)
+        self._released = [nonce for nonce in self._released if nonce >= node_nonce]
+        heapq.heapify(self._released)
+        print(f"Nonce for {self.address} resynced to {self._next_nonce}")
+
+
+class PendingTransaction:
+    """A sent transaction whose receipt has not been collected yet."""
+
+    def __init__(self, tx_hash, nonce, description):
+        self.tx_hash = tx_hash
+        self.nonce = nonce
+        self.description = description
+        self.sent_at = time.time()
+        self.future = Future()
+
+    def result(self, timeout=None):
+        """Blocks until the receipt is collected and returns it."""
+        return self.future.result(timeout)
+
+
+class TransactionPipeline:
+    """Submits transactions for one account without waiting for each receipt.
+
+    Up to max_in_flight transactions can be pending at once. A background
+    thread polls the account's mined nonce once per interval and only fetches
+    receipts for transactions whose nonce has been mined.
+    """
+
+    def __init__(self, w3, private_key, chain_id, max_in_flight=MAX_IN_FLIGHT,
+                 receipt_timeout=RECEIPT_TIMEOUT, poll_interval=RECEIPT_POLL_INTERVAL):
+        self.w3 = w3
+        self.private_key = private_key
+        self.chain_id = chain_id
+        self.address = get_account(private_key).address
+        self.nonces = NonceManager(w3, self.address)
+        self.gas = get_gas_strategy(w3)
+        self.max_in_flight = max_in_flight
+        self.receipt_timeout = receipt_timeout
+        self.poll_interval = poll_interval
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._collector = None
+
+    def build_transaction(self, contract_function, nonce):
+        """Builds the transaction parameters for a contract call."""
+        tx_params = {
+            'from': self.address,
+            'nonce': nonce,
+            'chainId': self.chain_id,
+            **self.gas.gas_params(contract_function, self.address)
+        }
+        return contract_function.build_transaction(tx_params)
+
+    def sign(self, contract_function):
+        """Allocates a nonce and signs a contract call without sending it."""
+        nonce = self.nonces.allocate()
+        try:
+            transaction = self.build_transaction(contract_function, nonce)
+        except Exception:
+            # The reserved nonce was never used, so hand it out again
+            self.nonces.release(nonce)
+            raise
+        return Account.sign_transaction(transaction, self.private_key), nonce
+
+    def submit(self, contract_function, description=None, signed=None):
+        """Signs (unless already signed) and sends a transaction, returning a PendingTransaction.
+
+        Blocks only while max_in_flight transactions are already pending.
+        """
+        self._slots.acquire()
+        try:
+            signed_tx, nonce = signed or self.sign(contract_function)
+            try:
+                tx_hash = self._send(signed_tx, nonce)
+            except NonceTooLow:
+                if signed is not None:
+                    raise
+                # Another sender used this nonce; catch up and sign again
+                signed_tx, nonce = self.sign(contract_function)
+                tx_hash = self._send(signed_tx, nonce)
+        except Exception:
+            self._slots.release()
+            raise
+
+        pending = PendingTransaction(tx_hash, nonce, description or contract_function.fn_name)
+        with self._pending_lock:
+            self._pending[tx_hash] = pending
+            self._start_collector()
+        return pending
+
+    def _send(self, signed_tx, nonce):
+        """Sends a signed transaction and settles its nonce: sent, used by someone else, or released."""
+        try:
+            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        except Exception as e:
+            if self._transaction_known(signed_tx.hash):
+                # The send failed in transport after the node accepted it
+                self.nonces.sent(nonce)
+                return signed_tx.hash
+            if self._nonce_used(e, nonce):
+                self.nonces.sent(nonce)
+                self.nonces.resync()
+                raise NonceTooLow(str(e)) from e
+            self.nonces.release(nonce)
+            raise
+        self.nonces.sent(nonce)
+        return tx_hash
+
+    def _nonce_used(self, error, nonce):
+        """True when a failed send's nonce is taken by another transaction.
+
+        Nodes word this differently (eth-tester says "Invalid transaction nonce"
+        for both too low and too high), so anything but a known "too low"
+        message is settled by the node's pending nonce.
+        """
+        if any(text in str(error).lower() for text in NONCE_TOO_LOW_MESSAGES):
+            return True
+        try:
+            return self.w3.eth.get_transaction_count(self.address, "pending") > nonce
+        except Exception:
+            return False
+
+    def _transaction_known(self, tx_hash):
+        try:
+            self.w3.eth.get_transaction(tx_hash)
+            return True
+        except Exception:
+            return False
+
+    def wait_all(self, pending_txs=None):
+        """Waits for the given (default: all still pending) transactions.
+
+        Returns a receipt or the raised exception for each transaction, in order.
+        """
+        if pending_txs is None:
+            with self._pending_lock:
+                pending_txs = list(self._pending.values())
+        results = []
+        for tx in pending_txs:
+            try:
+                results.append(tx.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def in_flight(self):
+        """Returns the number of transactions still waiting for a receipt."""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def _start_collector(self):
+        if self._collector is None or not self._collector.is_alive():
+            self._collector = threading.Thread(target=self._collect_receipts, daemon=True)
+            self._collector.start()
+
+    def _collect_receipts(self):
+        while True:
+            with self._pending_lock:
+                if not self._pending:
+                    self._collector = None
+                    return
+                pending = sorted(self._pending.values(), key=lambda tx: tx.nonce)
+            try:
+                self._poll(pending)
+            except Exception as e:
+                print(f"Receipt collection error: {e}")
+            time.sleep(self.poll_interval)
+
+    def _poll(self, pending):
+        # Everything below the mined nonce is either in a block or was replaced
+        mined_nonce = self.w3.eth.get_transaction_count(self.address, "latest")
+        for tx in pending:
+            if tx.nonce < mined_nonce:
+                try:
+                    self._resolve(tx, receipt=self.w3.eth.get_transaction_receipt(tx.tx_hash))
+                except TransactionNotFound:
+                    # Another transaction with the same nonce was mined; no gap is left behind
+                    self._resolve(tx, error=TransactionDropped(
+                        f"Transaction {tx.tx_hash.hex()} (nonce {tx.nonce}) was replaced"))
+            elif time.time() - tx.sent_at > self.receipt_timeout:
+                try:
+                    self.w3.eth.get_transaction(tx.tx_hash)
+                    self._resolve(tx, error=TimeExhausted(
+                        f"Transaction {tx.tx_hash.hex()} not mined after {self.receipt_timeout} seconds"))
+                except TransactionNotFound:
+                    self._resolve(tx, error=TransactionDropped(
+                        f"Transaction {tx.tx_hash.hex()} (nonce {tx.nonce}) was dropped from the mempool"))
+                    # Later nonces are stuck behind the gap until it is refilled
+                    self.nonces.refill(tx.nonce)
+
+    def _resolve(self, tx, receipt=None, error=None):
+        with self._pending_lock:
+            if self._pending.pop(tx.tx_hash, None) is None:
+                return
+        self._slots.release()
+        if error is not None:
+            tx.future.set_exception(error)
+        else:
+            tx.future.set_result(receipt)
+
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_transaction_pipeline(w3, private_key, chain_id):
+    """Returns the shared TransactionPipeline for an account, creating it on first use."""
+    address = get_account(private_key).address
+    with _pipelines_lock:
+        pipeline = _pipelines.get(address)
+        if pipeline is None or pipeline.w3 is not w3:
+            pipeline = TransactionPipeline(w3, private_key, chain_id)
+            _pipelines[address] = pipeline
+        return pipeline
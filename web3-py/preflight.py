@@ -0,0 +1,247 @@
+import os
+import time
+import threading
+from typing import NamedTuple, Optional
+from web3 import Web3
+from web3.exceptions import ContractLogicError
+from dotenv import load_dotenv
+from provenance_index import INDEX_BLOCK_CHUNK
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+# Block the EntityContract was deployed in. Without it the entity cache is not seeded from
+# EntityRegistered logs (that would scan from genesis) and every entity is looked up lazily
+ENTITY_DEPLOY_BLOCK = os.getenv("ENTITY_DEPLOY_BLOCK")
+# Registrations are permanent, so only "not registered" answers expire
+ENTITY_NEGATIVE_TTL = float(os.getenv("ENTITY_NEGATIVE_TTL", "60"))
+# Validate Provenance writes locally before signing them (needs ENTITY_CONTRACT_ADDRESS)
+PREFLIGHT = os.getenv("PREFLIGHT", "true").lower() in ("1", "true", "yes")
+# Also dry-run each write with eth_call against the pending block
+PREFLIGHT_SIMULATE = os.getenv("PREFLIGHT_SIMULATE", "").lower() in ("1", "true", "yes")
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+class PreflightError(Exception):
+    """Raised when a write would revert, before it is signed or sent."""
+
+
+class EntityInfo(NamedTuple):
+    """Result of EntityContract.getEntityInfo."""
+    name: str
+    location: Optional[str]  # None for entries seeded from EntityRegistered logs
+    is_registered: bool
+    license_number: str
+    role: str
+
+
+class EntityCache:
+    """Local copy of the entity registry: who is registered, with which role.
+
+    seed() reads EntityRegistered logs once from the deploy block; sync()
+    applies newer ones. Addresses not seeded are looked up lazily with getEntityInfo
+    and the negative answer is kept for ENTITY_NEGATIVE_TTL seconds, since
+    an entity can register at any time but never unregisters.
+    """
+
+    def __init__(self, w3, entity_contract, negative_ttl=ENTITY_NEGATIVE_TTL):
+        self.w3 = w3
+        self.contract = entity_contract
+        self.negative_ttl = negative_ttl
+        self.entities = {}
+        self.block_number = None
+        self.lookups = 0
+        self._unregistered = {}
+        self._lock = threading.Lock()
+
+    def seed(self, from_block=None, chunk_size=INDEX_BLOCK_CHUNK):
+        """Loads every EntityRegistered event up to the latest block. Returns the number of entities."""
+        if from_block is None:
+            if not ENTITY_DEPLOY_BLOCK:
+                raise ValueError("ENTITY_DEPLOY_BLOCK not found in environment variables.")
+            from_block = int(ENTITY_DEPLOY_BLOCK)
+        self.block_number = from_block - 1
+        self.sync(chunk_size=chunk_size)
+        return len(self.entities)
+
+    def sync(self, to_block=None, chunk_size=INDEX_BLOCK_CHUNK):
+        """Applies EntityRegistered events since the last seed/sync (nothing if the cache was never seeded)."""
+        if self.block_number is None:
+            return 0
+        if to_block is None:
+            to_block = self.w3.eth.block_number
+        event = self.contract.events.EntityRegistered
+        from_block = self.block_number + 1
+        applied = 0
+        while from_block <= to_block:
+            end_block = min(from_block + chunk_size - 1, to_block)
+            logs = event().get_logs(from_block=from_block, to_block=end_block)
+            with self._lock:
+                for log in logs:
+                    args = log.args
+                    self.entities[args.entityAddress] = EntityInfo(
+                        args.name, None, True, args.licenseNumber, args.role
+                    )
+                    self._unregistered.pop(args.entityAddress, None)
+                self.block_number = end_block
+            applied += len(logs)
+            from_block = end_block + 1
+        return applied
+
+    def get(self, address):
+        """Returns the EntityInfo of an address, reading getEntityInfo only on a miss."""
+        address = Web3.to_checksum_address(address)
+        with self._lock:
+            entity = self.entities.get(address)
+            if entity is not None:
+                return entity
+            checked_at = self._unregistered.get(address)
+            if checked_at is not None and time.monotonic() - checked_at < self.negative_ttl:
+                return EntityInfo("", "", False, "", "")
+
+        entity = EntityInfo(*self.contract.functions.getEntityInfo(address).call())
+        with self._lock:
+            self.lookups += 1
+            if entity.is_registered:
+                self.entities[address] = entity
+            else:
+                self._unregistered[address] = time.monotonic()
+        return entity
+
+
+class Preflight:
+    """Validates Provenance writes locally with the contract's own rules before they are signed.
+
+    Entity roles come from an EntityCache; ownership and consumer-market
+    state are read against the pending block so that earlier transactions
+    still in flight are taken into account. With simulate=True each write is
+    also dry-run with eth_call, which catches anything the local rules miss.
+    """
+
+    def __init__(self, w3, provenance, entity_cache, simulate=PREFLIGHT_SIMULATE):
+        self.w3 = w3
+        self.provenance = provenance
+        self.entities = entity_cache
+        self.simulate = simulate
+        self.rejected = 0
+        self._consumer_market = set()
+
+    def check(self, contract_function, sender):
+        """Raises PreflightError if the Provenance call would revert when sent by `sender`.
+
+        Returns the history action the call would record.
+        """
+        sender = Web3.to_checksum_address(sender)
+        try:
+            action = self._validate(contract_function.fn_name, contract_function.args, sender)
+            if self.simulate:
+                try:
+                    contract_function.call({'from': sender}, block_identifier="pending")
+                except ContractLogicError as e:
+                    raise PreflightError(f"Simulation reverted: {e}") from e
+        except PreflightError:
+            self.rejected += 1
+            raise
+        return action
+
+    def _validate(self, fn_name, args, sender):
+        if fn_name == "registerRawDiamond":
+            self._require_role(sender, "Miner", "Only miners can register diamonds")
+            return "REGISTERED"
+        if fn_name == "processDiamond":
+            self._require_owner(args[0], sender, "Raw diamond does not exist")
+            self._require_role(sender, "Manufacturer", "Only manufacturers can process diamonds")
+            return "PROCESSED"
+        if fn_name == "certifyDiamond":
+            self._require_owner(args[0], sender, "Diamond does not exist")
+            self._require_role(sender, "Certifier", "Only certifiers can certify diamonds")
+            return "CERTIFIED"
+        if fn_name == "transferDiamond":
+            diamond_id, to = args[0], Web3.to_checksum_address(args[1])
+            self._require_owner(diamond_id, sender, "Diamond does not exist")
+            if to == ZERO_ADDRESS:
+                raise PreflightError("Cannot transfer to zero address")
+            return self.transfer_type(diamond_id, sender, to)
+        # Nothing to check locally for other functions
+        return None
+
+    def transfer_type(self, diamond_id, sender, to):
+        """Mirrors Provenance._determineTransferType: returns the transfer type or raises PreflightError."""
+        sender_entity = self.entities.get(sender)
+        receiver_entity = self.entities.get(to)
+        if sender_entity.is_registered and receiver_entity.is_registered:
+            # validateTransfer(from, to) is exactly "both registered"
+            return "ENTITY_TO_ENTITY"
+        if sender_entity.is_registered:
+            if sender_entity.role != "Retailer":
+                raise PreflightError("Only retailers can transfer to consumers")
+            return "RETAIL_SALE"
+        if not receiver_entity.is_registered:
+            if not self.in_consumer_market(diamond_id):
+                raise PreflightError("This diamond has not entered the consumer market")
+            return "SECONDARY_SALE"
+        raise PreflightError("Consumers cannot transfer back to registered entities")
+
+    def in_consumer_market(self, diamond_id):
+        """True once a retailer has sold the diamond to a consumer (a RETAIL_SALE history record).
+
+        The contract never clears this flag, so a positive answer is cached for good.
+        """
+        if diamond_id in self._consumer_market:
+            return True
+        history = self.provenance.functions.getDiamondHistory(diamond_id).call(block_identifier="pending")
+        if any(" | RETAIL_SALE | " in record for record in history):
+            self._consumer_market.add(diamond_id)
+            return True
+        return False
+
+    def _require_owner(self, diamond_id, sender, missing_message):
+        try:
+            owner = self.provenance.functions.getDiamondOwnershipInfo(diamond_id).call(block_identifier="pending")
+        except ContractLogicError:
+            raise PreflightError(missing_message)
+        if owner != sender:
+            raise PreflightError("You don't own this diamond")
+
+    def _require_role(self, address, role, message):
+        entity = self.entities.get(address)
+        if not (entity.is_registered and entity.role == role):
+            raise PreflightError(message)
+
+
+async def async_require_roles(entity_contract, roles):
+    """Checks {address: role} with getEntityInfo on an AsyncWeb3 EntityContract; raises PreflightError.
+
+    Enough for fixed write sequences like the async lifecycle, where each
+    step acts on what the previous, already mined step produced: ownership
+    and transfer types then hold by construction, and only roles can be wrong.
+    """
+    for address, role in roles.items():
+        entity = EntityInfo(*await entity_contract.functions.getEntityInfo(address).call())
+        if not (entity.is_registered and entity.role == role):
+            raise PreflightError(f"{address} is not registered as a {role}")
+
+
+_preflights = {}
+_preflights_lock = threading.Lock()
+
+
+def get_preflight(w3, provenance, entity_contract):
+    """Returns the shared Preflight for a Provenance contract.
+
+    Its entity cache is seeded on first use when ENTITY_DEPLOY_BLOCK is set,
+    otherwise it fills lazily with getEntityInfo.
+    """
+    key = (id(w3), provenance.address)
+    with _preflights_lock:
+        preflight = _preflights.get(key)
+        if preflight is not None and preflight.w3 is w3:
+            return preflight
+    entity_cache = EntityCache(w3, entity_contract)
+    if ENTITY_DEPLOY_BLOCK:
+        entity_cache.seed()
+    preflight = Preflight(w3, provenance, entity_cache)
+    with _preflights_lock:
+        return _preflights.setdefault(key, preflight)
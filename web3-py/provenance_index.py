@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import sqlite3
+from web3 import Web3
+from web3.exceptions import Web3RPCError
+from eth_utils import event_abi_to_log_topic
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+PROVENANCE_INDEX_PATH = os.getenv("PROVENANCE_INDEX_PATH", "provenance_index.db")
+PROVENANCE_DEPLOY_BLOCK = int(os.getenv("PROVENANCE_DEPLOY_BLOCK", "0"))
+INDEX_BLOCK_CHUNK = int(os.getenv("INDEX_BLOCK_CHUNK", "2000"))
+INDEX_CONFIRMATIONS = int(os.getenv("INDEX_CONFIRMATIONS", "0"))
+# Attempts per RPC call before a transient error (timeout, rate limit, dropped connection) is raised
+INDEX_MAX_RETRIES = int(os.getenv("INDEX_MAX_RETRIES", "5"))
+# How many recent block hashes are kept to find the common ancestor after a reorg
+REORG_DEPTH = int(os.getenv("REORG_DEPTH", "128"))
+
+INDEXED_EVENTS = (
+    "DiamondRegistered", "DiamondProcessed", "DiamondCertified", "DiamondTransferred", "HistoryRecordAdded"
+)
+# Events that change a diamond's owner, certification or existence, with the topic index of its diamond ID
+PROVENANCE_INVALIDATING_EVENTS = {
+    "DiamondRegistered": 1, "DiamondProcessed": 2, "DiamondCertified": 1, "DiamondTransferred": 1
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    diamond_id INTEGER NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_diamond ON events (diamond_id, block_number, log_index);
+
+CREATE TABLE IF NOT EXISTS diamonds (
+    diamond_id INTEGER PRIMARY KEY,
+    origin TEXT,
+    weight INTEGER,
+    owner TEXT,
+    is_certified INTEGER NOT NULL DEFAULT 0,
+    certification_id TEXT NOT NULL DEFAULT '',
+    raw_diamond_id INTEGER NOT NULL DEFAULT 0,
+    registered_block INTEGER
+);
+CREATE INDEX IF NOT EXISTS diamonds_owner ON diamonds (owner);
+CREATE INDEX IF NOT EXISTS diamonds_origin ON diamonds (origin);
+CREATE INDEX IF NOT EXISTS diamonds_certification ON diamonds (certification_id);
+CREATE INDEX IF NOT EXISTS diamonds_raw ON diamonds (raw_diamond_id);
+
+CREATE TABLE IF NOT EXISTS history (
+    diamond_id INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS history_diamond ON history (diamond_id, block_number, log_index);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    block_number INTEGER PRIMARY KEY,
+    block_hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS cursor (
+    name TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    block_hash TEXT NOT NULL
+);
+"""
+
+# Error messages of providers that cap the block range or result count of eth_getLogs
+LOG_RANGE_ERROR_MARKERS = (
+    "block range", "range limit", "range is too", "max range", "more than", "too many results", "too many blocks",
+    "too many logs", "response size", "result limit", "results limit",
+)
+
+
+def is_log_range_error(error):
+    """True if an eth_getLogs error means the range or result count was too large (a smaller range helps)."""
+    message = str(error).lower()
+    return isinstance(error, Web3RPCError) and "rate limit" not in message and \
+        any(marker in message for marker in LOG_RANGE_ERROR_MARKERS)
+
+
+def call_with_retries(rpc_call, *args, max_retries=None):
+    """Runs an RPC call, retrying transient errors with exponential backoff.
+
+    Range/result-limit errors of eth_getLogs are raised at once, since only
+    a smaller range helps.
+    """
+    max_retries = max_retries or INDEX_MAX_RETRIES
+    delay = 1.0
+    for attempt in range(max_retries):
+        try:
+            return rpc_call(*args)
+        except Exception as e:
+            if is_log_range_error(e) or attempt == max_retries - 1:
+                raise
+            print(f"RPC call failed ({e}), retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+class ProvenanceIndex:
+    """Local SQLite index of provenance contract events.
+
+    Events are stored verbatim in the events table; the diamonds and history
+    tables are derived from them, so a reorg is handled by deleting the
+    orphaned events and replaying the remaining events of the affected diamonds.
+    """
+
+    def __init__(self, path=PROVENANCE_INDEX_PATH, w3=None, contract=None):
+        self.w3 = w3
+        self.contract = contract
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self._topics = {}
+        if contract is not None:
+            for event_name in INDEXED_EVENTS:
+                self._topics[event_abi_to_log_topic(contract.events[event_name].abi)] = event_name
+
+    def close(self):
+        self.conn.close()
+
+    # ====== Syncing ======
+
+    def get_cursor(self):
+        """Returns (block_number, block_hash) of the last indexed block, or None."""
+        row = self.conn.execute("SELECT block_number, block_hash FROM cursor WHERE name = 'provenance'").fetchone()
+        return (row["block_number"], row["block_hash"]) if row else None
+
+    def sync(self, to_block=None, chunk_size=INDEX_BLOCK_CHUNK):
+        """Indexes new events up to to_block (default: latest minus confirmations).
+
+        Transient RPC errors are retried with backoff; the chunk size is only
+        halved when the provider rejects the range or result count.
+        Returns the number of events indexed.
+        """
+        if to_block is None:
+            to_block = call_with_retries(lambda: self.w3.eth.block_number) - INDEX_CONFIRMATIONS
+
+        self._handle_reorg()
+        cursor = self.get_cursor()
+        from_block = cursor[0] + 1 if cursor else PROVENANCE_DEPLOY_BLOCK
+        indexed = 0
+
+        while from_block <= to_block:
+            end_block = min(from_block + chunk_size - 1, to_block)
+            try:
+                logs = call_with_retries(self.w3.eth.get_logs, {
+                    'address': self.contract.address,
+                    'fromBlock': from_block,
+                    'toBlock': end_block,
+                    'topics': [["0x" + topic.hex() for topic in self._topics]]
+                })
+            except Exception as e:
+                if chunk_size == 1 or not is_log_range_error(e):
+                    raise
+                # Providers cap the range or result count of eth_getLogs
+                chunk_size = max(1, chunk_size // 2)
+                print(f"eth_getLogs failed for blocks {from_block}-{end_block} ({e}), retrying with chunk size {chunk_size}")
+                continue
+
+            end_hash = call_with_retries(self.w3.eth.get_block, end_block)["hash"].to_0x_hex()
+            with self.conn:
+                for log in logs:
+                    self._store_log(log)
+                self._record_block(end_block, end_hash)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cursor (name, block_number, block_hash) VALUES ('provenance', ?, ?)",
+                    (end_block, end_hash)
+                )
+            indexed += len(logs)
+            from_block = end_block + 1
+        return indexed
+
+    def _store_log(self, log):
+        event_name = self._topics.get(bytes(log["topics"][0]))
+        if event_name is None:
+            return
+        event = self.contract.events[event_name]().process_log(log)
+        args = dict(event.args)
+        diamond_id = args["newDiamondId"] if event_name == "DiamondProcessed" else args["diamondId"]
+        block_hash = log["blockHash"].to_0x_hex()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO events (block_number, log_index, block_hash, tx_hash, event, diamond_id, args) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (log["blockNumber"], log["logIndex"], block_hash, log["transactionHash"].to_0x_hex(),
+             event_name, diamond_id, json.dumps(args))
+        )
+        self._record_block(log["blockNumber"], block_hash)
+        self._apply_event(event_name, diamond_id, args, log["blockNumber"], log["logIndex"])
+
+    def _apply_event(self, event_name, diamond_id, args, block_number, log_index):
+        if event_name == "DiamondRegistered":
+            self.conn.execute(
+                "INSERT OR REPLACE INTO diamonds (diamond_id, origin, weight, owner, raw_diamond_id, registered_block) "
+                "VALUES (?, ?, ?, ?, 0, ?)",
+                (diamond_id, args["origin"], args["weight"], args["miner"], block_number)
+            )
+        elif event_name == "DiamondProcessed":
+            # Processed diamonds inherit the raw diamond's origin; the new weight is not in the event
+            raw = self.conn.execute(
+                "SELECT origin FROM diamonds WHERE diamond_id = ?", (args["rawDiamondId"],)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO diamonds (diamond_id, origin, weight, owner, raw_diamond_id, registered_block) "
+                "VALUES (?, ?, NULL, ?, ?, ?)",
+                (diamond_id, raw["origin"] if raw else None, args["manufacturer"], args["rawDiamondId"], block_number)
+            )
+        elif event_name == "DiamondCertified":
+            self.conn.execute(
+                "UPDATE diamonds SET is_certified = 1, certification_id = ? WHERE diamond_id = ?",
+                (args["certificationId"], diamond_id)
+            )
+        elif event_name == "DiamondTransferred":
+            self.conn.execute("UPDATE diamonds SET owner = ? WHERE diamond_id = ?", (args["to"], diamond_id))
+        elif event_name == "HistoryRecordAdded":
+            self.conn.execute(
+                "INSERT OR REPLACE INTO history (diamond_id, block_number, log_index, record) VALUES (?, ?, ?, ?)",
+                (diamond_id, block_number, log_index, args["record"])
+            )
+
+    def _record_block(self, block_number, block_hash):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO blocks (block_number, block_hash) VALUES (?, ?)", (block_number, block_hash)
+        )
+        self.conn.execute(
+            "DELETE FROM blocks WHERE block_number NOT IN "
+            "(SELECT block_number FROM blocks ORDER BY block_number DESC LIMIT ?)", (REORG_DEPTH,)
+        )
+
+    # ====== Reorg handling ======
+
+    def _handle_reorg(self):
+        cursor = self.get_cursor()
+        if cursor is None or self._block_hash(cursor[0]) == cursor[1]:
+            return
+
+        # Walk back through the remembered block hashes to the common ancestor
+        ancestor = None
+        for row in self.conn.execute("SELECT block_number, block_hash FROM blocks ORDER BY block_number DESC"):
+            if self._block_hash(row["block_number"]) == row["block_hash"]:
+                ancestor = (row["block_number"], row["block_hash"])
+                break
+        if ancestor is None:
+            raise RuntimeError(f"Reorg deeper than {REORG_DEPTH} remembered blocks; rebuild the index")
+
+        print(f"Reorg detected: rolling index back from block {cursor[0]} to {ancestor[0]}")
+        self.rollback(ancestor[0], ancestor[1])
+
+    def _block_hash(self, block_number):
+        try:
+            return self.w3.eth.get_block(block_number)["hash"].to_0x_hex()
+        except Exception:
+            # The block no longer exists on the canonical chain
+            return None
+
+    def rollback(self, block_number, block_hash):
+        """Drops everything indexed after block_number and rebuilds the affected diamonds."""
+        with self.conn:
+            affected = [row["diamond_id"] for row in self.conn.execute(
+                "SELECT DISTINCT diamond_id FROM events WHERE block_number > ? ORDER BY diamond_id", (block_number,)
+            )]
+            self.conn.execute("DELETE FROM events WHERE block_number > ?", (block_number,))
+            self.conn.execute("DELETE FROM history WHERE block_number > ?", (block_number,))
+            self.conn.execute("DELETE FROM blocks WHERE block_number > ?", (block_number,))
+            # Raw diamonds always have lower IDs than their processed diamonds, so
+            # ascending order rebuilds a raw diamond before anything derived from it
+            for diamond_id in affected:
+                self.conn.execute("DELETE FROM diamonds WHERE diamond_id = ?", (diamond_id,))
+                for row in self.conn.execute(
+                    "SELECT * FROM events WHERE diamond_id = ? ORDER BY block_number, log_index", (diamond_id,)
+                ).fetchall():
+                    if row["event"] != "HistoryRecordAdded":
+                        self._apply_event(row["event"], diamond_id, json.loads(row["args"]),
+                                          row["block_number"], row["log_index"])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cursor (name, block_number, block_hash) VALUES ('provenance', ?, ?)",
+                (block_number, block_hash)
+            )
+
+    # ====== Queries ======
+
+    def get_diamond(self, diamond_id):
+        return self.conn.execute("SELECT * FROM diamonds WHERE diamond_id = ?", (diamond_id,)).fetchone()
+
+    def diamonds_by_owner(self, owner):
+        return self.conn.execute(
+            "SELECT * FROM diamonds WHERE owner = ? ORDER BY diamond_id", (Web3.to_checksum_address(owner),)
+        ).fetchall()
+
+    def diamonds_by_origin(self, origin):
+        """Returns diamonds whose origin starts with the given text (e.g. "Jwaneng")."""
+        return self.conn.execute(
+            "SELECT * FROM diamonds WHERE origin >= ? AND origin < ? ORDER BY diamond_id", (origin, origin + "\uffff")
+        ).fetchall()
+
+    def diamond_by_certification(self, certification_id):
+        return self.conn.execute(
+            "SELECT * FROM diamonds WHERE certification_id = ?", (certification_id,)
+        ).fetchone()
+
+    def processed_from(self, raw_diamond_id):
+        """Returns every diamond processed (directly or indirectly) from a raw diamond."""
+        return self.conn.execute(
+            """
+            WITH RECURSIVE lineage(diamond_id) AS (
+                SELECT diamond_id FROM diamonds WHERE raw_diamond_id = ?
+                UNION
+                SELECT d.diamond_id FROM diamonds d JOIN lineage l ON d.raw_diamond_id = l.diamond_id
+            )
+            SELECT d.* FROM diamonds d JOIN lineage l USING (diamond_id) ORDER BY d.diamond_id
+            """, (raw_diamond_id,)
+        ).fetchall()
+
+    def get_history(self, diamond_id):
+        return [row["record"] for row in self.conn.execute(
+            "SELECT record FROM history WHERE diamond_id = ? ORDER BY block_number, log_index", (diamond_id,)
+        )]
@@ -0,0 +1,25 @@
+from web3.logs import DISCARD
+
+
+def _decode_receipt_events(contract, event_name, receipt):
+    """Decodes one event type from a receipt, keeping only logs emitted by the contract."""
+    events = contract.events[event_name]().process_receipt(receipt, errors=DISCARD)
+    return [event for event in events if event.address == contract.address]
+
+
+def get_registered_diamond_id(contract, receipt):
+    """Returns the ID minted by a registerRawDiamond receipt, read from DiamondRegistered."""
+    events = _decode_receipt_events(contract, "DiamondRegistered", receipt)
+    if not events:
+        raise ValueError(f"No DiamondRegistered event in transaction {receipt.transactionHash.hex()}")
+    return events[0].args.diamondId
+
+
+def get_processed_diamond_id(contract, receipt, raw_diamond_id=None):
+    """Returns the ID minted by a processDiamond receipt, read from DiamondProcessed."""
+    events = _decode_receipt_events(contract, "DiamondProcessed", receipt)
+    if raw_diamond_id is not None:
+        events = [event for event in events if event.args.rawDiamondId == raw_diamond_id]
+    if not events:
+        raise ValueError(f"No DiamondProcessed event in transaction {receipt.transactionHash.hex()}")
+    return events[0].args.newDiamondId
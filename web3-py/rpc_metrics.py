@@ -0,0 +1,413 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import rlp
+from eth_utils import function_abi_to_4byte_selector
+from eth_account.typed_transactions import TypedTransaction
+from web3.middleware.base import Web3Middleware
+from web3.providers.rpc.utils import check_if_retry_on_failure
+from dotenv import load_dotenv
+from dab_client import ContractABIError, get_contract_abi
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+RPC_METRICS_HOST = os.getenv("RPC_METRICS_HOST", "127.0.0.1")
+RPC_METRICS_PORT = int(os.getenv("RPC_METRICS_PORT", "9464"))
+RPC_METRICS_REPORT = os.getenv("RPC_METRICS_REPORT")
+
+# Latency histogram bucket bounds in seconds; receipts can take minutes on Sepolia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+# Methods whose payload carries contract call data worth decoding
+CALL_DATA_METHODS = ("eth_call", "eth_estimateGas", "eth_sendTransaction", "eth_sendRawTransaction")
+CONTRACT_ABIS = ("PROVENANCE_CONTRACT_ABI", "MARKETPLACE_CONTRACT_ABI", "ENTITY_CONTRACT_ABI")
+
+
+def _known_selectors():
+    """Maps 4-byte selectors to function names across the project's contract ABIs."""
+    selectors = {}
+    for abi_name in CONTRACT_ABIS:
+        try:
+            abi = get_contract_abi(abi_name)
+        except ContractABIError:
+            continue
+        for entry in abi:
+            if entry.get("type") == "function":
+                selectors.setdefault("0x" + function_abi_to_4byte_selector(entry).hex(), entry["name"])
+    return selectors
+
+
+def _hex(value):
+    return "0x" + bytes(value).hex() if isinstance(value, (bytes, bytearray)) else str(value)
+
+
+def _call_data(method, params):
+    """Returns the hex call data carried by a request, or None."""
+    if not params:
+        return None
+    if method == "eth_sendRawTransaction":
+        raw = bytes.fromhex(_hex(params[0])[2:])
+        try:
+            if raw[0] <= 0x7f:
+                return _hex(TypedTransaction.from_bytes(raw).as_dict()["data"])
+            # Legacy transaction: [nonce, gasPrice, gas, to, value, data, v, r, s]
+            return _hex(rlp.decode(raw)[5])
+        except Exception:
+            return None
+    transaction = params[0] if isinstance(params[0], dict) else {}
+    data = transaction.get("data", transaction.get("input"))
+    return _hex(data) if data is not None else None
+
+
+class MethodStats:
+    """Counters and a cumulative latency histogram for one (method, function) label."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds):
+        self.latency_sum += seconds
+        self.latency_count += 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "latency_seconds": {
+                "sum": self.latency_sum,
+                "count": self.latency_count,
+                "mean": self.latency_sum / self.latency_count if self.latency_count else 0.0,
+                "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.buckets)},
+            },
+        }
+
+
+class RpcMetrics:
+    """Thread-safe registry of JSON-RPC metrics, labelled by method and decoded contract function.
+
+    Calls made inside step() are also appended to a per-step trace.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.trace = []
+        self.current_step = None
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._selectors = None
+
+    def function_name(self, method, params):
+        """Decodes the contract function a request calls from its selector, or returns ""."""
+        if method not in CALL_DATA_METHODS:
+            return ""
+        data = _call_data(method, params)
+        if not data or len(data) < 10:
+            return ""
+        if self._selectors is None:
+            self._selectors = _known_selectors()
+        return self._selectors.get(data[:10].lower(), data[:10])
+
+    def record(self, method, function, seconds=None, request_bytes=0, response_bytes=0, error=False, retries=0):
+        """Records one request. seconds is None for requests timed as part of a batch."""
+        with self._lock:
+            stats = self.stats.get((method, function))
+            if stats is None:
+                stats = self.stats[(method, function)] = MethodStats()
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.retries += retries
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            if seconds is not None:
+                stats.observe(seconds)
+            if self.current_step is not None:
+                self.trace.append({
+                    "step": self.current_step, "method": method, "function": function,
+                    "seconds": seconds, "bytes": request_bytes + response_bytes, "error": error
+                })
+
+    @contextmanager
+    def step(self, name):
+        """Attributes RPC calls made inside the block to the named step.
+
+        Calls from every thread count, so receipts collected by a pipeline's
+        background thread are traced to the step that waits for them.
+        """
+        previous = self.current_step
+        self.current_step = name
+        try:
+            yield
+        finally:
+            self.current_step = previous
+
+    def report(self):
+        """Returns all metrics as a JSON-serializable dict."""
+        with self._lock:
+            methods = [
+                {"method": method, "function": function, **stats.to_dict()}
+                for (method, function), stats in sorted(self.stats.items())
+            ]
+        return {
+            "uptime_seconds": time.time() - self.started_at,
+            # The rpc_batch entry times whole batches; its requests are counted under their own methods
+            "total_calls": sum(entry["calls"] for entry in methods if entry["method"] != "rpc_batch"),
+            "methods": methods,
+        }
+
+    def write_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def prometheus_text(self):
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            items = sorted(self.stats.items())
+            for name, help_text, field in (
+                ("dab_rpc_requests_total", "JSON-RPC requests sent", "calls"),
+                ("dab_rpc_errors_total", "JSON-RPC requests that failed", "errors"),
+                ("dab_rpc_retries_total", "JSON-RPC request attempts retried after a transport error", "retries"),
+                ("dab_rpc_request_bytes_total", "Encoded JSON-RPC request bytes", "request_bytes"),
+                ("dab_rpc_response_bytes_total", "Encoded JSON-RPC response bytes", "response_bytes"),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (method, function), stats in items:
+                    lines.append(f'{name}{{method="{method}",function="{function}"}} {getattr(stats, field)}')
+
+            name = "dab_rpc_latency_seconds"
+            lines += [f"# HELP {name} JSON-RPC request latency", f"# TYPE {name} histogram"]
+            for (method, function), stats in items:
+                labels = f'method="{method}",function="{function}"'
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {stats.latency_count}')
+                lines.append(f'{name}_sum{{{labels}}} {stats.latency_sum}')
+                lines.append(f'{name}_count{{{labels}}} {stats.latency_count}')
+        return "\n".join(lines) + "\n"
+
+    def format_table(self):
+        """Formats calls, errors, retries, mean latency and bytes per method/function, slowest total first."""
+        report = self.report()
+        lines = [f"{'method / function':<52} {'calls':>6} {'errors':>6} {'retries':>7} {'mean':>9} {'bytes':>10}"]
+        for entry in sorted(report["methods"], key=lambda entry: -entry["latency_seconds"]["sum"]):
+            label = f"{entry['method']} {entry['function']}".strip()
+            latency = entry["latency_seconds"]
+            mean = f"{latency['mean'] * 1000:>7.1f}ms" if latency["count"] else f"{'batched':>9}"
+            lines.append(
+                f"{label:<52} {entry['calls']:>6} {entry['errors']:>6} {entry['retries']:>7} {mean} "
+                f"{entry['request_bytes'] + entry['response_bytes']:>10}"
+            )
+        lines.append(f"{report['total_calls']} RPC calls in {report['uptime_seconds']:.1f}s")
+        return "\n".join(lines)
+
+    def format_trace(self):
+        """Summarizes the per-step trace: calls, time and bytes per step and per method/function."""
+        with self._lock:
+            trace = list(self.trace)
+        steps = {}
+        for call in trace:
+            step = steps.setdefault(call["step"], {})
+            label = f"{call['method']} {call['function']}".strip()
+            calls, seconds, size = step.get(label, (0, 0.0, 0))
+            step[label] = (calls + 1, seconds + (call["seconds"] or 0.0), size + call["bytes"])
+
+        lines = []
+        for step_name, labels in steps.items():
+            total_calls = sum(calls for calls, _, _ in labels.values())
+            total_seconds = sum(seconds for _, seconds, _ in labels.values())
+            lines.append(f"{step_name}: {total_calls} RPC calls, {total_seconds:.3f}s")
+            for label, (calls, seconds, size) in sorted(labels.items(), key=lambda item: -item[1][1]):
+                lines.append(f"  {label:<48} {calls:>4} calls {seconds:>8.3f}s {size:>9} bytes")
+        return "\n".join(lines)
+
+
+class RpcMetricsMiddleware(Web3Middleware):
+    """Times every JSON-RPC request on its way to the provider and records it in an RpcMetrics.
+
+    The provider's transport-error retries are taken over here (for both
+    HTTPProvider and AsyncHTTPProvider), so every retried attempt is counted
+    instead of being hidden inside the provider.
+    """
+
+    def __init__(self, w3, metrics, retry_configuration=None):
+        super().__init__(w3)
+        self.metrics = metrics
+        self.retry_configuration = retry_configuration
+
+    def _request_size(self, method, params):
+        provider = self._w3.provider
+        if hasattr(provider, "encode_rpc_request"):
+            return len(provider.encode_rpc_request(method, params))
+        return len(json.dumps(params, default=_hex))
+
+    def _attempts(self, method):
+        """How many times a request may be sent, following the provider's retry configuration."""
+        retry = self.retry_configuration
+        if retry is None or not check_if_retry_on_failure(method, retry.method_allowlist):
+            return 1
+        return retry.retries
+
+    def _should_retry(self, error, attempt, attempts):
+        return attempt < attempts - 1 and isinstance(error, tuple(self.retry_configuration.errors))
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            function = self.metrics.function_name(method, params)
+            request_bytes = self._request_size(method, params)
+            attempts = self._attempts(method)
+            start = time.perf_counter()
+            for attempt in range(attempts):
+                try:
+                    response = make_request(method, params)
+                    break
+                except Exception as e:
+                    if self._should_retry(e, attempt, attempts):
+                        time.sleep(self.retry_configuration.backoff_factor * 2 ** attempt)
+                        continue
+                    self.metrics.record(method, function, time.perf_counter() - start, request_bytes,
+                                        error=True, retries=attempt)
+                    raise
+            self.metrics.record(
+                method, function, time.perf_counter() - start, request_bytes,
+                len(json.dumps(response, default=_hex)), error="error" in response, retries=attempt
+            )
+            return response
+
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        def middleware(requests_info):
+            start = time.perf_counter()
+            try:
+                responses = make_batch_request(requests_info)
+            except Exception:
+                self.metrics.record("rpc_batch", "", time.perf_counter() - start, error=True)
+                raise
+            elapsed = time.perf_counter() - start
+            results = responses if isinstance(responses, list) else [responses] * len(requests_info)
+            for (method, params), response in zip(requests_info, results):
+                self.metrics.record(
+                    method, self.metrics.function_name(method, params), None,
+                    self._request_size(method, params), len(json.dumps(response, default=_hex)),
+                    error="error" in response
+                )
+            self.metrics.record("rpc_batch", "", elapsed, error=not isinstance(responses, list))
+            return responses
+
+        return middleware
+
+    async def async_wrap_make_request(self, make_request):
+        async def middleware(method, params):
+            function = self.metrics.function_name(method, params)
+            request_bytes = self._request_size(method, params)
+            attempts = self._attempts(method)
+            start = time.perf_counter()
+            for attempt in range(attempts):
+                try:
+                    response = await make_request(method, params)
+                    break
+                except Exception as e:
+                    if self._should_retry(e, attempt, attempts):
+                        await asyncio.sleep(self.retry_configuration.backoff_factor * 2 ** attempt)
+                        continue
+                    self.metrics.record(method, function, time.perf_counter() - start, request_bytes,
+                                        error=True, retries=attempt)
+                    raise
+            self.metrics.record(
+                method, function, time.perf_counter() - start, request_bytes,
+                len(json.dumps(response, default=_hex)), error="error" in response, retries=attempt
+            )
+            return response
+
+        return middleware
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def instrument(w3, metrics=None):
+    """Adds the metrics middleware to a Web3 (or AsyncWeb3) instance once and returns its RpcMetrics.
+
+    Instrumented connections share one process-wide RpcMetrics unless another is given.
+    """
+    with _metrics_lock:
+        existing = _metrics.get(id(w3))
+        if existing is not None and existing[0] is w3:
+            return existing[1]
+        if metrics is None:
+            metrics = _metrics.get(None) or RpcMetrics()
+            _metrics.setdefault(None, metrics)
+
+        provider = w3.provider
+        retry_configuration = getattr(provider, "exception_retry_configuration", None)
+        if retry_configuration is not None:
+            provider.exception_retry_configuration = None
+        # Innermost, so it sees the requests exactly as sent and times each retried attempt
+        w3.middleware_onion.inject(
+            lambda w3: RpcMetricsMiddleware(w3, metrics, retry_configuration), name="rpc_metrics", layer=0
+        )
+        _metrics[id(w3)] = (w3, metrics)
+        return metrics
+
+
+def get_rpc_metrics(w3=None):
+    """Returns the RpcMetrics recording w3's requests (or the process-wide one), or None."""
+    with _metrics_lock:
+        if w3 is None:
+            return _metrics.get(None)
+        existing = _metrics.get(id(w3))
+        return existing[1] if existing is not None and existing[0] is w3 else None
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text format), GET /metrics.json (JSON report)."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    metrics = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, "text/plain; version=0.0.4", self.metrics.prometheus_text().encode())
+        elif self.path == "/metrics.json":
+            self._send(200, "application/json", json.dumps(self.metrics.report()).encode())
+        else:
+            self._send(404, "application/json", b'{"error": "not found"}')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(metrics, host=RPC_METRICS_HOST, port=RPC_METRICS_PORT):
+    """Serves the metrics from a daemon thread and returns the server. Port 0 picks a free port."""
+    handler = type("BoundMetricsRequestHandler", (MetricsRequestHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
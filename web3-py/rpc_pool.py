@@ -0,0 +1,303 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+from dotenv import load_dotenv
+from dab_client import RPC_POOL_SIZE, get_http_session
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+# Start a second copy of a read on the next endpoint once the first has taken this long
+RPC_HEDGE_AFTER = float(os.getenv("RPC_HEDGE_AFTER", "0.5"))
+RPC_POOL_TIMEOUT = float(os.getenv("RPC_POOL_TIMEOUT", "30"))
+# An endpoint that fails sits out for this long, doubling per consecutive failure
+RPC_POOL_COOLDOWN = float(os.getenv("RPC_POOL_COOLDOWN", "5"))
+RPC_POOL_MAX_COOLDOWN = float(os.getenv("RPC_POOL_MAX_COOLDOWN", "120"))
+
+# Sends go to one endpoint only, never hedged
+WRITE_METHODS = ("eth_sendRawTransaction", "eth_sendTransaction")
+# Transaction and nonce state lives in one node's mempool, so these stay on the write endpoint
+STICKY_METHODS = WRITE_METHODS + (
+    "eth_getTransactionCount", "eth_getTransactionByHash", "eth_getTransactionReceipt"
+)
+# JSON-RPC errors that say the endpoint, not the request, is the problem
+ENDPOINT_ERROR_CODES = (-32005, 429)
+ENDPOINT_ERROR_MESSAGES = ("rate limit", "too many requests", "header not found", "capacity exceeded")
+# Errors a node returns for a raw transaction it already has
+KNOWN_TRANSACTION_MESSAGES = ("already known", "known transaction", "already imported")
+EWMA_WEIGHT = 0.3
+
+
+class RpcEndpointError(Exception):
+    """Raised when an endpoint answers with an error that says it is unhealthy (rate limited, lagging)."""
+
+
+class PoolEndpoint:
+    """One RPC URL in a pool, with its latency and health score."""
+
+    def __init__(self, url, timeout=RPC_POOL_TIMEOUT):
+        self.url = url
+        # The pool moves failed requests to the next endpoint instead of retrying here
+        self.provider = Web3.HTTPProvider(
+            url, session=get_http_session(), exception_retry_configuration=None,
+            request_kwargs={"timeout": timeout}
+        )
+        self.latency = None  # EWMA of successful request latency, in seconds
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.hedges_won = 0
+        self._lock = threading.Lock()
+
+    def healthy(self, now=None):
+        return (now or time.monotonic()) >= self.cooldown_until
+
+    def score(self):
+        """Lower is better: expected latency, scaled up by the requests already waiting on this endpoint."""
+        return (self.latency or 0.0) * (1 + self.in_flight)
+
+    def request(self, method, params):
+        """Sends one request and updates the score. Raises on transport or endpoint errors."""
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        start = time.monotonic()
+        try:
+            response = self.provider.make_request(method, params)
+            if _is_endpoint_error(response):
+                raise RpcEndpointError(f"{self.url}: {response['error'].get('message')}")
+        except Exception:
+            self._record_failure()
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        self._record_success(time.monotonic() - start)
+        return response
+
+    def batch_request(self, requests_info):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        start = time.monotonic()
+        try:
+            responses = self.provider.make_batch_request(requests_info)
+            if not isinstance(responses, list) and _is_endpoint_error(responses):
+                raise RpcEndpointError(f"{self.url}: {responses['error'].get('message')}")
+        except Exception:
+            self._record_failure()
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        self._record_success(time.monotonic() - start)
+        return responses
+
+    def _record_success(self, elapsed):
+        with self._lock:
+            self.latency = elapsed if self.latency is None else (
+                EWMA_WEIGHT * elapsed + (1 - EWMA_WEIGHT) * self.latency
+            )
+            self.failures = 0
+            self.cooldown_until = 0.0
+
+    def _record_failure(self):
+        with self._lock:
+            self.errors += 1
+            self.failures += 1
+            self.cooldown_until = time.monotonic() + min(
+                RPC_POOL_COOLDOWN * 2 ** (self.failures - 1), RPC_POOL_MAX_COOLDOWN
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "url": self.url,
+                "healthy": self.healthy(),
+                "latency_ms": self.latency * 1000 if self.latency is not None else None,
+                "requests": self.requests,
+                "errors": self.errors,
+                "hedges_won": self.hedges_won,
+            }
+
+
+def _is_endpoint_error(response):
+    error = response.get("error") if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get("message", "")).lower()
+    return error.get("code") in ENDPOINT_ERROR_CODES or any(text in message for text in ENDPOINT_ERROR_MESSAGES)
+
+
+def _error_message(response):
+    error = response.get("error")
+    return str(error.get("message", error) if isinstance(error, dict) else error).lower()
+
+
+class RpcPoolProvider(JSONBaseProvider):
+    """Spreads JSON-RPC requests over several endpoints.
+
+    Reads go to the best-scoring healthy endpoint; if it has not answered
+    within hedge_after seconds the same read is raced on the next endpoint
+    and the first answer wins. Failed endpoints cool down with exponential
+    backoff and their requests move to the next endpoint. Sends and the
+    nonce/receipt lookups that depend on one node's mempool stick to a
+    single write endpoint, which only changes when it fails.
+    """
+
+    def __init__(self, urls, hedge_after=RPC_HEDGE_AFTER, timeout=RPC_POOL_TIMEOUT):
+        """hedge_after=None disables hedging; failed reads still move to the next endpoint."""
+        super().__init__()
+        if not urls:
+            raise ValueError("RpcPoolProvider needs at least one RPC URL")
+        self.endpoints = [PoolEndpoint(url, timeout) for url in urls]
+        self.hedge_after = hedge_after
+        self.hedged_requests = 0
+        self._write_endpoint = None
+        self._lock = threading.Lock()
+        # As many workers as the shared session keeps connections per endpoint
+        self._executor = ThreadPoolExecutor(
+            max_workers=RPC_POOL_SIZE * len(self.endpoints), thread_name_prefix="rpc-pool"
+        )
+
+    def __str__(self):
+        return f"RPC pool {', '.join(endpoint.url for endpoint in self.endpoints)}"
+
+    def ranked_endpoints(self):
+        """Healthy endpoints by score, then cooling-down ones by how soon they recover."""
+        now = time.monotonic()
+        healthy = sorted((e for e in self.endpoints if e.healthy(now)), key=PoolEndpoint.score)
+        cooling = sorted((e for e in self.endpoints if not e.healthy(now)), key=lambda e: e.cooldown_until)
+        return healthy + cooling
+
+    def make_request(self, method, params):
+        if method in WRITE_METHODS:
+            return self._send(method, params)
+        if method in STICKY_METHODS:
+            return self._sticky_read(method, params)
+        return self._hedged_read(method, params)
+
+    def make_batch_request(self, requests_info):
+        last_error = None
+        for endpoint in self.ranked_endpoints():
+            try:
+                return endpoint.batch_request(requests_info)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def is_connected(self, show_traceback=False):
+        """True when at least one endpoint answers."""
+        connected = False
+        for endpoint in self.endpoints:
+            try:
+                endpoint.request("web3_clientVersion", [])
+                connected = True
+            except Exception as e:
+                print(f"RPC endpoint {endpoint.url} unavailable: {e}")
+        return connected
+
+    def _hedged_read(self, method, params):
+        candidates = self.ranked_endpoints()
+        pending = {self._executor.submit(candidates[0].request, method, params): candidates[0]}
+        next_index = 1
+        hedged = False
+        last_error = None
+        while pending:
+            can_hedge = self.hedge_after is not None and next_index < len(candidates)
+            done, _ = wait(pending, timeout=self.hedge_after if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # Still waiting on every copy: race the next endpoint
+                endpoint = candidates[next_index]
+                pending[self._executor.submit(endpoint.request, method, params)] = endpoint
+                next_index += 1
+                hedged = True
+                with self._lock:
+                    self.hedged_requests += 1
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if hedged and endpoint is not candidates[0]:
+                    with endpoint._lock:
+                        endpoint.hedges_won += 1
+                return response
+            if not pending and next_index < len(candidates):
+                # Every copy so far failed: fail over immediately
+                endpoint = candidates[next_index]
+                pending[self._executor.submit(endpoint.request, method, params)] = endpoint
+                next_index += 1
+        raise last_error
+
+    def _sticky_read(self, method, params):
+        last_error = None
+        for endpoint in self._write_candidates():
+            try:
+                return endpoint.request(method, params)
+            except Exception as e:
+                last_error = e
+                self._drop_write_endpoint(endpoint)
+        raise last_error
+
+    def _send(self, method, params):
+        """Sends a transaction, moving to the next endpoint on failure.
+
+        Resending the same signed transaction is safe: it has the same hash,
+        so a node that already has it (or mined it) means the first attempt
+        got through even though its response was lost.
+        """
+        last_error = None
+        for attempt, endpoint in enumerate(self._write_candidates()):
+            try:
+                response = endpoint.request(method, params)
+            except Exception as e:
+                last_error = e
+                self._drop_write_endpoint(endpoint)
+                continue
+            if "error" not in response or method != "eth_sendRawTransaction":
+                return response
+            tx_hash = Web3.keccak(hexstr=str(params[0])).to_0x_hex()
+            message = _error_message(response)
+            if any(text in message for text in KNOWN_TRANSACTION_MESSAGES):
+                return {"jsonrpc": "2.0", "id": response.get("id"), "result": tx_hash}
+            if attempt > 0 and self._transaction_known(endpoint, tx_hash):
+                # e.g. "nonce too low" because the lost first attempt has already been mined
+                return {"jsonrpc": "2.0", "id": response.get("id"), "result": tx_hash}
+            return response
+        raise last_error
+
+    def _transaction_known(self, endpoint, tx_hash):
+        try:
+            return endpoint.request("eth_getTransactionByHash", [tx_hash]).get("result") is not None
+        except Exception:
+            return False
+
+    def _write_candidates(self):
+        with self._lock:
+            write_endpoint = self._write_endpoint
+            if write_endpoint is None or not write_endpoint.healthy():
+                write_endpoint = self._write_endpoint = self.ranked_endpoints()[0]
+        return [write_endpoint] + [e for e in self.ranked_endpoints() if e is not write_endpoint]
+
+    def _drop_write_endpoint(self, endpoint):
+        with self._lock:
+            if self._write_endpoint is endpoint:
+                self._write_endpoint = None
+
+    def stats(self):
+        """Per-endpoint scores and counters, plus the number of hedged reads."""
+        return {
+            "hedged_requests": self.hedged_requests,
+            "write_endpoint": self._write_endpoint.url if self._write_endpoint is not None else None,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
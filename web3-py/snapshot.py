@@ -0,0 +1,215 @@
+import os
+import io
+import gzip
+import json
+import hashlib
+from eth_utils import event_abi_to_log_topic
+from dotenv import load_dotenv
+from batch_reader import BatchReader, DiamondRecord
+from provenance_index import INDEX_BLOCK_CHUNK, PROVENANCE_INVALIDATING_EVENTS
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+SNAPSHOT_VERSION = 1
+# Snapshot rows are DiamondRecord fields in this order
+SNAPSHOT_COLUMNS = DiamondRecord._fields
+# Holds "<content hash> <block number>" of the newest snapshot, like a git ref
+LATEST_POINTER = "LATEST"
+
+
+def _changed_diamond_ids(contract, from_block, to_block, chunk_size=INDEX_BLOCK_CHUNK):
+    """Returns the IDs of diamonds registered, processed, certified or transferred in a block range."""
+    topics = {
+        event_abi_to_log_topic(contract.events[event_name].abi): topic_index
+        for event_name, topic_index in PROVENANCE_INVALIDATING_EVENTS.items()
+    }
+    diamond_ids = set()
+    while from_block <= to_block:
+        end_block = min(from_block + chunk_size - 1, to_block)
+        logs = contract.w3.eth.get_logs({
+            'address': contract.address,
+            'fromBlock': from_block,
+            'toBlock': end_block,
+            'topics': [["0x" + topic.hex() for topic in topics]]
+        })
+        for log in logs:
+            topic_index = topics[bytes(log["topics"][0])]
+            diamond_ids.add(int.from_bytes(log["topics"][topic_index], "big"))
+        from_block = end_block + 1
+    return diamond_ids
+
+
+def take_snapshot(w3, contract, block_number=None, base=None):
+    """Reads the whole registry as of one block and returns the snapshot document.
+
+    Every read is pinned to block_number (default: latest), so the result is
+    consistent even while the chain moves. With a base snapshot from an
+    earlier block still on chain, only diamonds that emitted a provenance
+    event since then (or are new) are re-read; the rest are carried over.
+    Raises ValueError if a diamond that exists at the block cannot be read,
+    rather than leaving it out of the snapshot.
+    """
+    block = w3.eth.get_block(block_number if block_number is not None else "latest")
+    block_number = block["number"]
+    chain_id = w3.eth.chain_id
+    reader = BatchReader(w3, contract, block_identifier=block_number)
+    total_supply = contract.functions.totalSupply().call(block_identifier=block_number)
+
+    if base is not None and (base["chain_id"] != chain_id or base["contract"] != contract.address
+                             or base["block_number"] > block_number):
+        base = None
+    if base is not None and w3.eth.get_block(base["block_number"])["hash"].to_0x_hex() != base["block_hash"]:
+        # The base block was reorged out, so its rows may hold state that never made it on chain
+        print(f"Snapshot base block {base['block_number']} is no longer on chain, reading every diamond")
+        base = None
+    if base is None:
+        rows = {}
+        to_read = range(1, total_supply + 1)
+    else:
+        rows = {row[0]: row for row in base["diamonds"]}
+        changed = _changed_diamond_ids(contract, base["block_number"] + 1, block_number)
+        changed.update(range(base["total_supply"] + 1, total_supply + 1))
+        to_read = sorted(changed)
+
+    for diamond_id, record in reader.read_diamonds(to_read):
+        if record is None:
+            # Every ID up to totalSupply exists at this block, so a failed read must not drop the diamond
+            raise ValueError(f"Diamond {diamond_id} could not be read at block {block_number}, snapshot aborted")
+        rows[diamond_id] = list(record)
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "chain_id": chain_id,
+        "contract": contract.address,
+        "block_number": block_number,
+        "block_hash": block["hash"].to_0x_hex(),
+        "total_supply": total_supply,
+        "columns": list(SNAPSHOT_COLUMNS),
+        "diamonds": [rows[diamond_id] for diamond_id in sorted(rows)],
+        "diamonds_read": len(to_read),
+    }
+
+
+def _canonical_bytes(snapshot):
+    content = {key: value for key, value in snapshot.items() if key != "diamonds_read"}
+    return json.dumps(content, sort_keys=True, separators=(",", ":")).encode()
+
+
+def write_snapshot(snapshot, directory=SNAPSHOT_DIR):
+    """Writes a snapshot as gzipped canonical JSON named by its sha256. Returns the path.
+
+    The gzip header carries no timestamp, so the same snapshot always
+    produces byte-identical files. LATEST moves to the snapshot unless it
+    already points at a later block (e.g. when a historical block is pinned).
+    """
+    data = _canonical_bytes(snapshot)
+    digest = hashlib.sha256(data).hexdigest()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{digest}.json.gz")
+    if not os.path.exists(path):
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as f:
+            f.write(data)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(temporary_path, path)
+    latest = _read_latest_pointer(directory)
+    if latest is None or latest[1] <= snapshot["block_number"]:
+        pointer_path = os.path.join(directory, LATEST_POINTER)
+        with open(pointer_path + ".tmp", "w") as f:
+            f.write(f"{digest} {snapshot['block_number']}\n")
+        os.replace(pointer_path + ".tmp", pointer_path)
+    return path
+
+
+def _read_latest_pointer(directory):
+    """Returns (content hash, block number) from LATEST, or None."""
+    try:
+        with open(os.path.join(directory, LATEST_POINTER)) as f:
+            digest, block_number = f.read().split()
+    except (FileNotFoundError, ValueError):
+        return None
+    return digest, int(block_number)
+
+
+def resolve_snapshot(reference, directory=SNAPSHOT_DIR):
+    """Turns a path, a (prefix of a) content hash or "latest" into a snapshot path."""
+    if os.path.exists(reference):
+        return reference
+    if reference.lower() == "latest":
+        latest = _read_latest_pointer(directory)
+        if latest is None:
+            raise FileNotFoundError(f"No snapshots in {directory}")
+        reference = latest[0]
+    matches = [name for name in os.listdir(directory) if name.startswith(reference) and name.endswith(".json.gz")] \
+        if os.path.isdir(directory) else []
+    if len(matches) != 1:
+        raise FileNotFoundError(f"{'No' if not matches else 'Ambiguous'} snapshot matching {reference} in {directory}")
+    return os.path.join(directory, matches[0])
+
+
+def load_snapshot(reference, directory=SNAPSHOT_DIR):
+    """Loads a snapshot and checks its content hash against the file name."""
+    path = resolve_snapshot(reference, directory)
+    with gzip.open(path, "rb") as f:
+        data = f.read()
+    name = os.path.basename(path).split(".")[0]
+    if len(name) == 64 and hashlib.sha256(data).hexdigest() != name:
+        raise ValueError(f"Snapshot {path} does not match its content hash")
+    return json.loads(data)
+
+
+def diff_snapshots(old, new):
+    """Returns the registry changes between two snapshots.
+
+    The result lists added and removed diamond IDs, ownership changes
+    (id, from, to) and certification changes (id, certified, certification ID).
+    """
+    owner_index = SNAPSHOT_COLUMNS.index("owner")
+    certified_index = SNAPSHOT_COLUMNS.index("is_certified")
+    certification_index = SNAPSHOT_COLUMNS.index("certification_id")
+    old_rows = {row[0]: row for row in old["diamonds"]}
+    new_rows = {row[0]: row for row in new["diamonds"]}
+
+    ownership = []
+    certification = []
+    for diamond_id, row in new_rows.items():
+        previous = old_rows.get(diamond_id)
+        if previous is None:
+            continue
+        if previous[owner_index] != row[owner_index]:
+            ownership.append({"diamond_id": diamond_id, "from": previous[owner_index], "to": row[owner_index]})
+        if (previous[certified_index], previous[certification_index]) != (row[certified_index], row[certification_index]):
+            certification.append({
+                "diamond_id": diamond_id,
+                "is_certified": row[certified_index],
+                "certification_id": row[certification_index],
+            })
+    return {
+        "from_block": old["block_number"],
+        "to_block": new["block_number"],
+        "added": sorted(set(new_rows) - set(old_rows)),
+        "removed": sorted(set(old_rows) - set(new_rows)),
+        "ownership": sorted(ownership, key=lambda change: change["diamond_id"]),
+        "certification": sorted(certification, key=lambda change: change["diamond_id"]),
+    }
+
+
+def print_diff(diff):
+    """Prints a diff_snapshots() result."""
+    print(f"\n=== REGISTRY CHANGES, BLOCK {diff['from_block']} -> {diff['to_block']} ===")
+    print(f"New diamonds: {len(diff['added'])}" + (f" ({', '.join(map(str, diff['added']))})" if diff['added'] else ""))
+    if diff["removed"]:
+        print(f"Missing diamonds: {', '.join(map(str, diff['removed']))}")
+    print(f"Ownership changes: {len(diff['ownership'])}")
+    for change in diff["ownership"]:
+        print(f"  Diamond {change['diamond_id']}: {change['from']} -> {change['to']}")
+    print(f"Certification changes: {len(diff['certification'])}")
+    for change in diff["certification"]:
+        status = f"certified {change['certification_id']}" if change["is_certified"] else "not certified"
+        print(f"  Diamond {change['diamond_id']}: {status}")
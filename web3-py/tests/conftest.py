@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The scripts import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+pytest.importorskip("eth_tester", reason="needs the optional eth-tester[py-evm] package")
+
+
+@pytest.fixture(scope="module")
+def local_chain():
+    """An eth-tester chain with the contracts deployed and the entities registered.
+
+    Returns (w3, private_keys, entity_contract, provenance_contract, marketplace_contract).
+    """
+    from local_chain import connect_eth_tester, setup_local_chain
+
+    w3, private_keys = connect_eth_tester()
+    return (w3, private_keys) + setup_local_chain(w3, private_keys)
@@ -0,0 +1,142 @@
+import pytest
+from web3 import Web3
+
+import batch_reader
+from batch_reader import BatchReader
+from fake_rpc import FakeRpcEndpoint
+from local_chain import send_local_tx
+
+# Minimal Multicall3.aggregate3: calls every (target, allowFailure, callData) and
+# returns the (success, returnData) tuples, reverting on a disallowed failure
+AGGREGATE3 = [
+    # n = calldata[array], headBase = array + 32; stack: n headBase i out
+    "PUSH1 0x04", "CALLDATALOAD", "PUSH1 0x04", "ADD", "DUP1", "CALLDATALOAD", "SWAP1", "PUSH1 0x20", "ADD",
+    "PUSH1 0x00", "DUP3", "PUSH1 0x05", "SHL", "PUSH1 0x40", "ADD",
+    "loop:",
+    "DUP4", "DUP3", "LT", "ISZERO", "PUSH2 end", "JUMPI",
+    # tuple start, bytes start and length: stack n headBase i out tuple bytes length
+    "DUP2", "PUSH1 0x05", "SHL", "DUP4", "ADD", "CALLDATALOAD", "DUP4", "ADD",
+    "DUP1", "PUSH1 0x40", "ADD", "CALLDATALOAD", "DUP2", "ADD",
+    "DUP1", "CALLDATALOAD",
+    # copy callData to out + 96 and call the target with it
+    "DUP1", "DUP3", "PUSH1 0x20", "ADD", "DUP6", "PUSH1 0x60", "ADD", "CALLDATACOPY",
+    "PUSH1 0x00", "PUSH1 0x00", "DUP3", "DUP7", "PUSH1 0x60", "ADD", "PUSH1 0x00", "DUP8", "CALLDATALOAD", "GAS", "CALL",
+    "DUP1", "PUSH2 ok", "JUMPI",
+    "DUP4", "PUSH1 0x20", "ADD", "CALLDATALOAD", "PUSH2 ok", "JUMPI",
+    "RETURNDATASIZE", "PUSH1 0x00", "PUSH1 0x00", "RETURNDATACOPY", "RETURNDATASIZE", "PUSH1 0x00", "REVERT",
+    "ok:",
+    # out: success, 0x40, returnData length, returnData, zero padding
+    "DUP5", "MSTORE",
+    "PUSH1 0x40", "DUP5", "PUSH1 0x20", "ADD", "MSTORE",
+    "RETURNDATASIZE", "DUP5", "PUSH1 0x40", "ADD", "MSTORE",
+    "RETURNDATASIZE", "PUSH1 0x00", "DUP6", "PUSH1 0x60", "ADD", "RETURNDATACOPY",
+    "PUSH1 0x00", "RETURNDATASIZE", "DUP6", "PUSH1 0x60", "ADD", "ADD", "MSTORE",
+    # head offset of this tuple, then move out past it
+    "PUSH1 0x40", "DUP5", "SUB", "DUP6", "PUSH1 0x05", "SHL", "PUSH1 0x40", "ADD", "MSTORE",
+    "POP", "POP", "POP",
+    "RETURNDATASIZE", "PUSH1 0x1f", "ADD", "PUSH1 0x05", "SHR", "PUSH1 0x05", "SHL", "ADD", "PUSH1 0x60", "ADD",
+    "SWAP1", "PUSH1 0x01", "ADD", "SWAP1",
+    "PUSH2 loop", "JUMP",
+    "end:",
+    "PUSH1 0x20", "PUSH1 0x00", "MSTORE", "DUP4", "PUSH1 0x20", "MSTORE", "PUSH1 0x00", "RETURN",
+]
+
+OPCODES = {
+    "ADD": 0x01, "SUB": 0x03, "LT": 0x10, "ISZERO": 0x15, "SHL": 0x1b, "SHR": 0x1c,
+    "CALLDATALOAD": 0x35, "CALLDATACOPY": 0x37, "CODECOPY": 0x39, "RETURNDATASIZE": 0x3d, "RETURNDATACOPY": 0x3e,
+    "POP": 0x50, "MSTORE": 0x52, "JUMP": 0x56, "JUMPI": 0x57, "GAS": 0x5a, "JUMPDEST": 0x5b,
+    "PUSH1": 0x60, "PUSH2": 0x61, "DUP1": 0x80, "SWAP1": 0x90, "CALL": 0xf1, "RETURN": 0xf3, "REVERT": 0xfd,
+}
+OPCODES.update({f"DUP{n}": 0x7f + n for n in range(2, 9)})
+
+
+def assemble(program):
+    """Assembles the instruction list above; labels become JUMPDESTs and PUSH2 operands."""
+    labels = {}
+    size = 0
+    for instruction in program:
+        if instruction.endswith(":"):
+            labels[instruction[:-1]] = size
+            size += 1
+        else:
+            size += {"PUSH1": 2, "PUSH2": 3}.get(instruction.split()[0], 1)
+    code = bytearray()
+    for instruction in program:
+        if instruction.endswith(":"):
+            code.append(OPCODES["JUMPDEST"])
+            continue
+        opcode, *operand = instruction.split()
+        code.append(OPCODES[opcode])
+        if operand:
+            value = labels[operand[0]] if operand[0] in labels else int(operand[0], 16)
+            code += value.to_bytes(1 if opcode == "PUSH1" else 2, "big")
+    return bytes(code)
+
+
+def deploy_aggregate3(w3, private_key):
+    runtime = assemble(AGGREGATE3)
+    # PUSH2 len, DUP1, PUSH1 12, PUSH1 0, CODECOPY, PUSH1 0, RETURN, then the runtime code
+    init = bytes([0x61]) + len(runtime).to_bytes(2, "big") + bytes.fromhex("80600c6000396000f3") + runtime
+    contract = w3.eth.contract(abi=batch_reader.MULTICALL3_ABI, bytecode=init)
+    return send_local_tx(w3, private_key, contract.constructor()).contractAddress
+
+
+@pytest.fixture(scope="module")
+def diamonds(local_chain):
+    """Registers three raw diamonds and processes and certifies one. Returns the local chain."""
+    w3, private_keys, _, provenance, _ = local_chain
+    miner_key, manufacturer_key, certifier_key = private_keys[1:4]
+    for number in range(3):
+        send_local_tx(w3, miner_key, provenance.functions.registerRawDiamond(
+            f"Reader Mine #{number}", 1700000000 + number, 100 + number, "reader test diamond"
+        ))
+    send_local_tx(w3, miner_key, provenance.functions.transferDiamond(2, w3.eth.accounts[2]))
+    send_local_tx(w3, manufacturer_key, provenance.functions.processDiamond(2, 60, "reader cut"))
+    send_local_tx(w3, manufacturer_key, provenance.functions.transferDiamond(4, w3.eth.accounts[3]))
+    send_local_tx(w3, certifier_key, provenance.functions.certifyDiamond(4, "GIA-READER-1"))
+    return local_chain
+
+
+def read_all(reader):
+    # Diamond 9 does not exist
+    return list(reader.read_diamonds([1, 2, 3, 4, 9]))
+
+
+def test_modes_return_identical_results(diamonds, monkeypatch):
+    w3, private_keys, _, provenance, _ = diamonds
+    sequential = read_all(BatchReader(w3, provenance, chunk_size=2, mode="sequential"))
+
+    assert [diamond_id for diamond_id, _ in sequential] == [1, 2, 3, 4, 9]
+    assert sequential[-1][1] is None
+    assert sequential[3][1].is_certified and sequential[3][1].raw_diamond_id == 2
+    assert sequential[1][1].owner == w3.eth.accounts[2]
+
+    monkeypatch.setattr(batch_reader, "MULTICALL3_ADDRESS", deploy_aggregate3(w3, private_keys[0]))
+    multicall_reader = BatchReader(w3, provenance, chunk_size=2, mode="multicall")
+    assert read_all(multicall_reader) == sequential
+    assert multicall_reader.round_trips == 3
+
+    # eth-tester cannot batch, so batch mode goes through a local JSON-RPC endpoint
+    endpoint = FakeRpcEndpoint(w3).start()
+    try:
+        http_w3 = Web3(Web3.HTTPProvider(endpoint.url))
+        http_provenance = http_w3.eth.contract(address=provenance.address, abi=provenance.abi)
+        batch_reader_ = BatchReader(http_w3, http_provenance, chunk_size=2, mode="batch")
+        assert read_all(batch_reader_) == sequential
+        assert batch_reader_.mode == "batch"
+    finally:
+        endpoint.stop()
+
+
+def test_transport_errors_are_raised_not_reported_missing(diamonds):
+    w3, _, _, provenance, _ = diamonds
+    endpoint = FakeRpcEndpoint(w3, rate_limit_rate=1.0).start()
+    try:
+        http_w3 = Web3(Web3.HTTPProvider(endpoint.url, exception_retry_configuration=None))
+        http_provenance = http_w3.eth.contract(address=provenance.address, abi=provenance.abi)
+        for mode in ("batch", "sequential"):
+            with pytest.raises(Exception) as excinfo:
+                read_all(BatchReader(http_w3, http_provenance, mode=mode))
+            assert not isinstance(excinfo.value, batch_reader.CALL_REVERTED_ERRORS)
+    finally:
+        endpoint.stop()
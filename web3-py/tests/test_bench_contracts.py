@@ -0,0 +1,28 @@
+import json
+
+import bench_contracts
+
+
+def test_gas_has_not_regressed_against_the_baseline():
+    # Scale 1 only and gas only: fast, and gas is deterministic on eth-tester
+    with open(bench_contracts.CONTRACT_BENCH_BASELINE) as f:
+        baseline = json.load(f)
+    results = bench_contracts.run_benchmarks([1], view_repeats=1)
+
+    assert set(results["1"]) == set(baseline["results"]["1"])
+    assert bench_contracts.compare_to_baseline(results, baseline, check_time=False) == []
+
+
+def test_compare_to_baseline_flags_gas_growth_but_not_noise():
+    baseline = {"results": {"1": {"f": {"gas": 1000, "ms": 10.0}}}}
+    assert bench_contracts.compare_to_baseline({"1": {"f": {"gas": 1015, "ms": 10.0}}}, baseline) == []
+    assert bench_contracts.compare_to_baseline({"1": {"f": {"gas": 1100, "ms": 10.0}}}, baseline) == \
+        ["f @ 1: gas 1000 -> 1100"]
+    # Slower, but within the time floor
+    assert bench_contracts.compare_to_baseline({"1": {"f": {"gas": 1000, "ms": 14.0}}}, baseline) == []
+    assert bench_contracts.compare_to_baseline({"1": {"f": {"gas": 1000, "ms": 40.0}}}, baseline,
+                                               check_time=False) == []
+    assert bench_contracts.compare_to_baseline({"1": {"f": {"gas": 1000, "ms": 40.0}}}, baseline) == \
+        ["f @ 1: 10.00 ms -> 40.00 ms"]
+    # Unknown scales and functions are not compared
+    assert bench_contracts.compare_to_baseline({"5": {"f": {"gas": 9999, "ms": 1.0}}}, baseline) == []
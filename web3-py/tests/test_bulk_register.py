@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from eth_account import Account
+
+import diamond_lifecycle
+from bulk_register import Checkpoint, reconcile_sent, run_ingestion
+from nonce_manager import TransactionPipeline
+from dab_client import get_account
+from local_chain import send_local_tx
+
+
+@pytest.fixture
+def pipeline(local_chain, monkeypatch):
+    monkeypatch.setattr(diamond_lifecycle, "PREFLIGHT", False)
+    w3, private_keys = local_chain[:2]
+    return TransactionPipeline(w3, private_keys[1], w3.eth.chain_id, max_in_flight=4, poll_interval=0.05)
+
+
+def write_manifest(path, rows):
+    with open(path, 'w') as f:
+        f.write("origin,extraction_date,weight,characteristics\n")
+        for row in rows:
+            f.write(",".join(row) + "\n")
+    return str(path)
+
+
+def checkpoint_entries(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def test_ingestion_records_every_row_and_resumes_from_the_checkpoint(local_chain, pipeline, tmp_path):
+    provenance = local_chain[3]
+    manifest = write_manifest(tmp_path / "manifest.csv", [
+        ("Jwaneng", "2024-01-01", "150", "rough 1"),
+        ("Orapa", "1700000000", "210", "rough 2"),
+        ("Catoca", "2024-01-03", "0", "weightless"),
+        ("Argyle", "2024-01-04", "90", "rough 4"),
+    ])
+    supply_before = provenance.functions.totalSupply().call()
+
+    checkpoint = Checkpoint(str(tmp_path / "manifest.checkpoint"))
+    stats, latencies = run_ingestion(pipeline.w3, provenance, pipeline, manifest, checkpoint)
+    checkpoint.close()
+    assert stats == {"registered": 3, "failed": 0, "unconfirmed": 0, "invalid": 1, "skipped": 0}
+    assert len(latencies) == 3
+    assert provenance.functions.totalSupply().call() == supply_before + 3
+
+    entries = checkpoint_entries(checkpoint.path)
+    # Each registration is checkpointed as sent before it is confirmed
+    for row_number in (1, 2, 4):
+        statuses = [entry["status"] for entry in entries if entry["row"] == row_number]
+        assert statuses == ["sent", "done"]
+    done = {entry["row"]: entry for entry in entries if entry["status"] == "done"}
+    assert sorted(entry["diamond_id"] for entry in done.values()) == \
+        list(range(supply_before + 1, supply_before + 4))
+    assert provenance.functions.getDiamondBasicInfo(done[2]["diamond_id"]).call()[0] == "Orapa"
+    assert [entry["row"] for entry in entries if entry["status"] == "invalid"] == [3]
+
+    resumed = Checkpoint(checkpoint.path)
+    assert resumed.done == {1, 2, 3, 4} and resumed.sent == {}
+    stats, _ = run_ingestion(pipeline.w3, provenance, pipeline, manifest, resumed)
+    resumed.close()
+    assert stats["skipped"] == 4 and stats["registered"] == 0
+    assert provenance.functions.totalSupply().call() == supply_before + 3
+
+
+def test_reconcile_settles_rows_a_crashed_run_left_sent(local_chain, pipeline, tmp_path):
+    w3, private_keys, _, provenance, _ = local_chain
+    miner_key = private_keys[1]
+    miner = get_account(miner_key).address
+    mined = send_local_tx(w3, miner_key, provenance.functions.registerRawDiamond(
+        "Jwaneng", 1700000000, 150, "sent before the crash"))
+    # The miner is not a certifier: with a fixed gas limit the call is mined and reverts
+    reverted_tx = Account.sign_transaction(provenance.functions.certifyDiamond(1, "GIA-CRASH").build_transaction({
+        'from': miner, 'nonce': w3.eth.get_transaction_count(miner), 'gas': 300000,
+        'gasPrice': w3.eth.gas_price, 'chainId': w3.eth.chain_id
+    }), miner_key)
+    w3.eth.send_raw_transaction(reverted_tx.raw_transaction)
+    assert w3.eth.get_transaction_receipt(reverted_tx.hash).status == 0
+    never_sent = "0x" + "ab" * 32
+
+    path = str(tmp_path / "crashed.checkpoint")
+    with open(path, 'w') as f:
+        for row_number, tx_hash in enumerate(
+                (mined.transactionHash.to_0x_hex(), reverted_tx.hash.to_0x_hex(), never_sent), start=1):
+            f.write(json.dumps({"row": row_number, "status": "sent", "tx": tx_hash}) + "\n")
+        f.write('{"row": 4, "status": "se')  # torn by the crash
+
+    checkpoint = Checkpoint(path)
+    assert set(checkpoint.sent) == {1, 2, 3}
+    reconcile_sent(w3, provenance, checkpoint)
+    assert checkpoint.sent == {}
+    assert checkpoint.done == {1}
+    checkpoint.close()
+
+    # The crash tore the last line; the entries written after it still read back
+    entries = checkpoint_entries(path)
+    assert {"row": 1, "status": "done", "tx": mined.transactionHash.to_0x_hex(),
+            "diamond_id": provenance.functions.totalSupply().call()} in entries
+    assert [entry["row"] for entry in entries if entry["status"] == "failed"] == [2]
+
+    # Only the reverted and the never mined rows are registered again
+    manifest = write_manifest(tmp_path / "crashed.csv", [
+        ("Jwaneng", "1700000000", "150", "sent before the crash"),
+        ("Orapa", "1700000000", "160", "reverted"),
+        ("Catoca", "1700000000", "170", "never sent"),
+    ])
+    supply_before = provenance.functions.totalSupply().call()
+    resumed = Checkpoint(path)
+    stats, _ = run_ingestion(w3, provenance, pipeline, manifest, resumed)
+    resumed.close()
+    assert stats["skipped"] == 1 and stats["registered"] == 2
+    assert provenance.functions.totalSupply().call() == supply_before + 2
+
@@ -0,0 +1,96 @@
+import io
+import json
+import queue
+
+import event_stream
+from event_stream import EventDecoder, LogPoller, watch_events, read_cursor
+from local_chain import send_local_tx
+
+
+def register(local_chain, origin):
+    w3, private_keys, _, provenance, _ = local_chain
+    return send_local_tx(w3, private_keys[1], provenance.functions.registerRawDiamond(
+        origin, 1700000000, 100, "event stream test diamond"))
+
+
+def drain(events):
+    """Returns (event dicts, cursors) enqueued so far."""
+    items = []
+    while not events.empty():
+        items.append(events.get_nowait())
+    return [item for kind, item in items if kind == "event"], [item for kind, item in items if kind == "cursor"]
+
+
+def origins(emitted):
+    return [event["args"]["origin"] for event in emitted if event["event"] == "DiamondRegistered"]
+
+
+def reorg(local_chain, snapshot_id, *replacement_origins):
+    """Drops the blocks after a snapshot and mines other registrations in their place."""
+    local_chain[0].provider.ethereum_tester.revert_to_snapshot(snapshot_id)
+    for origin in replacement_origins:
+        register(local_chain, origin)
+
+
+def test_poller_rewinds_and_reemits_after_a_reorg(local_chain, monkeypatch):
+    monkeypatch.setattr(event_stream, "REORG_DEPTH", 2)
+    w3, provenance = local_chain[0], local_chain[3]
+    tester = w3.provider.ethereum_tester
+    start_block = w3.eth.block_number + 1
+    register(local_chain, "Stream Kept")
+    snapshot_id = tester.take_snapshot()
+    orphaned = register(local_chain, "Stream Orphaned")
+
+    events = queue.Queue()
+    poller = LogPoller(w3, EventDecoder(provenance), start_block, events, chunk_size=1, ws_url=None,
+                       confirmations=0, max_retries=1)
+    poller.poll()
+    emitted, cursors = drain(events)
+    assert origins(emitted) == ["Stream Kept", "Stream Orphaned"]
+    assert cursors[-1] == (orphaned.blockNumber, orphaned.blockHash.to_0x_hex())
+
+    reorg(local_chain, snapshot_id, "Stream Replacement", "Stream After")
+    poller.poll()
+    emitted, cursors = drain(events)
+    assert poller.reorgs == 1
+    # Rewound REORG_DEPTH blocks from the replaced one, so the kept block is emitted again
+    assert emitted[0]["block_number"] == orphaned.blockNumber - 1
+    assert origins(emitted) == ["Stream Kept", "Stream Replacement", "Stream After"]
+    assert orphaned.blockHash.to_0x_hex() not in {event["block_hash"] for event in emitted}
+    assert cursors[-1] == (w3.eth.block_number, w3.eth.get_block("latest")["hash"].to_0x_hex())
+
+    poller.poll()
+    assert drain(events) == ([], []) and poller.reorgs == 1
+
+
+def test_watch_resumes_from_the_cursor_and_checks_its_block(local_chain, tmp_path, monkeypatch):
+    monkeypatch.setattr(event_stream, "REORG_DEPTH", 2)
+    w3, provenance = local_chain[0], local_chain[3]
+    tester = w3.provider.ethereum_tester
+    cursor_path = str(tmp_path / "watch.cursor")
+    options = dict(cursor_path=cursor_path, ws_url=None, poll_interval=0.05, confirmations=0, max_retries=1)
+
+    def watch(**extra):
+        # One block range reaches the head, so the first cursor after an event ends the watch
+        output = io.StringIO()
+        written = watch_events(w3, provenance, output=output, max_events=1, **options, **extra)
+        emitted = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert written == len(emitted)
+        return emitted
+
+    start_block = w3.eth.block_number + 1
+    register(local_chain, "Watch #1")
+    register(local_chain, "Watch #2")
+    assert origins(watch(from_block=start_block)) == ["Watch #1", "Watch #2"]
+    cursor = read_cursor(cursor_path)
+    assert cursor == (w3.eth.block_number, w3.eth.get_block("latest")["hash"].to_0x_hex())
+
+    # Resumes after the cursor, not at from_block
+    snapshot_id = tester.take_snapshot()
+    register(local_chain, "Watch #3")
+    assert origins(watch(from_block=start_block)) == ["Watch #3"]
+
+    # The cursor's block is replaced while the watcher is down: the restart rewinds past it
+    reorg(local_chain, snapshot_id, "Watch #3 replacement", "Watch #4")
+    assert origins(watch()) == ["Watch #2", "Watch #3 replacement", "Watch #4"]
+    assert read_cursor(cursor_path)[1] == w3.eth.get_block("latest")["hash"].to_0x_hex()
@@ -0,0 +1,33 @@
+import pytest
+
+from gas_strategy import GasEstimator, _call_signature
+from local_chain import send_local_tx
+
+
+def test_only_calls_without_diamond_state_are_memoized(local_chain):
+    w3, private_keys, _, provenance, _ = local_chain
+    miner = w3.eth.accounts[1]
+    estimator = GasEstimator(w3)
+
+    register = provenance.functions.registerRawDiamond("Gas Mine", 1700000000, 100, "gas test diamond")
+    limit = estimator.gas_limit(register, miner)
+    assert limit == int(register.estimate_gas({'from': miner}) * estimator.margin)
+    # Same argument sizes: answered from the memo
+    assert estimator.gas_limit(
+        provenance.functions.registerRawDiamond("Gas Mine", 1700000001, 101, "gas test diamond"), miner
+    ) == limit
+    assert len(estimator._estimates) == 1
+
+    send_local_tx(w3, private_keys[1], register)
+    transfer = provenance.functions.transferDiamond(1, w3.eth.accounts[2])
+    assert _call_signature(transfer, miner) is None
+    assert estimator.gas_limit(transfer, miner) > 21000
+    assert len(estimator._estimates) == 1
+
+
+def test_failed_estimate_is_raised(local_chain):
+    w3, _, _, provenance, _ = local_chain
+    estimator = GasEstimator(w3)
+    # The miner is not a certifier, so the call would revert
+    with pytest.raises(Exception):
+        estimator.gas_limit(provenance.functions.certifyDiamond(1, "GIA-GAS-1"), w3.eth.accounts[1])
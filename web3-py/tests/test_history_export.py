@@ -0,0 +1,83 @@
+import pytest
+
+import history_export
+from history_export import export_history, load_columns, median_days_to_retail, parse_history_record
+from batch_reader import BatchReader
+from dab_client import get_account
+from local_chain import send_local_tx
+from receipt_events import get_registered_diamond_id, get_processed_diamond_id
+
+DAY = history_export.SECONDS_PER_DAY
+
+
+@pytest.fixture(scope="module")
+def sold(local_chain):
+    """Three diamonds cut from raw diamonds and sold at retail, plus one unsold raw diamond.
+
+    Returns the expected median_days_to_retail() result, {mine: (median days, diamonds)}.
+    """
+    w3, private_keys, _, provenance, _ = local_chain
+    miner, manufacturer, certifier, retailer = private_keys[1:5]
+    consumer = w3.eth.accounts[6]
+    now = w3.eth.get_block("latest")["timestamp"]
+
+    def register(origin, days_ago):
+        return get_registered_diamond_id(provenance, send_local_tx(w3, miner, provenance.functions.registerRawDiamond(
+            origin, now - days_ago * DAY, 200, "export test rough"
+        )))
+
+    def sell_at_retail(raw_diamond_id):
+        send_local_tx(w3, miner, provenance.functions.transferDiamond(raw_diamond_id, get_account(manufacturer).address))
+        diamond_id = get_processed_diamond_id(provenance, send_local_tx(
+            w3, manufacturer, provenance.functions.processDiamond(raw_diamond_id, 100, "export test cut")))
+        send_local_tx(w3, manufacturer, provenance.functions.transferDiamond(diamond_id, get_account(certifier).address))
+        send_local_tx(w3, certifier, provenance.functions.certifyDiamond(diamond_id, f"GIA-EXPORT-{diamond_id}"))
+        send_local_tx(w3, certifier, provenance.functions.transferDiamond(diamond_id, get_account(retailer).address))
+        send_local_tx(w3, retailer, provenance.functions.transferDiamond(diamond_id, consumer))
+
+    for origin, days_ago in (("Jwaneng #1", 10), ("Jwaneng #2", 20), ("Orapa #7", 4)):
+        sell_at_retail(register(origin, days_ago))
+    register("Catoca #1", 30)
+    return {"Jwaneng": (15, 2), "Orapa": (4, 1)}
+
+
+def test_parse_history_record_keeps_separators_in_the_details():
+    assert parse_history_record("1700000000 | RETAIL_SALE | 0xabc | Listing 3 | sold") == \
+        (1700000000, "RETAIL_SALE", "0xabc", "Listing 3 | sold")
+    assert parse_history_record("1700000000 | REGISTERED | 0xabc") == (1700000000, "REGISTERED", "0xabc", "")
+    assert parse_history_record("not a record") is None
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "npz"])
+def test_export_round_trips_and_answers_the_retail_query(local_chain, sold, tmp_path, output_format):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    pytest.importorskip("numpy")
+    w3, provenance = local_chain[0], local_chain[3]
+    reader = BatchReader(w3, provenance, block_identifier=w3.eth.block_number)
+    total_supply = provenance.functions.totalSupply().call()
+    histories = {diamond_id: provenance.functions.getDiamondHistory(diamond_id).call()
+                 for diamond_id in range(1, total_supply + 1)}
+
+    # A chunk size that does not divide the supply, so the last part is short
+    assert export_history(reader, str(tmp_path), output_format, chunk_size=3) == \
+        (total_supply, sum(len(history) for history in histories.values()))
+
+    diamonds = load_columns(str(tmp_path), "diamonds", history_export.DIAMOND_COLUMNS)
+    assert diamonds["diamond_id"].tolist() == list(range(1, total_supply + 1))
+    assert sorted(set(diamonds["origin"].tolist())) == ["Catoca #1", "Jwaneng #1", "Jwaneng #2", "Orapa #7"]
+    assert diamonds["is_certified"].sum() == 3
+    assert (diamonds["raw_diamond_id"] != 0).sum() == 3
+
+    events = load_columns(str(tmp_path), "events", history_export.EVENT_COLUMNS)
+    exported = [(int(diamond_id), int(sequence), str(action)) for diamond_id, sequence, action
+                in zip(events["diamond_id"], events["sequence"], events["action"])]
+    assert exported == [(diamond_id, sequence, parse_history_record(record)[1])
+                        for diamond_id, history in histories.items() for sequence, record in enumerate(history)]
+    assert (events["action"] == "RETAIL_SALE").sum() == 3
+
+    medians = median_days_to_retail(str(tmp_path))
+    assert sorted(medians) == sorted(sold)
+    for origin, (days, count) in sold.items():
+        assert medians[origin][0] == pytest.approx(days, abs=0.01)
+        assert medians[origin][1] == count
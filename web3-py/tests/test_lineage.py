@@ -0,0 +1,97 @@
+import json
+from xml.etree import ElementTree
+
+import pytest
+
+from lineage import LineageGraph, build_full_lineage, build_lineage
+from batch_reader import BatchReader
+from dab_client import get_account
+from local_chain import send_local_tx
+from receipt_events import get_registered_diamond_id, get_processed_diamond_id
+
+
+@pytest.fixture(scope="module")
+def tree(local_chain):
+    """Raw diamond A processed into B and C, B processed into D, and a separate raw diamond E.
+
+    Returns {name: diamond ID}.
+    """
+    w3, private_keys, _, provenance, _ = local_chain
+    miner_key, manufacturer_key = private_keys[1], private_keys[2]
+
+    def register(name):
+        return get_registered_diamond_id(provenance, send_local_tx(
+            w3, miner_key, provenance.functions.registerRawDiamond(name, 1700000000, 300, "lineage test")))
+
+    def process(diamond_id, weight):
+        return get_processed_diamond_id(provenance, send_local_tx(
+            w3, manufacturer_key, provenance.functions.processDiamond(diamond_id, weight, "lineage cut")))
+
+    ids = {"A": register("Lineage A"), "E": register("Lineage E")}
+    send_local_tx(w3, miner_key, provenance.functions.transferDiamond(
+        ids["A"], get_account(manufacturer_key).address))
+    ids["B"] = process(ids["A"], 150)
+    ids["C"] = process(ids["A"], 100)
+    ids["D"] = process(ids["B"], 80)
+    return ids
+
+
+def test_graph_memoizes_lookups_and_invalidates_them_on_new_edges():
+    graph = LineageGraph()
+    for parent_id, diamond_id in ((None, 1), (1, 2), (1, 3), (2, 4)):
+        graph.add_edge(parent_id, diamond_id)
+
+    assert graph.descendants(1) == (2, 3, 4)
+    assert graph.root_ancestor(4) == 1
+    assert graph._roots == {1: 1, 2: 1, 4: 1}
+
+    graph.add_edge(2, 4)  # already known: the memos are kept
+    assert graph._descendants and graph._roots
+    graph.add_edge(4, 5)
+    assert not graph._descendants and not graph._roots
+    assert graph.descendants(1) == (2, 3, 4, 5)
+    assert graph.root_ancestor(5) == 1
+
+    # An edge to a diamond not read yet still makes the parent a node
+    graph.add_edge(10, 11)
+    assert 10 in graph and graph.roots() == [1, 10]
+    assert graph.edges() == [(1, 2), (1, 3), (2, 4), (4, 5), (10, 11)]
+    assert len(graph) == 7
+
+
+def test_full_lineage_matches_the_chain(local_chain, tree, tmp_path):
+    w3, provenance = local_chain[0], local_chain[3]
+    graph = build_full_lineage(BatchReader(w3, provenance))
+
+    assert (tree["A"], tree["B"]) in graph.edges()
+    assert graph.descendants(tree["A"]) == tuple(sorted((tree["B"], tree["C"], tree["D"])))
+    assert graph.descendants(tree["E"]) == ()
+    assert graph.root_ancestor(tree["D"]) == tree["A"]
+    assert {tree["A"], tree["E"]} <= set(graph.roots())
+    assert graph.attributes[tree["D"]]["weight"] == 80
+    assert graph.attributes[tree["D"]]["origin"] == "Lineage A"
+
+    graph.write_json(tmp_path / "lineage.json")
+    with open(tmp_path / "lineage.json") as f:
+        document = json.load(f)
+    assert {"source": tree["B"], "target": tree["D"]} in document["edges"]
+    assert next(node for node in document["nodes"] if node["id"] == tree["D"])["root"] == tree["A"]
+
+    graph.write_graphml(tmp_path / "lineage.graphml")
+    namespace = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    root = ElementTree.parse(tmp_path / "lineage.graphml").getroot()
+    edges = {(edge.get("source"), edge.get("target")) for edge in root.iterfind("g:graph/g:edge", namespace)}
+    assert (f"d{tree['A']}", f"d{tree['C']}") in edges
+    assert len(edges) == len(graph.edges())
+
+
+def test_lineage_of_one_diamond_fans_out_to_its_whole_tree(local_chain, tree):
+    w3, provenance = local_chain[0], local_chain[3]
+    reader = BatchReader(w3, provenance)
+    graph = build_lineage(reader, [tree["C"]], from_block=0)
+
+    # Up from C to A, then down from A to B and from B to D
+    assert sorted(graph.parents) == sorted((tree["A"], tree["B"], tree["C"], tree["D"]))
+    assert tree["E"] not in graph
+    assert graph.roots() == [tree["A"]]
+    assert graph.descendants(tree["A"]) == tuple(sorted((tree["B"], tree["C"], tree["D"])))
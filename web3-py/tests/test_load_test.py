@@ -0,0 +1,26 @@
+import json
+import asyncio
+import argparse
+
+import load_test
+
+
+def test_small_load_test_completes_every_lifecycle(tmp_path):
+    output = tmp_path / "load_test_summary.json"
+    args = argparse.Namespace(diamonds=3, rate=0, eth_tester=True, rpc_url=None, output=str(output))
+    asyncio.run(load_test.async_main(args))
+
+    with open(output) as f:
+        summary = json.load(f)
+    assert summary["diamonds"] == 3
+    assert summary["completed"] == 3
+    assert summary["failures"] == []
+    assert summary["transactions"] == 3 * len(load_test.LIFECYCLE_STEPS)
+    assert summary["tx_per_second"] > 0
+    assert summary["gas_per_diamond"]["count"] == 3
+    for step_name in load_test.LIFECYCLE_STEPS:
+        step = summary["steps"][step_name]
+        assert step["latency_seconds"]["count"] == 3
+        assert step["gas_used"]["p50"] > 21000
+    # All lifecycles run the same calls, so they cost about the same gas
+    assert summary["gas_per_diamond"]["p99"] < 1.5 * summary["gas_per_diamond"]["p50"]
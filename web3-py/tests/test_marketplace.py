@@ -0,0 +1,51 @@
+from marketplace import ActiveListingCache
+from dab_client import get_account
+from local_chain import send_local_tx
+from receipt_events import get_registered_diamond_id
+
+
+def test_cache_follows_listing_events_and_invalidates_details(local_chain):
+    w3, private_keys, _, provenance, marketplace = local_chain
+    miner_key = private_keys[1]
+    miner = get_account(miner_key).address
+    buyer = get_account(private_keys[2]).address  # the manufacturer: miners may only transfer to one
+    diamond_ids = [
+        get_registered_diamond_id(provenance, send_local_tx(w3, miner_key, provenance.functions.registerRawDiamond(
+            f"Market Mine #{number}", 1700000000, 100 + number, "marketplace test diamond"
+        )))
+        for number in range(5)
+    ]
+
+    def list_diamond(diamond_id):
+        receipt = send_local_tx(w3, miner_key, marketplace.functions.listDiamond(diamond_id))
+        return marketplace.events.DiamondListed().process_receipt(receipt)[0].args.listingId
+
+    cancelled, sold, stolen, transferred = [list_diamond(diamond_id) for diamond_id in diamond_ids[:4]]
+    cache = ActiveListingCache(w3, marketplace, provenance)
+    assert cache.seed() == 4
+    page = cache.page()
+    assert [listing.listing_id for listing, _ in page] == [cancelled, sold, stolen, transferred]
+    assert all(listing.listed_at and details.is_listed and details.owner == miner for listing, details in page)
+
+    send_local_tx(w3, miner_key, marketplace.functions.cancelListing(cancelled))
+    send_local_tx(w3, miner_key, marketplace.functions.directCompleteSale(sold, buyer))
+    send_local_tx(w3, miner_key, marketplace.functions.reportStolenDiamond(diamond_ids[2], "marketplace test"))
+    # Not a marketplace event, but it changes the listed diamond's owner
+    send_local_tx(w3, miner_key, provenance.functions.transferDiamond(diamond_ids[3], buyer))
+    listed = list_diamond(diamond_ids[4])
+
+    assert cache.sync() == 4
+    assert cache.block_number == w3.eth.block_number
+    assert cache.active_listing_ids() == [transferred, listed]
+    assert diamond_ids[1] not in cache._details and diamond_ids[3] not in cache._details
+
+    (old_listing, old_details), (new_listing, new_details) = cache.page()
+    assert old_details.owner == buyer
+    # Learned from the event, then hydrated with its listing date
+    assert new_listing.diamond_id == diamond_ids[4] and new_listing.seller == miner
+    assert new_listing.listed_at is not None and new_details.is_listed
+
+    reseeded = ActiveListingCache(w3, marketplace, provenance)
+    reseeded.seed()
+    assert [listing for listing, _ in reseeded.page()] == [old_listing, new_listing]
+    assert cache.sync() == 0
@@ -0,0 +1,132 @@
+import pytest
+
+from nonce_manager import NonceManager, TransactionPipeline
+from dab_client import get_account
+from local_chain import send_local_tx
+
+
+@pytest.fixture
+def miner(local_chain):
+    """Returns (w3, miner private key, miner address)."""
+    w3, private_keys = local_chain[:2]
+    return w3, private_keys[1], get_account(private_keys[1]).address
+
+
+def register(provenance, name):
+    return provenance.functions.registerRawDiamond(name, 1700000000, 100, "nonce test diamond")
+
+
+def test_released_nonces_are_handed_out_before_new_ones(miner):
+    w3, _, address = miner
+    base = w3.eth.get_transaction_count(address, "pending")
+    nonces = NonceManager(w3, address)
+
+    assert [nonces.allocate() for _ in range(3)] == [base, base + 1, base + 2]
+    nonces.release(base + 1)
+    nonces.release(base + 1)  # only reserved nonces can be released
+    assert nonces.allocate() == base + 1
+    assert nonces.allocate() == base + 3
+
+    nonces.refill(base)
+    nonces.refill(base)
+    assert nonces.allocate() == base
+    assert nonces.allocate() == base + 4
+
+
+def test_resync_waits_for_reserved_nonces_and_never_moves_back(local_chain, miner):
+    w3, key, address = miner
+    provenance = local_chain[3]
+    base = w3.eth.get_transaction_count(address, "pending")
+    nonces = NonceManager(w3, address)
+    reserved = nonces.allocate()
+
+    # Another sender uses two of this account's nonces
+    send_local_tx(w3, key, register(provenance, "Nonce Other #1"))
+    send_local_tx(w3, key, register(provenance, "Nonce Other #2"))
+    nonces.resync()
+    assert nonces._next_nonce == base + 1
+    nonces.sent(reserved)
+    assert nonces._next_nonce == base + 2
+    assert nonces.allocate() == base + 2
+
+    # Nonces handed out but not mined yet are ahead of the node
+    nonces.allocate()
+    nonces.sent(base + 2)
+    nonces.sent(base + 3)
+    nonces.resync()
+    assert nonces.allocate() == base + 4
+
+
+@pytest.fixture
+def pipeline(miner):
+    w3, key, _ = miner
+    return TransactionPipeline(w3, key, w3.eth.chain_id, max_in_flight=2, poll_interval=0.05)
+
+
+def test_failed_build_releases_the_nonce(local_chain, pipeline):
+    provenance = local_chain[3]
+    nonce = pipeline.nonces.allocate()
+    pipeline.nonces.release(nonce)
+
+    # The miner is not a certifier, so gas estimation reverts
+    with pytest.raises(Exception):
+        pipeline.submit(provenance.functions.certifyDiamond(1, "GIA-NONCE-1"))
+    assert pipeline.nonces._released == [nonce]
+    assert pipeline._slots._value == pipeline.max_in_flight
+
+    pending = pipeline.submit(register(provenance, "Nonce After Build Failure"))
+    assert pending.nonce == nonce
+    assert pending.result(timeout=10)["status"] == 1
+
+
+def test_nonce_used_by_another_sender_is_signed_again(local_chain, miner, pipeline):
+    w3, key, address = miner
+    provenance = local_chain[3]
+    pipeline.submit(register(provenance, "Nonce Pipeline #1")).result(timeout=10)
+
+    # eth-tester rejects the stale nonce with "Invalid transaction nonce", not "nonce too low"
+    send_local_tx(w3, key, register(provenance, "Nonce Other Sender"))
+    pending = pipeline.submit(register(provenance, "Nonce Pipeline #2"))
+    assert pending.result(timeout=10)["status"] == 1
+    assert pending.nonce == w3.eth.get_transaction_count(address) - 1
+    assert not pipeline.nonces._reserved and not pipeline.nonces._released
+
+
+def test_rejected_send_releases_the_nonce(local_chain, pipeline, monkeypatch):
+    w3 = pipeline.w3
+    provenance = local_chain[3]
+    nonce = w3.eth.get_transaction_count(pipeline.address, "pending")
+
+    def reject(raw_transaction):
+        raise ValueError("insufficient funds for gas * price + value")
+
+    monkeypatch.setattr(w3.eth, "send_raw_transaction", reject)
+    with pytest.raises(ValueError):
+        pipeline.submit(register(provenance, "Nonce Rejected"))
+    assert pipeline.nonces._released == [nonce]
+    assert pipeline._slots._value == pipeline.max_in_flight
+    assert pipeline.in_flight() == 0
+
+    monkeypatch.undo()
+    pending = pipeline.submit(register(provenance, "Nonce After Rejection"))
+    assert pending.nonce == nonce
+    assert pending.result(timeout=10)["status"] == 1
+
+
+def test_send_accepted_before_a_transport_error_counts_as_sent(local_chain, pipeline, monkeypatch):
+    w3 = pipeline.w3
+    provenance = local_chain[3]
+    send_raw_transaction = w3.eth.send_raw_transaction
+
+    def lose_response(raw_transaction):
+        send_raw_transaction(raw_transaction)
+        raise ConnectionError("response lost")
+
+    monkeypatch.setattr(w3.eth, "send_raw_transaction", lose_response)
+    pending = pipeline.submit(register(provenance, "Nonce Lost Response"))
+    monkeypatch.undo()
+
+    receipt = pending.result(timeout=10)
+    assert receipt["status"] == 1
+    assert receipt["transactionHash"] == pending.tx_hash
+    assert not pipeline.nonces._reserved and not pipeline.nonces._released
@@ -0,0 +1,127 @@
+import pytest
+from web3 import Web3
+
+import preflight
+from preflight import EntityCache, EntityInfo, Preflight, PreflightError
+from dab_client import get_account
+from local_chain import send_local_tx
+from receipt_events import get_registered_diamond_id, get_processed_diamond_id
+from fake_rpc import FakeRpcEndpoint
+
+
+def address(private_key):
+    return get_account(private_key).address
+
+
+def test_entity_cache_seeds_from_logs_and_expires_negative_answers(local_chain, monkeypatch):
+    w3, private_keys, entity, _, _ = local_chain
+    miner, retailer, newcomer = private_keys[1], private_keys[4], private_keys[7]
+
+    monkeypatch.setattr(preflight, "ENTITY_DEPLOY_BLOCK", None)
+    with pytest.raises(ValueError):
+        EntityCache(w3, entity).seed()
+    assert EntityCache(w3, entity).sync() == 0
+
+    seeded = EntityCache(w3, entity)
+    assert seeded.seed(from_block=0) == 4
+    assert seeded.get(address(miner)).role == "Miner"
+    assert seeded.get(address(retailer).lower()).role == "Retailer"
+    assert seeded.lookups == 0
+
+    now = [1000.0]
+    monkeypatch.setattr(preflight.time, "monotonic", lambda: now[0])
+    lazy = EntityCache(w3, entity, negative_ttl=60)
+    for cache in (seeded, lazy):
+        assert not cache.get(address(newcomer)).is_registered
+        assert not cache.get(address(newcomer)).is_registered
+        assert cache.lookups == 1
+
+    send_local_tx(w3, newcomer, entity.functions.registerEntity("Late Retailer", "Canada", "Retailer", "d-LATE"))
+    # The seeded cache learns it from the EntityRegistered log
+    assert seeded.sync() == 1
+    assert seeded.get(address(newcomer)).role == "Retailer"
+    assert seeded.lookups == 1
+
+    # The lazy cache keeps the stale "not registered" until the TTL runs out
+    now[0] += 59
+    assert not lazy.get(address(newcomer)).is_registered
+    now[0] += 2
+    assert lazy.get(address(newcomer)).role == "Retailer"
+    assert lazy.lookups == 2
+    # Registrations are kept for good
+    now[0] += 3600
+    assert lazy.get(address(newcomer)).is_registered
+    assert lazy.lookups == 2
+
+
+@pytest.fixture
+def node(local_chain):
+    """(w3, entity, provenance) over HTTP, which reports reverts as ContractLogicError like a real node."""
+    w3, _, entity, provenance, _ = local_chain
+    endpoint = FakeRpcEndpoint(w3).start()
+    http_w3 = Web3(Web3.HTTPProvider(endpoint.url))
+    yield (http_w3, http_w3.eth.contract(address=entity.address, abi=entity.abi),
+           http_w3.eth.contract(address=provenance.address, abi=provenance.abi))
+    endpoint.stop()
+
+
+def test_preflight_accepts_what_the_contract_accepts(local_chain, node):
+    w3, private_keys, _, provenance, _ = local_chain
+    node_w3, node_entity, node_provenance = node
+    miner, manufacturer, certifier, retailer, consumer, collector = \
+        private_keys[1], private_keys[2], private_keys[3], private_keys[4], private_keys[5], private_keys[6]
+    cache = EntityCache(node_w3, node_entity)
+    cache.seed(from_block=0)
+    checker = Preflight(node_w3, node_provenance, cache, simulate=False)
+
+    def send(private_key, contract_function):
+        """Checks a write, sends it, compares the recorded history action and returns the receipt."""
+        action = checker.check(contract_function, address(private_key))
+        receipt = send_local_tx(w3, private_key, contract_function)
+        diamond_id = contract_function.args[0] if contract_function.fn_name != "registerRawDiamond" \
+            else get_registered_diamond_id(provenance, receipt)
+        if contract_function.fn_name == "processDiamond":
+            diamond_id = get_processed_diamond_id(provenance, receipt)
+        assert f" | {action} | " in provenance.functions.getDiamondHistory(diamond_id).call()[-1]
+        return receipt
+
+    def rejected(private_key, contract_function, message):
+        with pytest.raises(PreflightError, match=message):
+            checker.check(contract_function, address(private_key))
+
+    register = provenance.functions.registerRawDiamond("Preflight Mine", 1700000000, 200, "preflight test")
+    rejected(manufacturer, register, "Only miners")
+    raw_diamond_id = get_registered_diamond_id(provenance, send(miner, register))
+
+    rejected(miner, provenance.functions.transferDiamond(raw_diamond_id, address(consumer)), "Only retailers")
+    rejected(miner, provenance.functions.transferDiamond(raw_diamond_id, "0x" + "00" * 20), "zero address")
+    rejected(manufacturer, provenance.functions.processDiamond(raw_diamond_id, 100, "cut"), "don't own")
+    send(miner, provenance.functions.transferDiamond(raw_diamond_id, address(manufacturer)))
+    diamond_id = get_processed_diamond_id(provenance, send(
+        manufacturer, provenance.functions.processDiamond(raw_diamond_id, 100, "preflight cut")))
+    rejected(manufacturer, provenance.functions.certifyDiamond(diamond_id, "GIA-PRE"), "Only certifiers")
+    rejected(manufacturer, provenance.functions.certifyDiamond(10 ** 6, "GIA-PRE"), "does not exist")
+
+    send(manufacturer, provenance.functions.transferDiamond(diamond_id, address(certifier)))
+    send(certifier, provenance.functions.certifyDiamond(diamond_id, "GIA-PRE"))
+    send(certifier, provenance.functions.transferDiamond(diamond_id, address(retailer)))
+    send(retailer, provenance.functions.transferDiamond(diamond_id, address(consumer)))
+    rejected(consumer, provenance.functions.transferDiamond(diamond_id, address(retailer)), "back to registered")
+    send(consumer, provenance.functions.transferDiamond(diamond_id, address(collector)))
+    assert checker.rejected == 7
+
+    # A raw diamond that never reached a retailer cannot change hands between consumers
+    send(manufacturer, provenance.functions.transferDiamond(raw_diamond_id, address(retailer)))
+    with pytest.raises(PreflightError, match="consumer market"):
+        Preflight(node_w3, node_provenance, cache).transfer_type(raw_diamond_id, address(consumer), address(collector))
+
+    # Simulation catches a revert the local rules miss, here a wrong cached role
+    stale = EntityCache(node_w3, node_entity)
+    stale.entities[address(manufacturer)] = EntityInfo("Local Miner", None, True, "M-STALE", "Miner")
+    register = node_provenance.functions.registerRawDiamond("Preflight Mine", 1700000000, 200, "preflight test")
+    assert Preflight(node_w3, node_provenance, stale, simulate=False).check(register, address(manufacturer)) == "REGISTERED"
+    simulated = Preflight(node_w3, node_provenance, stale, simulate=True)
+    assert simulated.check(register, address(miner)) == "REGISTERED"
+    with pytest.raises(PreflightError, match="Simulation reverted"):
+        simulated.check(register, address(manufacturer))
+    assert simulated.rejected == 1
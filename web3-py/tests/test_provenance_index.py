@@ -0,0 +1,71 @@
+import pytest
+from web3 import Web3
+
+import provenance_index
+from provenance_index import ProvenanceIndex
+from fake_rpc import FakeRpcEndpoint
+from local_chain import send_local_tx
+
+RANGE_ERROR = (-32005, "query returned more than 10000 results")
+
+
+@pytest.fixture(scope="module")
+def diamonds(local_chain):
+    """Registers five raw diamonds, one per block. Returns the local chain."""
+    w3, private_keys, _, provenance, _ = local_chain
+    for number in range(5):
+        send_local_tx(w3, private_keys[1], provenance.functions.registerRawDiamond(
+            f"Index Mine #{number}", 1700000000 + number, 100 + number, "index test diamond"
+        ))
+    return local_chain
+
+
+@pytest.fixture
+def endpoint(diamonds, monkeypatch):
+    monkeypatch.setattr(provenance_index.time, "sleep", lambda seconds: None)
+    endpoint = FakeRpcEndpoint(diamonds[0]).start()
+    yield endpoint
+    endpoint.stop()
+
+
+def http_index(endpoint, provenance, path):
+    http_w3 = Web3(Web3.HTTPProvider(endpoint.url, exception_retry_configuration=None))
+    return ProvenanceIndex(str(path), http_w3, http_w3.eth.contract(address=provenance.address, abi=provenance.abi))
+
+
+def log_ranges(endpoint):
+    return [(int(params[0]["fromBlock"], 16), int(params[0]["toBlock"], 16))
+            for method, params in endpoint.calls if method == "eth_getLogs"]
+
+
+def test_sync_halves_the_chunk_only_on_range_errors(diamonds, endpoint, tmp_path):
+    w3, _, _, provenance, _ = diamonds
+    head = w3.eth.block_number
+    endpoint.fail_next("eth_getLogs", RANGE_ERROR, "unavailable")
+    index = http_index(endpoint, provenance, tmp_path / "index.db")
+    indexed = index.sync(to_block=head, chunk_size=8)
+
+    ranges = log_ranges(endpoint)
+    # The range error halves the chunk; the transient error is retried at the same size
+    assert ranges[:3] == [(0, 7), (0, 3), (0, 3)]
+    assert all(end - start + 1 == 4 for start, end in ranges[2:-1])
+    assert ranges[-1][1] == head
+    assert index.get_cursor()[0] == head
+
+    reference = ProvenanceIndex(str(tmp_path / "reference.db"), w3, provenance)
+    assert indexed == reference.sync(to_block=head)
+    assert [tuple(row) for row in index.diamonds_by_origin("Index Mine")] == \
+        [tuple(row) for row in reference.diamonds_by_origin("Index Mine")]
+    assert len(index.diamonds_by_origin("Index Mine")) == 5
+
+
+def test_sync_raises_persistent_transient_errors_without_shrinking(diamonds, endpoint, tmp_path):
+    w3, _, _, provenance, _ = diamonds
+    endpoint.fail_next("eth_getLogs", *["unavailable"] * provenance_index.INDEX_MAX_RETRIES)
+    index = http_index(endpoint, provenance, tmp_path / "index.db")
+    with pytest.raises(Exception) as excinfo:
+        index.sync(to_block=w3.eth.block_number, chunk_size=8)
+
+    assert not provenance_index.is_log_range_error(excinfo.value)
+    assert log_ranges(endpoint) == [(0, 7)] * provenance_index.INDEX_MAX_RETRIES
+    assert index.get_cursor() is None
@@ -0,0 +1,33 @@
+import pytest
+
+from receipt_events import get_registered_diamond_id, get_processed_diamond_id
+from dab_client import get_account
+from local_chain import send_local_tx
+
+
+def test_ids_are_read_from_the_receipt_events(local_chain):
+    w3, private_keys, _, provenance, marketplace = local_chain
+    miner_key, manufacturer_key = private_keys[1], private_keys[2]
+
+    registered = send_local_tx(w3, miner_key, provenance.functions.registerRawDiamond(
+        "Receipt Mine", 1700000000, 150, "receipt test diamond"))
+    raw_diamond_id = get_registered_diamond_id(provenance, registered)
+    assert raw_diamond_id == provenance.functions.totalSupply().call()
+
+    transferred = send_local_tx(w3, miner_key, provenance.functions.transferDiamond(
+        raw_diamond_id, get_account(manufacturer_key).address))
+    with pytest.raises(ValueError, match="No DiamondRegistered event"):
+        get_registered_diamond_id(provenance, transferred)
+
+    processed = send_local_tx(w3, manufacturer_key, provenance.functions.processDiamond(
+        raw_diamond_id, 100, "receipt test cut"))
+    new_diamond_id = get_processed_diamond_id(provenance, processed)
+    assert new_diamond_id == provenance.functions.totalSupply().call() != raw_diamond_id
+    assert get_processed_diamond_id(provenance, processed, raw_diamond_id) == new_diamond_id
+    with pytest.raises(ValueError, match="No DiamondProcessed event"):
+        get_processed_diamond_id(provenance, processed, raw_diamond_id + 1000)
+
+    # Logs from another address with the same event signature are ignored
+    lookalike = w3.eth.contract(address=marketplace.address, abi=provenance.abi)
+    with pytest.raises(ValueError):
+        get_registered_diamond_id(lookalike, registered)
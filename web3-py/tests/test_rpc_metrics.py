@@ -0,0 +1,130 @@
+import json
+import asyncio
+import urllib.error
+import urllib.request
+
+import pytest
+from web3 import Web3, AsyncWeb3
+
+from rpc_metrics import RpcMetrics, instrument, start_metrics_server, LATENCY_BUCKETS
+from fake_rpc import FakeRpcEndpoint
+
+
+@pytest.fixture
+def endpoint(local_chain):
+    endpoint = FakeRpcEndpoint(local_chain[0]).start()
+    yield endpoint
+    endpoint.stop()
+
+
+def method_stats(metrics, method, function=""):
+    return metrics.stats[(method, function)].to_dict()
+
+
+def test_middleware_counts_retried_attempts_and_decodes_functions(local_chain, endpoint):
+    provenance = local_chain[3]
+    w3 = Web3(Web3.HTTPProvider(endpoint.url))
+    metrics = instrument(w3, RpcMetrics())
+    assert w3.provider.exception_retry_configuration is None
+
+    endpoint.fail_next("eth_blockNumber", "unavailable", "unavailable")
+    w3.eth.block_number
+    w3.eth.contract(address=provenance.address, abi=provenance.abi).functions.totalSupply().call()
+
+    # One request, sent three times
+    assert [method for method, _ in endpoint.calls].count("eth_blockNumber") == 3
+    block_number = method_stats(metrics, "eth_blockNumber")
+    assert (block_number["calls"], block_number["errors"], block_number["retries"]) == (1, 0, 2)
+    assert block_number["latency_seconds"]["count"] == 1
+    assert method_stats(metrics, "eth_call", "totalSupply")["calls"] == 1
+    assert instrument(w3) is metrics
+
+
+def test_async_middleware_takes_over_retries(endpoint):
+    async def run():
+        w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(endpoint.url))
+        metrics = instrument(w3, RpcMetrics())
+        endpoint.fail_next("eth_blockNumber", "unavailable")
+        await w3.eth.block_number
+        endpoint.fail_next("eth_getBalance", *["unavailable"] * 5)
+        with pytest.raises(Exception):
+            await w3.eth.get_balance(Web3.to_checksum_address("0x" + "11" * 20))
+        await w3.provider.disconnect()
+        return w3, metrics
+
+    w3, metrics = asyncio.run(run())
+    assert w3.provider.exception_retry_configuration is None
+    block_number = method_stats(metrics, "eth_blockNumber")
+    assert (block_number["calls"], block_number["errors"], block_number["retries"]) == (1, 0, 1)
+    balance = method_stats(metrics, "eth_getBalance")
+    assert (balance["calls"], balance["errors"], balance["retries"]) == (1, 1, 4)
+
+
+def test_batch_requests_are_counted_per_method_and_timed_per_batch(local_chain, endpoint):
+    provenance = local_chain[3]
+    w3 = Web3(Web3.HTTPProvider(endpoint.url))
+    metrics = instrument(w3, RpcMetrics())
+    contract = w3.eth.contract(address=provenance.address, abi=provenance.abi)
+
+    with w3.batch_requests() as batch:
+        batch.add(w3.eth.get_block_number())
+        batch.add(contract.functions.totalSupply())
+        batch.add(contract.functions.totalSupply())
+        batch.execute()
+
+    assert method_stats(metrics, "eth_blockNumber")["calls"] == 1
+    total_supply = method_stats(metrics, "eth_call", "totalSupply")
+    assert total_supply["calls"] == 2
+    # Requests in a batch are not timed on their own
+    assert total_supply["latency_seconds"]["count"] == 0
+    assert total_supply["request_bytes"] > 0 and total_supply["response_bytes"] > 0
+    batch_stats = method_stats(metrics, "rpc_batch")
+    assert (batch_stats["calls"], batch_stats["errors"], batch_stats["latency_seconds"]["count"]) == (1, 0, 1)
+    assert metrics.report()["total_calls"] == 3
+
+    endpoint.error_rate = 1.0
+    with pytest.raises(Exception):
+        with w3.batch_requests() as batch:
+            batch.add(w3.eth.get_block_number())
+            batch.execute()
+    assert method_stats(metrics, "rpc_batch")["errors"] == 1
+    assert metrics.report()["total_calls"] == 3
+
+
+def test_prometheus_exposition():
+    metrics = RpcMetrics()
+    metrics.record("eth_call", "totalSupply", 0.02, request_bytes=100, response_bytes=60)
+    metrics.record("eth_call", "totalSupply", 3.0, request_bytes=100, error=True, retries=2)
+    lines = metrics.prometheus_text().splitlines()
+
+    labels = 'method="eth_call",function="totalSupply"'
+    assert "# TYPE dab_rpc_requests_total counter" in lines
+    assert f"dab_rpc_requests_total{{{labels}}} 2" in lines
+    assert f"dab_rpc_errors_total{{{labels}}} 1" in lines
+    assert f"dab_rpc_retries_total{{{labels}}} 2" in lines
+    assert f"dab_rpc_request_bytes_total{{{labels}}} 200" in lines
+    assert f"dab_rpc_response_bytes_total{{{labels}}} 60" in lines
+    assert "# TYPE dab_rpc_latency_seconds histogram" in lines
+    # Buckets are cumulative
+    assert f'dab_rpc_latency_seconds_bucket{{{labels},le="0.01"}} 0' in lines
+    assert f'dab_rpc_latency_seconds_bucket{{{labels},le="0.025"}} 1' in lines
+    assert f'dab_rpc_latency_seconds_bucket{{{labels},le="2.5"}} 1' in lines
+    assert f'dab_rpc_latency_seconds_bucket{{{labels},le="5"}} 2' in lines
+    assert f'dab_rpc_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"dab_rpc_latency_seconds_count{{{labels}}} 2" in lines
+    assert len([line for line in lines if line.startswith("dab_rpc_latency_seconds_bucket")]) == \
+        len(LATENCY_BUCKETS) + 1
+
+    server = start_metrics_server(metrics, port=0)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(base_url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode() == metrics.prometheus_text()
+        with urllib.request.urlopen(base_url + "/metrics.json") as response:
+            assert json.load(response)["total_calls"] == 2
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(base_url + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
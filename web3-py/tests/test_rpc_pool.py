@@ -0,0 +1,114 @@
+import time
+
+import pytest
+from web3 import Web3
+from eth_account import Account
+
+import rpc_pool
+from rpc_pool import RpcPoolProvider
+from fake_rpc import FakeRpcEndpoint
+from dab_client import get_account
+
+
+@pytest.fixture
+def endpoints(local_chain):
+    """Two fake endpoints in front of the local chain, stopped after the test."""
+    started = [FakeRpcEndpoint(local_chain[0], name).start() for name in ("first", "second")]
+    yield started
+    for endpoint in started:
+        endpoint.stop()
+
+
+def methods(endpoint):
+    return [method for method, _ in endpoint.calls]
+
+
+def test_slow_read_is_hedged_on_the_next_endpoint(endpoints):
+    first, second = endpoints
+    first.slow_rate, first.slow_latency = 1.0, 0.5
+    pool = RpcPoolProvider([first.url, second.url], hedge_after=0.05)
+
+    start = time.monotonic()
+    assert Web3(pool).eth.block_number >= 0
+    assert time.monotonic() - start < first.slow_latency
+    assert pool.hedged_requests == 1
+    assert pool.endpoints[1].hedges_won == 1
+    assert methods(first) == methods(second) == ["eth_blockNumber"]
+
+
+def test_failed_read_fails_over_and_cools_down(endpoints, monkeypatch):
+    monkeypatch.setattr(rpc_pool, "RPC_POOL_COOLDOWN", 0.2)
+    first, second = endpoints
+    first.fail_next("eth_blockNumber", "unavailable")
+    pool = RpcPoolProvider([first.url, second.url], hedge_after=None)
+    w3 = Web3(pool)
+
+    assert w3.eth.block_number >= 0
+    assert pool.endpoints[0].errors == 1
+    assert not pool.endpoints[0].healthy()
+    # While cooling down the failed endpoint is tried last
+    w3.eth.block_number
+    assert methods(first) == ["eth_blockNumber"]
+    assert methods(second) == ["eth_blockNumber", "eth_blockNumber"]
+
+    # A second consecutive failure doubles the cooldown
+    first.fail_next("eth_blockNumber", "unavailable")
+    time.sleep(0.2)
+    assert pool.endpoints[0].healthy()
+    with pytest.raises(Exception):
+        pool.endpoints[0].request("eth_blockNumber", [])
+    assert pool.endpoints[0].failures == 2
+    assert pool.endpoints[0].cooldown_until - time.monotonic() > 0.2
+
+    # A success resets the score
+    time.sleep(0.4)
+    pool.endpoints[0].request("eth_blockNumber", [])
+    assert pool.endpoints[0].failures == 0 and pool.endpoints[0].healthy()
+
+
+def signed_registration(local_chain, name):
+    w3, private_keys, _, provenance, _ = local_chain
+    miner = get_account(private_keys[1]).address
+    transaction = provenance.functions.registerRawDiamond(
+        name, 1700000000, 120, "pool test diamond"
+    ).build_transaction({
+        'from': miner, 'nonce': w3.eth.get_transaction_count(miner),
+        'gasPrice': w3.eth.gas_price, 'chainId': w3.eth.chain_id
+    })
+    return Account.sign_transaction(transaction, private_keys[1])
+
+
+def test_writes_and_nonce_lookups_stick_to_one_endpoint(local_chain, endpoints):
+    first, second = endpoints
+    pool = RpcPoolProvider([first.url, second.url], hedge_after=None)
+    w3 = Web3(pool)
+    signed_tx = signed_registration(local_chain, "Pool Sticky")
+
+    # Reads now prefer the second endpoint, but the write endpoint stays put
+    w3.eth.get_transaction_count(get_account(local_chain[1][1]).address)
+    pool.endpoints[0].latency, pool.endpoints[1].latency = 1.0, 0.001
+    assert w3.eth.send_raw_transaction(signed_tx.raw_transaction) == signed_tx.hash
+    assert w3.eth.get_transaction_receipt(signed_tx.hash)["status"] == 1
+    w3.eth.block_number
+
+    assert pool.stats()["write_endpoint"] == first.url
+    assert methods(first) == ["eth_getTransactionCount", "eth_sendRawTransaction", "eth_getTransactionReceipt"]
+    assert methods(second) == ["eth_blockNumber"]
+
+
+def test_lost_send_response_is_not_reported_as_a_failure(local_chain, endpoints):
+    w3 = local_chain[0]
+    provenance = local_chain[3]
+    first, second = endpoints
+    # The write endpoint applies the transaction, then the response is lost
+    first.lost_response_rate = 1.0
+    pool = RpcPoolProvider([first.url, second.url], hedge_after=None)
+    signed_tx = signed_registration(local_chain, "Pool Lost Response")
+    supply_before = provenance.functions.totalSupply().call()
+
+    assert Web3(pool).eth.send_raw_transaction(signed_tx.raw_transaction) == signed_tx.hash
+    # The resend on the second endpoint is rejected, and the pool finds the first copy
+    assert methods(second) == ["eth_sendRawTransaction", "eth_getTransactionByHash"]
+    assert provenance.functions.totalSupply().call() == supply_before + 1
+    assert w3.eth.get_transaction_receipt(signed_tx.hash)["status"] == 1
+    assert pool.stats()["write_endpoint"] is None
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from snapshot import take_snapshot, write_snapshot, load_snapshot, diff_snapshots, SNAPSHOT_COLUMNS
+from local_chain import send_local_tx
+
+
+def register(w3, key, provenance, count, name):
+    for number in range(count):
+        send_local_tx(w3, key, provenance.functions.registerRawDiamond(
+            f"{name} #{number}", 1700000000 + number, 100 + number, "snapshot test diamond"
+        ))
+    return provenance.functions.totalSupply().call()
+
+
+@pytest.fixture(scope="module")
+def base(local_chain):
+    """A snapshot of three raw diamonds, followed by a transfer and a new diamond. Returns (base, changed ID)."""
+    w3, private_keys, _, provenance, _ = local_chain
+    total_supply = register(w3, private_keys[1], provenance, 3, "Snapshot Mine")
+    base = take_snapshot(w3, provenance)
+    send_local_tx(w3, private_keys[1], provenance.functions.transferDiamond(total_supply, w3.eth.accounts[2]))
+    register(w3, private_keys[1], provenance, 1, "Snapshot Later")
+    return base, total_supply
+
+
+def test_incremental_snapshot_rereads_only_changed_diamonds(local_chain, base):
+    w3, _, _, provenance, _ = local_chain
+    base, transferred_id = base
+    snapshot = take_snapshot(w3, provenance, base=base)
+    full = take_snapshot(w3, provenance)
+
+    assert snapshot["diamonds_read"] == 2
+    assert full["diamonds_read"] == full["total_supply"]
+    assert snapshot["diamonds"] == full["diamonds"]
+
+    diff = diff_snapshots(base, snapshot)
+    owner_index = SNAPSHOT_COLUMNS.index("owner")
+    assert diff["from_block"] == base["block_number"] and diff["to_block"] == snapshot["block_number"]
+    assert diff["added"] == [snapshot["total_supply"]]
+    assert diff["removed"] == []
+    assert diff["ownership"] == [{
+        "diamond_id": transferred_id,
+        "from": base["diamonds"][-1][owner_index],
+        "to": w3.eth.accounts[2],
+    }]
+    assert diff["certification"] == []
+
+
+def test_base_from_a_reorged_block_is_not_reused(local_chain, base):
+    w3, _, _, provenance, _ = local_chain
+    base, _ = base
+    owner_index = SNAPSHOT_COLUMNS.index("owner")
+    orphaned = dict(base, block_hash="0x" + "00" * 32, diamonds=[list(row) for row in base["diamonds"]])
+    orphaned["diamonds"][0][owner_index] = w3.eth.accounts[5]
+
+    snapshot = take_snapshot(w3, provenance, base=orphaned)
+    assert snapshot["diamonds_read"] == snapshot["total_supply"]
+    assert snapshot["diamonds"] == take_snapshot(w3, provenance)["diamonds"]
+
+
+def test_written_snapshots_are_byte_identical(local_chain, base, tmp_path):
+    w3, _, _, provenance, _ = local_chain
+    base, _ = base
+    first = write_snapshot(take_snapshot(w3, provenance, block_number=base["block_number"]), tmp_path / "first")
+    second = write_snapshot(base, tmp_path / "second")
+
+    assert os.path.basename(first) == os.path.basename(second)
+    with open(first, "rb") as f, open(second, "rb") as g:
+        assert f.read() == g.read()
+    loaded = load_snapshot("latest", tmp_path / "first")
+    assert loaded == {key: value for key, value in base.items() if key != "diamonds_read"}
+
+    # LATEST stays on the newest block when an older one is written after it
+    newest = write_snapshot(take_snapshot(w3, provenance), tmp_path / "first")
+    write_snapshot(base, tmp_path / "first")
+    assert load_snapshot("latest", tmp_path / "first") == load_snapshot(newest)
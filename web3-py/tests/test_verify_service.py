@@ -0,0 +1,105 @@
+import threading
+
+from verify_service import DiamondVerifier, VerificationCache
+from dab_client import get_account
+from local_chain import send_local_tx
+from receipt_events import get_registered_diamond_id
+
+
+def register(local_chain, origin):
+    w3, private_keys, _, provenance, _ = local_chain
+    return get_registered_diamond_id(provenance, send_local_tx(
+        w3, private_keys[1], provenance.functions.registerRawDiamond(origin, 1700000000, 100, "verify test")))
+
+
+def test_cache_drops_results_read_before_an_invalidation():
+    cache = VerificationCache(max_size=2)
+    generation = cache.generation
+    cache.invalidate([1])
+    # Read before the invalidation of 1: only the untouched diamond is stored
+    cache.put(1, "stale", generation)
+    cache.put(2, "fresh", generation)
+    assert cache.get(1) is None and cache.get(2) == "fresh"
+    cache.put(1, "current", cache.generation)
+    assert cache.get(1) == "current"
+
+    generation = cache.generation
+    cache.clear()
+    assert len(cache) == 0
+    cache.put(3, "stale", generation)
+    assert cache.get(3) is None
+    for diamond_id in (3, 4, 5):
+        cache.put(diamond_id, diamond_id, cache.generation)
+    assert len(cache) == 2 and cache.get(3) is None
+
+    cache.ttl = 0
+    assert cache.get(5) is None
+
+
+def test_concurrent_lookups_share_one_read(local_chain):
+    w3, provenance, marketplace = local_chain[0], local_chain[3], local_chain[4]
+    diamond_id = register(local_chain, "Verify Coalesced")
+    verifier = DiamondVerifier(w3, provenance, marketplace)
+    reading = threading.Event()
+    release = threading.Event()
+    read = verifier._read
+
+    def slow_read(diamond_ids):
+        reading.set()
+        release.wait(5)
+        return read(diamond_ids)
+
+    verifier._read = slow_read
+    results = []
+    first = threading.Thread(target=lambda: results.append(verifier.verify(diamond_id)))
+    first.start()
+    assert reading.wait(5)
+    second = threading.Thread(target=lambda: results.append(verifier.verify(diamond_id)))
+    second.start()
+    # Wait until the second lookup is parked on the first one's read
+    while verifier.stats["coalesced"] == 0:
+        second.join(0.01)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert results[0] is results[1] and results[0]["origin"] == "Verify Coalesced"
+    assert verifier.stats == {"hits": 0, "misses": 1, "coalesced": 1, "invalidated": 0}
+    assert verifier.verify(diamond_id) is results[0]
+    assert verifier.stats["hits"] == 1
+
+
+def test_refresh_invalidates_touched_diamonds_and_clears_on_a_reorg(local_chain):
+    w3, private_keys, _, provenance, marketplace = local_chain
+    miner, manufacturer = get_account(private_keys[1]).address, get_account(private_keys[2]).address
+    tester = w3.provider.ethereum_tester
+    moved, untouched = register(local_chain, "Verify Moved"), register(local_chain, "Verify Untouched")
+    verifier = DiamondVerifier(w3, provenance, marketplace)
+    assert verifier.refresh() == 0
+    verifier.verify_many([moved, untouched])
+
+    send_local_tx(w3, private_keys[1], provenance.functions.transferDiamond(moved, manufacturer))
+    assert verifier.refresh() == 1
+    assert verifier.verify(moved)["owner"] == manufacturer
+    assert verifier.stats["hits"] == 0 and verifier.stats["misses"] == 3
+
+    # The transfer below is replaced by another block at the same height
+    snapshot_id = tester.take_snapshot()
+    send_local_tx(w3, private_keys[1], provenance.functions.transferDiamond(untouched, manufacturer))
+    assert verifier.refresh() == 1
+    assert verifier.verify(untouched)["owner"] == manufacturer
+    orphaned_block = verifier.block_number
+    tester.revert_to_snapshot(snapshot_id)
+    register(local_chain, "Verify Replacement")
+    assert w3.eth.block_number == orphaned_block
+
+    assert verifier.refresh() == 0
+    assert len(verifier.cache) == 0
+    assert verifier.block_hash == w3.eth.get_block(orphaned_block)["hash"]
+    assert verifier.verify(untouched)["owner"] == miner
+    assert verifier.verify(moved)["owner"] == manufacturer
+
+    # A reorg to a shorter chain also starts over
+    tester.revert_to_snapshot(snapshot_id)
+    assert verifier.refresh() == 0
+    assert len(verifier.cache) == 0 and verifier.block_number == w3.eth.block_number
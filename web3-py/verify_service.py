@@ -0,0 +1,398 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from eth_utils import event_abi_to_log_topic
+from dotenv import load_dotenv
+from dab_client import (
+    MARKETPLACE_CONTRACT_ADDRESS, RPC_METRICS, connect_to_web3, get_marketplace_contract, get_provenance_contract
+)
+from batch_reader import BatchReader, DiamondRecord, DIAMOND_VIEW_FUNCTIONS, READ_MODE
+from provenance_index import INDEX_BLOCK_CHUNK, PROVENANCE_INVALIDATING_EVENTS
+from rpc_metrics import RPC_METRICS_HOST, get_rpc_metrics, start_metrics_server
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+VERIFY_HOST = os.getenv("VERIFY_HOST", "127.0.0.1")
+VERIFY_PORT = int(os.getenv("VERIFY_PORT", "8080"))
+VERIFY_CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", "10000"))
+# Upper bound on staleness if an invalidating event is ever missed
+VERIFY_CACHE_TTL = float(os.getenv("VERIFY_CACHE_TTL", "300"))
+VERIFY_POLL_INTERVAL = float(os.getenv("VERIFY_POLL_INTERVAL", "4"))
+VERIFY_MAX_BULK = int(os.getenv("VERIFY_MAX_BULK", "500"))
+
+# Marketplace events that change a diamond's verification answer, with the topic index of its diamond ID
+MARKETPLACE_INVALIDATING_EVENTS = {"DiamondReportedStolen": 1, "StolenReportResolved": 1}
+
+
+class VerificationCache:
+    """Bounded LRU of verification results with a TTL.
+
+    Every invalidation bumps a generation counter; a result read before the
+    latest invalidation of its diamond (or the latest clear()) is not stored,
+    so a slow read cannot put back data an event has already made stale.
+    Invalidation markers are dropped after the TTL, by when any read that
+    started before them has long finished.
+    """
+
+    def __init__(self, max_size=VERIFY_CACHE_SIZE, ttl=VERIFY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        # diamond ID -> (generation, monotonic time) of its latest invalidation, oldest first
+        self._invalidated_at = OrderedDict()
+        self._cleared_at = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, diamond_id):
+        with self._lock:
+            entry = self._entries.get(diamond_id)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[diamond_id]
+                return None
+            self._entries.move_to_end(diamond_id)
+            return value
+
+    def put(self, diamond_id, value, generation):
+        """Stores a result read at `generation`, unless the diamond was invalidated since."""
+        with self._lock:
+            if generation < self._cleared_at:
+                return
+            invalidated = self._invalidated_at.get(diamond_id)
+            if invalidated is not None and invalidated[0] > generation:
+                return
+            self._entries[diamond_id] = (value, time.monotonic())
+            self._entries.move_to_end(diamond_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, diamond_ids):
+        with self._lock:
+            self.generation += 1
+            now = time.monotonic()
+            for diamond_id in diamond_ids:
+                self._entries.pop(diamond_id, None)
+                self._invalidated_at[diamond_id] = (self.generation, now)
+                self._invalidated_at.move_to_end(diamond_id)
+            self._prune_invalidated(now)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._cleared_at = self.generation
+            self._entries.clear()
+            self._prune_invalidated(time.monotonic())
+
+    def _prune_invalidated(self, now):
+        while self._invalidated_at:
+            diamond_id, (_, invalidated_at) = next(iter(self._invalidated_at.items()))
+            if now - invalidated_at <= self.ttl:
+                break
+            del self._invalidated_at[diamond_id]
+
+
+class DiamondVerifier:
+    """Answers "is this diamond authentic" (owner, certification, stolen flag, lineage) from a cache.
+
+    Misses are read in batches through BatchReader, including any ancestors
+    needed for the lineage. Concurrent lookups of the same diamond share one
+    read, and refresh() drops cached answers whose diamond appears in new
+    Provenance or Marketplace events.
+    """
+
+    def __init__(self, w3, provenance, marketplace=None, cache=None, read_mode=READ_MODE):
+        self.w3 = w3
+        self.provenance = provenance
+        self.marketplace = marketplace
+        self.cache = cache or VerificationCache()
+        self.read_mode = read_mode
+        self.block_number = None
+        self.block_hash = None
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "invalidated": 0}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._log_filters = [(provenance, PROVENANCE_INVALIDATING_EVENTS)]
+        if marketplace is not None:
+            self._log_filters.append((marketplace, MARKETPLACE_INVALIDATING_EVENTS))
+        self._topic_positions = {
+            event_abi_to_log_topic(contract.events[event_name].abi): position
+            for contract, events in self._log_filters
+            for event_name, position in events.items()
+        }
+
+    def verify(self, diamond_id):
+        return self.verify_many([diamond_id])[0]
+
+    def verify_many(self, diamond_ids):
+        """Returns one verification result per diamond ID, in order."""
+        results = {}
+        to_read = {}
+        to_wait = {}
+        with self._lock:
+            for diamond_id in diamond_ids:
+                if diamond_id in results or diamond_id in to_read or diamond_id in to_wait:
+                    continue
+                cached = self.cache.get(diamond_id)
+                if cached is not None:
+                    results[diamond_id] = cached
+                    self.stats["hits"] += 1
+                elif diamond_id in self._in_flight:
+                    # Someone else is already reading this diamond; wait for their answer
+                    to_wait[diamond_id] = self._in_flight[diamond_id]
+                    self.stats["coalesced"] += 1
+                else:
+                    to_read[diamond_id] = self._in_flight[diamond_id] = Future()
+                    self.stats["misses"] += 1
+
+        if to_read:
+            try:
+                read = self._read(list(to_read))
+            except Exception as e:
+                for future in to_read.values():
+                    future.set_exception(e)
+                raise
+            finally:
+                with self._lock:
+                    for diamond_id in to_read:
+                        self._in_flight.pop(diamond_id, None)
+            for diamond_id, future in to_read.items():
+                results[diamond_id] = read[diamond_id]
+                future.set_result(read[diamond_id])
+        for diamond_id, future in to_wait.items():
+            results[diamond_id] = future.result()
+        return [results[diamond_id] for diamond_id in diamond_ids]
+
+    def _read(self, diamond_ids):
+        """Reads diamonds (and their uncached ancestors) at one block and caches the results."""
+        generation = self.cache.generation
+        block_number = self.w3.eth.block_number
+        reader = BatchReader(self.w3, mode=self.read_mode, block_identifier=block_number)
+        functions = DIAMOND_VIEW_FUNCTIONS + (("isDiamondStolen",) if self.marketplace is not None else ())
+
+        rows = {}
+        results = {}
+        pending = list(diamond_ids)
+        while pending:
+            calls = [
+                (self.marketplace if fn_name == "isDiamondStolen" else self.provenance, fn_name, (diamond_id,))
+                for diamond_id in pending
+                for fn_name in functions
+            ]
+            values = reader.call_many(calls, calls_per_chunk=reader.chunk_size * len(functions))
+            parents = set()
+            for index, diamond_id in enumerate(pending):
+                row = values[index * len(functions):(index + 1) * len(functions)]
+                rows[diamond_id] = row
+                raw_diamond_id = row[1][2] if row[1] is not None else 0
+                if raw_diamond_id and raw_diamond_id not in rows and raw_diamond_id not in results:
+                    cached = self.cache.get(raw_diamond_id)
+                    if cached is None:
+                        parents.add(raw_diamond_id)
+                    else:
+                        results[raw_diamond_id] = cached
+            pending = sorted(parents)
+        # Remember a fallback to sequential reads (e.g. provider without batching)
+        self.read_mode = reader.mode
+
+        def result_for(diamond_id):
+            if diamond_id not in results:
+                results[diamond_id] = self._build_result(diamond_id, rows[diamond_id], block_number, result_for)
+            return results[diamond_id]
+
+        for diamond_id in rows:
+            self.cache.put(diamond_id, result_for(diamond_id), generation)
+        return results
+
+    def _build_result(self, diamond_id, row, block_number, result_for):
+        basic_info, cert_info, owner = row[:3]
+        if basic_info is None or cert_info is None or owner is None:
+            return {"diamond_id": diamond_id, "exists": False, "block_number": block_number}
+        record = DiamondRecord(diamond_id, *basic_info, *cert_info, owner)
+        ancestors = []
+        if record.raw_diamond_id:
+            parent = result_for(record.raw_diamond_id)
+            ancestors = [record.raw_diamond_id] + parent.get("lineage", {}).get("ancestors", [])
+        return {
+            "diamond_id": diamond_id,
+            "exists": True,
+            "owner": record.owner,
+            "origin": record.origin,
+            "extraction_date": record.extraction_date,
+            "weight": record.weight,
+            "characteristics": record.characteristics,
+            "is_certified": record.is_certified,
+            "certification_id": record.certification_id,
+            "is_stolen": row[3] if len(row) > 3 else None,
+            "lineage": {
+                "raw_diamond_id": record.raw_diamond_id,
+                "root_diamond_id": ancestors[-1] if ancestors else diamond_id,
+                "ancestors": ancestors,
+            },
+            "block_number": block_number,
+        }
+
+    def refresh(self):
+        """Drops cached answers for diamonds touched by events since the last refresh.
+
+        The whole cache is dropped if the last block seen was reorged away.
+        Returns the number of invalidating events seen.
+        """
+        latest_block = self.w3.eth.block_number
+        if (self.block_number is None or latest_block - self.block_number > INDEX_BLOCK_CHUNK
+                or self._reorged(latest_block)):
+            # First run, too far behind to replay the gap, or the last block seen was
+            # replaced by a reorg (its logs may be gone): start over
+            self.cache.clear()
+            self._advance(latest_block)
+            return 0
+        if latest_block == self.block_number:
+            return 0
+
+        diamond_ids = set()
+        for contract, events in self._log_filters:
+            logs = self.w3.eth.get_logs({
+                'address': contract.address,
+                'fromBlock': self.block_number + 1,
+                'toBlock': latest_block,
+                'topics': [["0x" + event_abi_to_log_topic(contract.events[event_name].abi).hex()
+                            for event_name in events]]
+            })
+            for log in logs:
+                position = self._topic_positions[bytes(log["topics"][0])]
+                diamond_ids.add(int.from_bytes(log["topics"][position], "big"))
+        if diamond_ids:
+            # Only the touched diamonds: a descendant embeds its ancestors' IDs, which never change
+            self.cache.invalidate(diamond_ids)
+        self.stats["invalidated"] += len(diamond_ids)
+        self._advance(latest_block)
+        return len(diamond_ids)
+
+    def _reorged(self, latest_block):
+        """True if the last block refresh() saw is no longer on the canonical chain."""
+        if latest_block < self.block_number:
+            return True
+        return self.w3.eth.get_block(self.block_number)["hash"] != self.block_hash
+
+    def _advance(self, block_number):
+        self.block_number = block_number
+        self.block_hash = self.w3.eth.get_block(block_number)["hash"]
+
+    def start_refresher(self, interval=VERIFY_POLL_INTERVAL):
+        """Runs refresh() every `interval` seconds on a daemon thread."""
+        self.refresh()
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Cache refresh error: {e}")
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+
+class VerifyRequestHandler(BaseHTTPRequestHandler):
+    """GET /verify/<id>, POST /verify/bulk {"diamond_ids": [...]}, GET /health."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    verifier = None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {
+                "block_number": self.verifier.block_number,
+                "cache_size": len(self.verifier.cache),
+                **self.verifier.stats
+            })
+        elif self.path.startswith("/verify/"):
+            try:
+                diamond_id = int(self.path[len("/verify/"):])
+            except ValueError:
+                self._send_json(400, {"error": "diamond ID must be an integer"})
+                return
+            self._verify([diamond_id], bulk=False)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/verify/bulk":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            diamond_ids = [int(diamond_id) for diamond_id in body["diamond_ids"]]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": 'expected {"diamond_ids": [...]}'})
+            return
+        if len(diamond_ids) > VERIFY_MAX_BULK:
+            self._send_json(400, {"error": f"at most {VERIFY_MAX_BULK} diamond IDs per request"})
+            return
+        self._verify(diamond_ids, bulk=True)
+
+    def _verify(self, diamond_ids, bulk):
+        try:
+            results = self.verifier.verify_many(diamond_ids)
+        except Exception as e:
+            self._send_json(502, {"error": f"chain read failed: {e}"})
+            return
+        if bulk:
+            self._send_json(200, {"results": results})
+        else:
+            self._send_json(200 if results[0]["exists"] else 404, results[0])
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(verifier, host=VERIFY_HOST, port=VERIFY_PORT):
+    """Creates (but does not start) the verification HTTP server. Port 0 picks a free port."""
+    handler = type("BoundVerifyRequestHandler", (VerifyRequestHandler,), {"verifier": verifier})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    """Starts the verification service."""
+    try:
+        w3 = connect_to_web3()
+        marketplace = get_marketplace_contract(w3) if MARKETPLACE_CONTRACT_ADDRESS else None
+        verifier = DiamondVerifier(w3, get_provenance_contract(w3), marketplace)
+        verifier.start_refresher()
+        if RPC_METRICS:
+            metrics_server = start_metrics_server(get_rpc_metrics(w3))
+            print(f"RPC metrics at http://{RPC_METRICS_HOST}:{metrics_server.server_address[1]}/metrics")
+        server = create_server(verifier)
+        print(f"Verification service listening on http://{VERIFY_HOST}:{server.server_address[1]}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+if __name__ == "__main__":
+    main()